@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,13 +49,16 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 MIDDLEWARE = [
+    'restaurant.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'restaurant.routers.ReplicaPinningMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'restaurant.middleware.SQLInstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'delights.urls'
@@ -85,7 +89,90 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # Transactions take the write lock when they begin instead of at their first write, so
+        # concurrent sales queue on it rather than failing with "database is locked" (see inventory.py)
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+    },
+    # Read replica for analytics and exports (restaurant/routers.py), used when REPLICA_DB_NAME is set.
+    # Locally a second SQLite file stands in for it; `manage.py sync_replica` copies the primary into it.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('REPLICA_DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+DATABASE_ROUTERS = ['restaurant.routers.ReadReplicaRouter']
+READ_REPLICA_ALIAS = 'replica' if os.environ.get('REPLICA_DB_NAME') else None
+# After a write, the same browser reads from the primary for this long; keep it above the replica's lag
+REPLICA_PIN_SECONDS = 15
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# The data versions must be shared by all worker processes, so they live in files that every
+# worker on this host reads ('versions'). Across several hosts, point 'versions' at Redis or
+# Memcached instead; the other aliases only hold copies keyed by those versions.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'default',
+    },
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('DATA_VERSION_DIR', BASE_DIR / 'versions'),
+        'TIMEOUT': None,
+        # There are only a few dozen versions; culling one would just invalidate what it keys
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'charts': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'charts',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+    'recipe_book': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recipe_book',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
+# Runs the tests with their own metrics directory and version files (delights/test_runner.py)
+TEST_RUNNER = 'delights.test_runner.TestRunner'
+
+# Cache alias holding the data versions (see restaurant/versions.py)
+DATA_VERSION_CACHE = 'versions'
+
+# Cache alias and TTL (seconds) for the chart JSON payloads
+CHART_CACHE_ALIAS = 'charts'
+CHART_CACHE_TIMEOUT = 300
+
+# Cache alias for the recipe book cards, one per menu item (see restaurant/recipe_book.py)
+RECIPE_BOOK_CACHE_ALIAS = 'recipe_book'
+
+# Per-request SQL instrumentation (restaurant.middleware.SQLInstrumentationMiddleware): a statement
+# run this many times in one request is logged as a likely N+1, as is a request spending more than
+# SQL_SLOW_REQUEST_MS in the database. SQL_SERVER_TIMING adds the Server-Timing response header.
+SQL_DUPLICATE_THRESHOLD = 5
+SQL_SLOW_REQUEST_MS = 500
+SQL_SERVER_TIMING = True
+
+# One JSON line per request on 'restaurant.sql'; INFO logs every request, WARNING only the suspicious ones
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'restaurant.sql': {
+            'handlers': ['console'],
+            'level': os.environ.get('SQL_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
 }
 
 
@@ -129,6 +216,24 @@ STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
 
+# Generated reports (e.g. the ingredient PDF), cached on disk per inventory version
+REPORTS_ROOT = BASE_DIR / "reports"
+
+# archive_purchases moves purchases older than this many days out of the Purchase table (restaurant/archive.py)
+PURCHASE_ARCHIVE_DAYS = 365
+
+# `compact_inventory --watch` folds the stock ledger into the ingredient snapshots this often, in
+# seconds (restaurant/inventory.py). Stock reads add up what has not been folded yet.
+INVENTORY_COMPACT_INTERVAL = 5
+
+# Metrics served at /metrics/ (restaurant/metrics.py). Each worker process writes its totals to its
+# own file here at most every METRICS_FLUSH_INTERVAL seconds; all workers must share the directory.
+# Files of exited workers stay and keep counting; empty the directory before starting the server.
+METRICS_DIR = os.environ.get('METRICS_DIR', BASE_DIR / "metrics")
+METRICS_FLUSH_INTERVAL = 1.0
+# Scrapers send "Authorization: Bearer <token>"; without a token only staff users can read the metrics
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -0,0 +1,33 @@
+import copy
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from restaurant import metrics
+
+
+class TestRunner(DiscoverRunner):
+    """Keeps the files the tests write (metrics, data versions, reports) out of the project directory."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._scratch = tempfile.TemporaryDirectory()
+        scratch = Path(self._scratch.name)
+        caches = copy.deepcopy(settings.CACHES)
+        versions = caches[settings.DATA_VERSION_CACHE]
+        if versions['BACKEND'].endswith('FileBasedCache'):
+            versions['LOCATION'] = scratch / 'versions'
+        self._settings = override_settings(
+            METRICS_DIR=scratch / 'metrics', REPORTS_ROOT=scratch / 'reports', CACHES=caches,
+        )
+        self._settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        # Otherwise the exit-time flush writes what the tests counted to the real METRICS_DIR
+        metrics.registry.clear()
+        self._settings.disable()
+        self._scratch.cleanup()
+        super().teardown_test_environment(**kwargs)
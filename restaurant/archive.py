@@ -0,0 +1,69 @@
+"""
+Purchase archival.
+
+The Purchase table only needs recent sales: the totals, charts and forecasts all read the hourly
+rollup (see rollups.py), which already has every purchase folded in when it is recorded.
+``archive_purchases`` moves purchases older than settings.PURCHASE_ARCHIVE_DAYS into the
+ArchivedPurchase table in batches, so the hot table stays the size of the horizon however long
+the restaurant has been trading. The rows keep the price they were sold at and are moved without
+delete signals, so the rollup buckets they were counted in stay as they are and totals don't
+change, now or after a rebuild.
+
+Archived rows are left out of everything except explicit requests: ``purchase_rows()`` reads live
+and archived purchases together, and rollup rebuilds and checks include both tables.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import sql, versions
+from .models import ArchivedPurchase, Purchase
+
+
+def archive_cutoff(days=None):
+    """Returns the start of the hour ``days`` (default PURCHASE_ARCHIVE_DAYS) ago."""
+    days = settings.PURCHASE_ARCHIVE_DAYS if days is None else days
+    # Whole hours, so an hour's purchases are archived together
+    return (timezone.now() - timedelta(days=days)).replace(minute=0, second=0, microsecond=0)
+
+
+def archive_purchases(before, batch_size=5000):
+    """
+    Moves purchases older than ``before`` to ArchivedPurchase, oldest first, committing every
+    ``batch_size`` rows. Returns the number of purchases moved.
+    """
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Purchase.objects.filter(timestamp__lt=before)
+                .order_by('timestamp', 'id')
+                .values_list('id', 'menu_item_id', 'timestamp', 'price')[:batch_size]
+            )
+            if not rows:
+                return moved
+            ArchivedPurchase.objects.bulk_create(
+                ArchivedPurchase(id=pk, menu_item_id=menu_item_id, timestamp=timestamp, price=price)
+                for pk, menu_item_id, timestamp, price in rows
+            )
+            # A plain DELETE: the delete signals would take the purchases back out of the rollup
+            sql.delete_rows(Purchase, [row[0] for row in rows])
+            # Totals are unchanged, but the purchase log is not
+            versions.bump('purchase')
+        moved += len(rows)
+
+
+def purchase_rows(start=None, end=None):
+    """
+    Returns ``(id, timestamp, menu item name, price)`` for live and archived purchases in
+    ``[start, end)``, oldest first, with the price each was sold at.
+    """
+    live = Purchase.objects.values_list('id', 'timestamp', 'menu_item__name', 'price')
+    archived = ArchivedPurchase.objects.values_list('id', 'timestamp', 'menu_item__name', 'price')
+    if start:
+        live, archived = live.filter(timestamp__gte=start), archived.filter(timestamp__gte=start)
+    if end:
+        live, archived = live.filter(timestamp__lt=end), archived.filter(timestamp__lt=end)
+    return archived.union(live, all=True).order_by('timestamp', 'id')
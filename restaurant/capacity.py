@@ -0,0 +1,178 @@
+"""
+Servings available: how many of each menu item the current stock can still make.
+
+Recipes are held as a sparse menu item x ingredient matrix in coordinate form (row, column and
+quantity per serving arrays). One NumPy pass divides the stock of every entry's ingredient by the
+quantity it needs and takes the minimum per row. Quantities have two decimal places, so both sides
+are scaled to integer hundredths and the division stays exact.
+
+Each process keeps its matrix tagged with the 'recipe' data version. Recipe rows saved or deleted
+in this process are applied to it in place once they commit (see signals.py). If anyone else moved
+the version, the matrix is reloaded with one query on the next read.
+"""
+import threading
+
+import numpy as np
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from . import inventory, versions
+from .models import MenuItem, RecipeRequirement
+
+# Quantities are stored with two decimal places
+SCALE = 100
+
+# Data versions the servings depend on
+DEPENDS_ON = ('menuitem', 'recipe', 'ingredient', 'stock')
+
+_NO_RECIPE = np.iinfo(np.int64).max
+
+_lock = threading.RLock()
+_matrix = None
+
+
+def _scaled(quantity):
+    return int(round(quantity * SCALE))
+
+
+class RecipeMatrix:
+    def __init__(self, version):
+        self.version = version
+        self.stale = False
+        self.menu_item_ids = []  # Row -> menu item id
+        self.ingredient_ids = []  # Column -> ingredient id
+        self._rows = {}
+        self._columns = {}
+        self._entries = {}  # (row, column) -> position in the coordinate arrays
+        self.rows = np.empty(0, dtype=np.int64)
+        self.columns = np.empty(0, dtype=np.int64)
+        self.quantities = np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def load(cls, version):
+        matrix = cls(version)
+        # From the primary even in a replica read: the matrix is kept for every later request
+        requirements = RecipeRequirement.objects.using(DEFAULT_DB_ALIAS).values_list(
+            'menu_item_id', 'ingredient_id', 'quantity'
+        )
+        rows, columns, quantities = [], [], []
+        for menu_item_id, ingredient_id, quantity in requirements:
+            key = (matrix._row(menu_item_id), matrix._column(ingredient_id))
+            matrix._entries[key] = len(quantities)
+            rows.append(key[0])
+            columns.append(key[1])
+            quantities.append(_scaled(quantity))
+        matrix.rows = np.array(rows, dtype=np.int64)
+        matrix.columns = np.array(columns, dtype=np.int64)
+        matrix.quantities = np.array(quantities, dtype=np.int64)
+        return matrix
+
+    def _row(self, menu_item_id):
+        if menu_item_id not in self._rows:
+            self._rows[menu_item_id] = len(self.menu_item_ids)
+            self.menu_item_ids.append(menu_item_id)
+        return self._rows[menu_item_id]
+
+    def _column(self, ingredient_id):
+        if ingredient_id not in self._columns:
+            self._columns[ingredient_id] = len(self.ingredient_ids)
+            self.ingredient_ids.append(ingredient_id)
+        return self._columns[ingredient_id]
+
+    def set(self, menu_item_id, ingredient_id, quantity):
+        """Sets the quantity one serving needs; 0 removes the entry."""
+        key = (self._row(menu_item_id), self._column(ingredient_id))
+        position = self._entries.get(key)
+        if position is not None:
+            self.quantities[position] = _scaled(quantity)
+        elif quantity:
+            self._entries[key] = len(self.quantities)
+            self.rows = np.append(self.rows, key[0])
+            self.columns = np.append(self.columns, key[1])
+            self.quantities = np.append(self.quantities, _scaled(quantity))
+
+    def servings(self, stock):
+        """
+        Returns servings per row for ``stock`` (``(ingredient_id, quantity)`` pairs), with
+        ``_NO_RECIPE`` for rows that need nothing.
+        """
+        available = np.zeros(len(self.ingredient_ids), dtype=np.int64)
+        for ingredient_id, quantity in stock:
+            column = self._columns.get(ingredient_id)
+            if column is not None:
+                available[column] = max(_scaled(quantity), 0)
+
+        needed = self.quantities > 0
+        per_entry = available[self.columns[needed]] // self.quantities[needed]
+        servings = np.full(len(self.menu_item_ids), _NO_RECIPE, dtype=np.int64)
+        np.minimum.at(servings, self.rows[needed], per_entry)
+        return servings
+
+
+def recipe_matrix():
+    """Returns this process's matrix, reloading it if the recipes changed elsewhere."""
+    global _matrix
+    version = versions.get_version('recipe')
+    with _lock:
+        if _matrix is None or _matrix.stale or _matrix.version != version:
+            _matrix = RecipeMatrix.load(version)
+        return _matrix
+
+
+def is_current():
+    matrix = _matrix
+    return matrix is not None and not matrix.stale and matrix.version == versions.get_version('recipe')
+
+
+def recipe_changed(requirement, was_current, version, created=False, removed=False):
+    """
+    Applies a saved or deleted RecipeRequirement to this process's matrix once it commits.
+
+    Called after the 'recipe' version was bumped to ``version`` (as returned by versions.bump), so
+    the callback runs after the version has settled. ``was_current`` says whether the matrix was
+    up to date just before the bump; if it was not, or the previous position of the row is
+    unknown, the matrix is left to be reloaded. So it is if the version has moved past ``version``
+    by the time the change commits: another process changed recipes as well.
+    """
+    matrix = _matrix
+    if matrix is None:
+        return
+    previous = None if created else getattr(requirement, '_loaded', None)
+    if not was_current or (not created and previous is None):
+        matrix.stale = True
+        return
+
+    current = (requirement.menu_item_id, requirement.ingredient_id)
+    quantity = 0 if removed else requirement.quantity
+
+    def apply():
+        with _lock:
+            if matrix.stale:
+                return
+            if versions.get_version('recipe') != version:
+                matrix.stale = True
+                return
+            if previous is not None and previous != current:
+                matrix.set(*previous, 0)
+            matrix.set(*current, quantity)
+            matrix.version = version
+
+    transaction.on_commit(apply)
+
+
+def servings_available():
+    """
+    Returns ``[{'id', 'name', 'servings'}]`` for every menu item, ordered by name. ``servings`` is
+    None for menu items without a recipe.
+    """
+    matrix = recipe_matrix()
+    stock = list(inventory.with_stock().values_list('id', 'stock'))
+    with _lock:
+        servings = matrix.servings(stock)
+        rows = dict(matrix._rows)
+
+    result = []
+    for pk, name in MenuItem.objects.order_by('name', 'id').values_list('id', 'name'):
+        row = rows.get(pk)
+        count = None if row is None or servings[row] == _NO_RECIPE else int(servings[row])
+        result.append({'id': pk, 'name': name, 'servings': count})
+    return result
@@ -0,0 +1,72 @@
+"""
+Server-side chart images for displays and documents that can't run Chart.js.
+
+Charts are drawn with matplotlib's Agg renderer from the cached chart payloads (see charts.py) and
+written to settings.REPORTS_ROOT/charts, named after the database and data version they were built
+from. An unchanged chart is therefore a file send, and a data change simply leads to a new file name.
+"""
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+from . import charts, routers
+
+FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def chart_image_path(name, image_format):
+    alias = routers.current_alias()
+    return Path(settings.REPORTS_ROOT) / 'charts' / f"{name}-{alias}-{charts.chart_version(name)}.{image_format}"
+
+
+def draw_chart(payload, output, image_format):
+    # Imported here so that only processes which actually draw charts pay for matplotlib;
+    # Figure and the Agg canvas need no pyplot state, so drawing is safe in any thread
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(8, 5), dpi=100)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.bar(payload['labels'], [float(value) for value in payload['data']], color='#36a2eb', label=payload['legend'])
+    axes.set_title(payload['chartTitle'])
+    axes.legend(loc='upper right')
+    axes.tick_params(axis='x', labelrotation=45)
+    figure.tight_layout()
+    figure.savefig(output, format=image_format)
+
+
+def chart_image(name, image_format):
+    """Returns the path of the current image of chart ``name``, rendering it if needed."""
+    path = chart_image_path(name, image_format)
+    if path.exists():
+        return path
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Concurrent renders of the same version each write their own file and the last rename wins
+    handle, partial = tempfile.mkstemp(dir=path.parent, suffix='.part')
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            draw_chart(charts.get_chart(name), output, image_format)
+        os.replace(partial, path)
+    except BaseException:
+        Path(partial).unlink(missing_ok=True)
+        raise
+    for old in path.parent.glob(f"{name}-{routers.current_alias()}-*.{image_format}"):
+        if old != path:
+            old.unlink(missing_ok=True)
+    return path
+
+
+def open_chart_image(name, image_format):
+    """Opens the current image of chart ``name`` for reading."""
+    try:
+        return chart_image(name, image_format).open('rb')
+    except FileNotFoundError:
+        # A render of a newer version removed it between the check and the open
+        return chart_image(name, image_format).open('rb')
@@ -0,0 +1,199 @@
+"""
+Chart payloads for the analytics page, cached per data version.
+
+Each chart lists the data versions it is built from. The signal handlers bump those versions on
+every write, which moves the chart to a new cache key, so a change only invalidates the charts
+that actually depend on it. The cache alias, TTL and size are configured in settings.
+get_dashboard() serves the analytics page all charts at once.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import close_old_connections
+from django.db.models import Sum
+
+from . import capacity, inventory, metrics, rollups, routers, versions
+from .models import RecipeRequirement
+
+STATS_PREFIX = 'restaurant:chart-cache:'
+CACHE_RESULTS = {'hits': 'hit', 'misses': 'miss'}
+
+
+def quantity_chart_data():
+    labels = []
+    data = []
+
+    queryset = (
+        RecipeRequirement.objects.values('ingredient__name')
+        .annotate(total_quantity=Sum('quantity'))
+        .order_by('-total_quantity')
+    )
+
+    for entry in queryset:
+        labels.append(entry['ingredient__name'])
+        data.append(entry['total_quantity'])
+
+    return {
+        'labels': labels,
+        'data': data,
+        'chartTitle': 'Ingredient Usage Chart',
+        'legend': 'Total Quantity',
+        'chartType': 'bar',
+    }
+
+
+def revenue_chart_data():
+    labels = []
+    data = []
+
+    for item in rollups.revenue_by_menu_item():
+        labels.append(item.name)
+        data.append(item.revenue)
+
+    return {
+        'labels': labels,
+        'data': data,
+        'chartTitle': 'Menu Item revenue Chart',
+        'legend': 'Total Quantity',
+        'chartType': 'bar',
+    }
+
+
+def inventory_chart_data():
+    labels = []
+    data = []
+
+    for name, quantity in inventory.with_stock().order_by('id').values_list('name', 'stock'):
+        labels.append(name)
+        data.append(quantity)
+
+    return {
+        'labels': labels,
+        'data': data,
+        'chartTitle': 'Inventory quantity Chart',
+        'legend': 'Total Quantity',
+        'chartType': 'bar',
+    }
+
+
+def capacity_chart_data():
+    labels = []
+    data = []
+
+    for item in capacity.servings_available():
+        if item['servings'] is not None:
+            labels.append(item['name'])
+            data.append(item['servings'])
+
+    return {
+        'labels': labels,
+        'data': data,
+        'chartTitle': 'Servings Available Chart',
+        'legend': 'Servings',
+        'chartType': 'bar',
+    }
+
+
+# Chart name -> (payload builder, data versions it depends on)
+CHARTS = {
+    'quantity': (quantity_chart_data, ('ingredient', 'recipe')),
+    'revenue': (revenue_chart_data, ('menuitem', 'purchase')),
+    'inventory': (inventory_chart_data, ('ingredient', 'stock')),
+    'capacity': (capacity_chart_data, capacity.DEPENDS_ON),
+}
+
+# Everything the dashboard response is built from
+DASHBOARD_VERSIONS = tuple(dict.fromkeys(name for _, depends_on in CHARTS.values() for name in depends_on))
+
+
+def _chart_cache():
+    return caches[settings.CHART_CACHE_ALIAS]
+
+
+def _count(outcome):
+    metrics.registry.inc('delights_cache_requests_total', cache='charts', result=CACHE_RESULTS[outcome])
+    key = STATS_PREFIX + outcome
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)  # Evicted between add() and incr()
+
+
+def chart_version(name):
+    return versions.token(*CHARTS[name][1])
+
+
+def _chart_key(name, version):
+    return f"restaurant:chart:{name}:{routers.current_alias()}:{version}"
+
+
+def _build(name, key):
+    builder, _ = CHARTS[name]
+    payload = builder()
+    _chart_cache().set(key, payload, timeout=settings.CHART_CACHE_TIMEOUT)
+    return payload
+
+
+def get_chart(name):
+    """Returns the payload for chart ``name``, building and caching it on a miss."""
+    key = _chart_key(name, chart_version(name))
+    payload = _chart_cache().get(key)
+    if payload is None:
+        _count('misses')
+        payload = _build(name, key)
+    else:
+        _count('hits')
+    return payload
+
+
+def _cached_charts(names):
+    """Returns the cached payloads and the keys of the missing ones, with two cache lookups."""
+    current = versions.get_versions(*{dependency for name in names for dependency in CHARTS[name][1]})
+    keys = {
+        name: _chart_key(name, '-'.join(format(current[dependency], 'x') for dependency in CHARTS[name][1]))
+        for name in names
+    }
+    found = _chart_cache().get_many(keys.values())
+    payloads = {name: found[key] for name, key in keys.items() if key in found}
+    missing = {name: key for name, key in keys.items() if key not in found}
+    for _ in payloads:
+        _count('hits')
+    for _ in missing:
+        _count('misses')
+    return payloads, missing
+
+
+def _build_in_worker(name, key):
+    try:
+        return _build(name, key)
+    finally:
+        close_old_connections()  # This thread's connection outlives the request otherwise
+
+
+async def get_dashboard(names=None):
+    """
+    Returns ``{name: payload}`` for all charts. Cached payloads come from one lookup; the missing
+    ones are built concurrently, each in its own worker thread with its own connection, so a cold
+    dashboard takes about as long as its slowest chart.
+    """
+    names = list(names or CHARTS)
+    payloads, missing = await sync_to_async(_cached_charts)(names)
+    built = await asyncio.gather(*(
+        sync_to_async(_build_in_worker, thread_sensitive=False)(name, key) for name, key in missing.items()
+    ))
+    payloads.update(zip(missing, built))
+    return {name: payloads[name] for name in names}
+
+
+def cache_stats():
+    counts = cache.get_many([STATS_PREFIX + 'hits', STATS_PREFIX + 'misses'])
+    hits = counts.get(STATS_PREFIX + 'hits', 0)
+    misses = counts.get(STATS_PREFIX + 'misses', 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / (hits + misses) if hits + misses else None,
+    }
@@ -0,0 +1,71 @@
+"""
+Conditional GET for pages and JSON built from versioned data.
+
+A view decorated with ``conditional_on('ingredient', ...)`` gets a strong ETag made from those
+data versions (see versions.py) and the requesting user, and a Last-Modified from the newest of
+them. Both are known after a single cache lookup, so a client revalidating an unchanged page gets
+its 304 before the view runs a query or renders a template. Last-Modified only has one-second
+resolution; browsers also send If-None-Match, which takes precedence and is exact.
+"""
+from functools import wraps
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import versions
+
+
+def _validators(request, names):
+    messages = getattr(request, '_messages', None)
+    if messages is not None and len(messages):
+        return None  # The page will show flash messages that a cached copy would not
+    current = versions.get_versions(*names)
+    token = '-'.join(format(current[name], 'x') for name in names)
+    etag = f'"{token}-{request.user.pk or 0}"'
+    return etag, max(current.values()) // 1_000_000_000
+
+
+def _finish(response, validators):
+    if validators and response.status_code == 200:
+        etag, last_modified = validators
+        response.headers.setdefault('ETag', etag)
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+    # Per-user, and always worth revalidating since a 304 is this cheap
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_on(*names):
+    """Answers conditional GET and HEAD requests from the data versions of ``names``."""
+    def decorator(view):
+        if iscoroutinefunction(view):
+            async def wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await view(request, *args, **kwargs)
+                validators = await sync_to_async(_validators)(request, names)
+                response = None
+                if validators:
+                    etag, last_modified = validators
+                    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return _finish(response, validators)
+
+            markcoroutinefunction(wrapper)
+        else:
+            def wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return view(request, *args, **kwargs)
+                validators = _validators(request, names)
+                response = None
+                if validators:
+                    etag, last_modified = validators
+                    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                return _finish(response, validators)
+
+        return wraps(view)(wrapper)
+    return decorator
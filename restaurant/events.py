@@ -0,0 +1,123 @@
+"""
+Live purchase totals for Server-Sent Events subscribers.
+
+Each process keeps a single PurchaseFeed. While anyone is subscribed, one task watches the
+'purchase' data version (a cache lookup, no database query). When it changes, the totals are
+computed once and the same event is fanned out to every subscriber, instead of each open page
+polling the database for its own COUNT. Writes in this process wake the task straight away;
+writes in other worker processes are picked up on the next poll.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+
+from . import rollups, versions
+
+# Seconds between checks for purchases recorded by other processes
+POLL_INTERVAL = 1.0
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = 15.0
+# Events buffered per subscriber; a slow client only misses intermediate totals
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def format_event(event):
+    return f"event: purchases\ndata: {json.dumps(event)}\n\n"
+
+
+def _event(totals, previous):
+    units, revenue = totals
+    previous_units, previous_revenue = previous or totals
+    return {
+        'total_purchases': units,
+        'total_revenue': str(revenue),
+        'delta_purchases': units - previous_units,
+        'delta_revenue': str(revenue - previous_revenue),
+    }
+
+
+class PurchaseFeed:
+    def __init__(self):
+        self._subscribers = set()
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self._version = None
+        self._totals = None
+
+    async def _refresh(self):
+        """Returns ``(previous_totals, totals)`` if the purchase version moved, otherwise None."""
+        version = await sync_to_async(versions.get_version)('purchase')
+        if version == self._version and self._totals is not None:
+            return None
+        previous = self._totals
+        self._version = version
+        self._totals = await sync_to_async(rollups.cached_totals)()
+        return previous, self._totals
+
+    async def _run(self):
+        try:
+            while self._subscribers:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                change = await self._refresh()
+                if change is None:
+                    continue
+                event = _event(change[1], change[0])
+                for queue in list(self._subscribers):
+                    if queue.full():
+                        queue.get_nowait()
+                    queue.put_nowait(event)
+        finally:
+            self._task = None
+
+    async def subscribe(self):
+        """Registers a subscriber and returns its queue and the current totals."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._wakeup, self._task = loop, asyncio.Event(), None
+            self._subscribers = set()
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        if self._task is None:
+            # Nobody was listening, so the last totals we saw may be stale
+            self._version = self._totals = None
+            self._task = loop.create_task(self._run())
+        if self._totals is None:
+            await self._refresh()
+        # Otherwise the running task keeps the totals current; refreshing here would hide
+        # the change from the other subscribers
+        return queue, _event(self._totals, None)
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def notify(self):
+        """Wakes the feed after a local write; safe to call from any thread."""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def notify_on_commit(self):
+        transaction.on_commit(self.notify)
+
+    async def stream(self):
+        queue, snapshot = await self.subscribe()
+        try:
+            yield format_event(snapshot)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_event(event)
+        finally:
+            self.unsubscribe(queue)
+
+
+feed = PurchaseFeed()
@@ -0,0 +1,122 @@
+"""
+Demand forecasting and reorder planning.
+
+Daily ingredient consumption is summed in the database from the hourly sales rollup joined to the
+current recipes (units sold x quantity per serving), so years of history arrive as one row per
+day and ingredient instead of one per Purchase. The rows are scattered into a days x ingredients
+array, and every ingredient is forecast at once: a simple moving average over the last days, or
+exponential smoothing computed as a single weighted sum over the history.
+
+``forecast_demand`` stores the plan in ReorderForecast, which the reorder page reads.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import inventory
+from .models import PurchaseRollup, ReorderForecast
+
+METHODS = ('ema', 'sma')
+
+_CENTS = Decimal('0.01')
+
+
+def daily_consumption(ingredient_ids, start, days):
+    """
+    Returns a ``days x len(ingredient_ids)`` array of quantities used per day, starting at the
+    date ``start``. Days without sales are zeros.
+    """
+    columns = {ingredient_id: column for column, ingredient_id in enumerate(ingredient_ids)}
+    history = np.zeros((days, len(ingredient_ids)))
+    start_of_range = timezone.make_aware(datetime.combine(start, time.min))
+    usage = (
+        PurchaseRollup.objects.filter(
+            hour__gte=start_of_range,
+            hour__lt=start_of_range + timedelta(days=days),
+        )
+        .annotate(day=TruncDate('hour'))
+        .values_list('day', 'menu_item__reciperequirement__ingredient_id')
+        .annotate(used=Sum(F('units') * F('menu_item__reciperequirement__quantity')))
+        .order_by()
+    )
+    rows, cols, amounts = [], [], []
+    for day, ingredient_id, used in usage:
+        if ingredient_id in columns:  # None for menu items without a recipe
+            rows.append((day - start).days)
+            cols.append(columns[ingredient_id])
+            amounts.append(used)
+    np.add.at(history, (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)), np.array(amounts, float))
+    return history
+
+
+def simple_moving_average(history, window):
+    """Mean daily usage per column over the last ``window`` rows."""
+    if not len(history):
+        return np.zeros(history.shape[1])
+    return history[-window:].mean(axis=0)
+
+
+def exponential_smoothing(history, alpha):
+    """
+    Smoothed daily usage per column: ``s_0 = x_0``, ``s_t = alpha * x_t + (1 - alpha) * s_t-1``.
+    The recursion unrolls into fixed weights per day, applied to all columns in one product.
+    """
+    days = len(history)
+    if not days:
+        return np.zeros(history.shape[1])
+    weights = alpha * (1 - alpha) ** np.arange(days - 1, -1, -1)
+    weights[0] = (1 - alpha) ** (days - 1)
+    return weights @ history
+
+
+def _decimal(value, places=_CENTS):
+    return Decimal(str(float(value))).quantize(places)
+
+
+def plan_reorders(horizon_days=14, history_days=90, method='ema', alpha=0.3, window=7, safety_stock=0.2, today=None):
+    """
+    Forecasts usage over the next ``horizon_days`` for every ingredient and returns unsaved
+    ReorderForecast rows. Anything whose stock does not cover the forecast plus the safety margin
+    gets a reorder quantity that tops it up again.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown forecasting method: {method!r}.")
+    today = today or timezone.localdate()
+    stock = list(inventory.with_stock().order_by('id').values_list('id', 'stock'))
+    ingredient_ids = [ingredient_id for ingredient_id, _ in stock]
+
+    history = daily_consumption(ingredient_ids, today - timedelta(days=history_days), history_days)
+    if method == 'sma':
+        daily_usage = simple_moving_average(history, window)
+    else:
+        daily_usage = exponential_smoothing(history, alpha)
+    forecast = daily_usage * horizon_days
+    on_hand = np.array([float(quantity) for _, quantity in stock])
+    # Rounded up to whole cents; the inner round drops float noise such as 12.000000001
+    reorder = np.maximum(np.ceil(np.round((forecast * (1 + safety_stock) - on_hand) * 100, 6)) / 100, 0)
+
+    computed_at = timezone.now()
+    return [
+        ReorderForecast(
+            ingredient_id=ingredient_id,
+            daily_usage=_decimal(daily_usage[column], Decimal('0.0001')),
+            forecast=_decimal(forecast[column]),
+            stock=quantity,
+            reorder_quantity=_decimal(reorder[column]),
+            horizon_days=horizon_days,
+            computed_at=computed_at,
+        )
+        for column, (ingredient_id, quantity) in enumerate(stock)
+    ]
+
+
+@transaction.atomic
+def save_plan(forecasts):
+    """Replaces the stored plan with ``forecasts``."""
+    ReorderForecast.objects.all().delete()
+    return ReorderForecast.objects.bulk_create(forecasts, batch_size=1000)
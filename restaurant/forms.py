@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from django import forms
 
 from .models import Ingredient, MenuItem, Purchase, RecipeRequirement
@@ -21,4 +23,42 @@ class RecipeRequirementForm(forms.ModelForm):
 class PurchaseForm(forms.ModelForm):
     class Meta:
         model = Purchase
-        fields = ['menu_item']
\ No newline at end of file
+        fields = ['menu_item']
+
+class IngredientImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV or JSON Lines with the columns Name, Quantity, Price per Unit.")
+
+class RecipeLineForm(forms.Form):
+    # Plain choices, filled in once per formset, so no form runs its own ingredient query
+    ingredient = forms.TypedChoiceField(coerce=int, empty_value=None)
+    quantity = forms.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+
+    def __init__(self, *args, ingredient_choices=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['ingredient'].choices = [('', '---------')] + list(ingredient_choices)
+
+class BaseRecipeLineFormSet(forms.BaseFormSet):
+    def clean(self):
+        if any(self.errors):
+            return
+        seen = set()
+        for form in self.forms:
+            if self._should_delete_form(form) or not form.cleaned_data:
+                continue  # Removed, or a blank extra row
+            ingredient = form.cleaned_data['ingredient']
+            if ingredient in seen:
+                raise forms.ValidationError("Each ingredient can only be listed once.")
+            seen.add(ingredient)
+
+    def recipe_lines(self):
+        """Returns ``{ingredient_id: quantity}`` for the rows that are kept."""
+        return {
+            form.cleaned_data['ingredient']: form.cleaned_data['quantity']
+            for form in self.forms
+            if not self._should_delete_form(form) and form.cleaned_data
+        }
+
+RecipeLineFormSet = forms.formset_factory(RecipeLineForm, formset=BaseRecipeLineFormSet, extra=3, can_delete=True)
+
+class CloneRecipeForm(forms.Form):
+    target = forms.ModelChoiceField(queryset=MenuItem.objects.order_by('name'), label="Copy this recipe to")
@@ -0,0 +1,171 @@
+"""
+Bulk ingredient import.
+
+Reads CSV or JSON Lines files in the columns of the ingredient CSV export (Name, Quantity,
+Price per Unit) one row at a time, validates every row with IngredientForm and upserts them by
+name in batches; a name the file repeats is reported as an error on the later rows. Each batch is one transaction of a handful of queries: one lookup of the existing
+names, one bulk_update, one bulk_create and the index, valuation and ledger upkeep the Ingredient
+signals would otherwise do per row. Queries therefore grow with the number of batches, not rows, and
+memory with the batch size plus the names already seen.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import inventory, search, valuation, versions
+from .forms import IngredientForm
+from .models import Ingredient, InventoryMovement
+
+# File column -> IngredientForm field, as written by IngredientCSVView
+COLUMNS = {
+    'Name': 'name',
+    'Quantity': 'quantity',
+    'Price per Unit': 'price_per_unit',
+}
+FORMATS = ('csv', 'jsonl')
+
+# Errors kept for the report; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def detect_format(file_name):
+    extension = file_name.rsplit('.', 1)[-1].lower()
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension == 'csv':
+        return 'csv'
+    raise ImportFormatError(f"Can't tell the format of {file_name}; use a .csv or .jsonl file.")
+
+
+def read_rows(binary_file, file_format):
+    """
+    Yields ``(line number, {column: value})`` for each row of ``binary_file``. A file that isn't
+    UTF-8 or isn't CSV raises ImportFormatError where that shows, after the rows before it.
+    """
+    line_number = 0
+    try:
+        for line_number, row in _read_rows(binary_file, file_format):
+            yield line_number, row
+    except UnicodeDecodeError:
+        raise ImportFormatError(
+            f"The file is not UTF-8 text (from about line {line_number + 1}); save it as UTF-8 and try again."
+        )
+    except csv.Error as error:
+        raise ImportFormatError(f"Line {line_number + 1} is not valid CSV: {error}.")
+
+
+def _read_rows(binary_file, file_format):
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        missing = set(COLUMNS) - set(reader.fieldnames or ())
+        if missing:
+            raise ImportFormatError(f"Missing column(s): {', '.join(sorted(missing))}.")
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+def _validate(line, row):
+    if row is None:
+        return None, {'line': line, 'errors': {'__all__': ["Not a JSON object."]}}
+    form = IngredientForm(data={field: row.get(column) for column, field in COLUMNS.items()})
+    if not form.is_valid():
+        return None, {'line': line, 'errors': {field: list(messages) for field, messages in form.errors.items()}}
+    return (line, form.cleaned_data), None
+
+
+@transaction.atomic
+def _upsert(rows):
+    """Upserts one batch of ``(line, cleaned_data)``; returns ``(created, updated, errors)``."""
+    matching = Ingredient.objects.filter(name__in=[data['name'] for line, data in rows])
+    # The rows set the stock outright, so fold what sales have taken into the snapshots first
+    inventory.compact(ingredient_ids=matching.values('id'))
+    existing = {}
+    for ingredient in matching.only('id', 'name', 'price_per_unit', 'quantity'):
+        existing.setdefault(ingredient.name, []).append(ingredient)
+
+    to_create, to_update, changes, errors = [], [], [], []
+    delta = 0
+    now = timezone.now()
+    for line, data in rows:
+        name = data['name']
+        matches = existing.get(name, [])
+        if len(matches) > 1:
+            errors.append({'line': line, 'errors': {'name': [f"{len(matches)} ingredients are called {name!r}."]}})
+            continue
+        if matches:
+            ingredient = matches[0]
+            delta -= valuation.line_value(ingredient.price_per_unit, ingredient.quantity)
+            changes.append((ingredient, data['quantity'] - ingredient.quantity, InventoryMovement.ADJUSTMENT))
+            ingredient.price_per_unit, ingredient.quantity = data['price_per_unit'], data['quantity']
+            ingredient.updated_at = now
+            to_update.append(ingredient)
+        else:
+            to_create.append(Ingredient(**data))
+        delta += valuation.line_value(data['price_per_unit'], data['quantity'])
+
+    # Neither call sends signals, so do what ingredient_saved would have done; bulk_update skips auto_now too
+    Ingredient.objects.bulk_update(to_update, ['price_per_unit', 'quantity', 'updated_at'])
+    created = Ingredient.objects.bulk_create(to_create)
+    search.index_ingredients(created)
+    valuation.adjust(delta)
+    changes += [(ingredient, ingredient.quantity, InventoryMovement.RECEIPT) for ingredient in created]
+    inventory.record_folded(changes, note='Import')
+    if to_create or to_update:
+        versions.bump('ingredient', 'stock')
+    return len(to_create), len(to_update), errors
+
+
+def import_ingredients(rows, batch_size=1000):
+    """
+    Imports ``(line number, row)`` pairs as from read_rows(). Returns ``{'created', 'updated',
+    'failed', 'errors'}``, where ``errors`` lists ``{'line', 'errors': {field: [...]}}`` for the
+    first MAX_REPORTED_ERRORS rows that were not imported.
+    """
+    result = {'created': 0, 'updated': 0, 'failed': 0, 'errors': []}
+
+    def failed(error):
+        result['failed'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append(error)
+
+    # name -> line it was first imported from
+    seen = {}
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        valid = []
+        for line, row in batch:
+            cleaned, error = _validate(line, row)
+            if error:
+                failed(error)
+            elif (name := cleaned[1]['name']) in seen:
+                failed({'line': line, 'errors': {'name': [f"{name!r} is already on line {seen[name]}."]}})
+            else:
+                seen[name] = line
+                valid.append(cleaned)
+        if not valid:
+            continue
+        created, updated, errors = _upsert(valid)
+        result['created'] += created
+        result['updated'] += updated
+        for error in errors:
+            failed(error)
+    return result
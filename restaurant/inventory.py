@@ -0,0 +1,146 @@
+"""
+Stock ledger.
+
+Stock changes are written to InventoryMovement as inserts: sales take stock out, receipts and
+adjustments move it either way. Ingredient.quantity is a snapshot, the stock as of the last time
+the ingredient's movements were folded into it, so
+
+    current stock = Ingredient.quantity + the movements not folded yet
+
+compact() folds pending movements into the snapshots in batches, locking each batch first so two
+compactors never fold the same movement; the compact_inventory command runs it in the background
+every INVENTORY_COMPACT_INTERVAL seconds. A stock read therefore adds up a few seconds' worth of
+movements, found through the (folded, ingredient) index, however long the ledger grows. Movements also carry their value, so a sale doesn't touch the valuation's
+running total either; compact() folds that in as well (see valuation.py).
+
+A sale inserts its movements, then reads the stock of the same ingredients back and is rolled
+back if any has gone below zero. On SQLite every transaction begins IMMEDIATE (see settings), so
+transactions that change stock run one at a time and the check sees every sale committed before
+it. Databases with row locks lock the ingredient rows, in id order, before the insert instead;
+the check is a new statement and sees what the previous holder of the lock committed.
+
+Writes that set a quantity outright (the ingredient form, the admin, imports) fold the ingredient
+first, so the snapshot they replace is the current stock, and record the difference as a movement
+that is folded already.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import (Case, DecimalField, ExpressionWrapper, F,
+                              OuterRef, Subquery, Sum, Value, When)
+from django.db.models.functions import Coalesce
+
+from . import valuation
+from .models import Ingredient, InventoryMovement
+
+
+class _StockField(DecimalField):
+    # SQLite hands computed decimals back unrounded (98, 999.700000000000); round them like the column
+    def from_db_value(self, value, expression, connection):
+        return value if value is None else valuation.quantize(value)
+
+
+STOCK_FIELD = _StockField(max_digits=12, decimal_places=2)
+
+
+def pending():
+    return InventoryMovement.objects.filter(folded=False)
+
+
+def with_stock(queryset=None):
+    """Annotates an Ingredient queryset (default: all) with ``stock``, its current stock."""
+    queryset = Ingredient.objects.all() if queryset is None else queryset
+    deltas = pending().filter(ingredient=OuterRef('pk')).values('ingredient').annotate(total=Sum('quantity'))
+    return queryset.annotate(stock=ExpressionWrapper(
+        F('quantity') + Coalesce(Subquery(deltas.values('total')), Value(Decimal(0)), output_field=STOCK_FIELD),
+        output_field=STOCK_FIELD,
+    ))
+
+
+def current_stock(ingredient_ids):
+    """Returns ``{ingredient_id: stock}`` for the ingredients that exist."""
+    return dict(with_stock(Ingredient.objects.filter(pk__in=ingredient_ids)).values_list('id', 'stock'))
+
+
+def lock(ingredient_ids):
+    """Locks the ingredient rows in id order where the database has row locks."""
+    if connection.features.has_select_for_update:
+        list(Ingredient.objects.select_for_update().filter(pk__in=ingredient_ids).order_by('pk').values_list('pk'))
+
+
+def take(needs, prices, kind=InventoryMovement.SALE, note=''):
+    """
+    Writes movements taking ``{ingredient_id: quantity}`` out of stock, valued at ``prices``
+    (``{ingredient_id: price_per_unit}``), and returns the ids of the ingredients left below zero.
+    Must run in a transaction, which the caller rolls back if any are returned.
+    """
+    lock(needs)
+    InventoryMovement.objects.bulk_create(
+        InventoryMovement(
+            ingredient_id=ingredient_id, kind=kind, quantity=-required,
+            value=-valuation.line_value(prices[ingredient_id], required), note=note,
+        )
+        for ingredient_id, required in needs.items()
+    )
+    stock = current_stock(needs)
+    # An ingredient deleted in the meantime has no stock at all
+    return [ingredient_id for ingredient_id in needs if stock.get(ingredient_id, -1) < 0]
+
+
+def record_folded(changes, note=''):
+    """
+    Adds ``(ingredient, quantity change, kind)`` entries for quantities written straight to the
+    snapshot. They are folded already, so they only complete the ledger.
+    """
+    InventoryMovement.objects.bulk_create(
+        InventoryMovement(
+            ingredient=ingredient, kind=kind, quantity=delta,
+            value=valuation.line_value(ingredient.price_per_unit, delta), note=note, folded=True,
+        )
+        for ingredient, delta, kind in changes
+        if delta
+    )
+
+
+def _fold(movement_ids):
+    totals = list(
+        InventoryMovement.objects.filter(pk__in=movement_ids)
+        .values('ingredient_id')
+        .annotate(quantity=Sum('quantity'), value=Sum('value'))
+        .order_by()
+    )
+    Ingredient.objects.filter(pk__in=[total['ingredient_id'] for total in totals]).update(
+        quantity=Case(
+            *[When(pk=total['ingredient_id'], then=F('quantity') + total['quantity']) for total in totals],
+            default=F('quantity'),
+        )
+    )
+    InventoryMovement.objects.filter(pk__in=movement_ids).update(folded=True)
+    valuation.adjust(sum(total['value'] for total in totals))
+
+
+def compact(ingredient_ids=None, batch_size=5000):
+    """
+    Folds pending movements (only those of ``ingredient_ids``, if given) into the snapshots,
+    oldest first, committing every ``batch_size`` movements. Current stock and value don't
+    change. Returns the number of movements folded.
+    """
+    folded = 0
+    while True:
+        with transaction.atomic():
+            movements = pending()
+            if ingredient_ids is not None:
+                movements = movements.filter(ingredient_id__in=ingredient_ids)
+            if connection.features.has_select_for_update:
+                # Lock the batch so a concurrent compact() folds other movements, never these twice.
+                # SQLite runs one writing transaction at a time and needs no lock
+                movements = movements.select_for_update(
+                    skip_locked=connection.features.has_select_for_update_skip_locked
+                )
+            # Folding a fixed set of ids keeps the sums and the flags in step with concurrent sales
+            movement_ids = list(movements.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not movement_ids:
+                return folded
+            _fold(movement_ids)
+        folded += len(movement_ids)
+
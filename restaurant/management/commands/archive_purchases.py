@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant import archive
+from restaurant.models import Purchase
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves purchases older than --days (default PURCHASE_ARCHIVE_DAYS) from Purchase to "
+        "ArchivedPurchase. Totals and charts are unchanged; run it daily to keep Purchase small."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Keep this many days of purchases in the Purchase table.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Purchases moved per transaction.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the purchases that would be moved.")
+
+    def handle(self, *args, days=None, batch_size=5000, dry_run=False, **options):
+        if (days is not None and days < 0) or batch_size < 1:
+            raise CommandError("--days cannot be negative and --batch-size must be at least 1.")
+        before = archive.archive_cutoff(days)
+        if dry_run:
+            count = Purchase.objects.filter(timestamp__lt=before).count()
+            self.stdout.write(f"{count} purchase(s) before {before:%Y-%m-%d %H:%M} would be archived.")
+            return
+
+        moved = archive.archive_purchases(before, batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} purchase(s) before {before:%Y-%m-%d %H:%M}."))
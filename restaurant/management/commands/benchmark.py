@@ -0,0 +1,163 @@
+import json
+import platform
+import time
+import tracemalloc
+
+import django
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from restaurant import urls
+from restaurant.models import Ingredient, MenuItem, Purchase, RecipeRequirement
+
+# Routes that would end the benchmark's session
+SKIPPED = {'logout'}
+
+# URL arguments that are not primary keys
+SAMPLE_KWARGS = {
+    'chart-image': {'name': 'inventory', 'image_format': 'png'},
+}
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def _model_of(callback):
+    view_class = getattr(callback, 'view_class', None)
+    return getattr(view_class, 'model', None)
+
+
+class Command(BaseCommand):
+    help = (
+        "Requests every URL in restaurant/urls.py against the current database and reports latency "
+        "percentiles, SQL query count and peak memory per view as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help="Timed requests per URL.")
+        parser.add_argument('--warmup', type=int, default=1, help="Untimed requests per URL first.")
+        parser.add_argument('--only', nargs='+', metavar='URL_NAME', help="Only benchmark these URL names.")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+        parser.add_argument('--label', default='', help="Free text stored with the run, e.g. a version.")
+        parser.add_argument('--host', default='localhost', help="Host header; must be in ALLOWED_HOSTS.")
+        parser.add_argument('--username', default='benchmark',
+                            help="Staff user to request as; created as a superuser if missing.")
+
+    def handle(self, *args, iterations, warmup, only, output, label, host, username, **options):
+        if iterations < 1 or warmup < 0:
+            raise CommandError("--iterations must be at least 1 and --warmup at least 0.")
+        patterns = [
+            pattern for pattern in urls.urlpatterns
+            if isinstance(pattern, URLPattern) and pattern.name and pattern.name not in SKIPPED
+        ]
+        if only:
+            unknown = set(only) - {pattern.name for pattern in patterns}
+            if unknown:
+                raise CommandError(f"Unknown URL name(s): {', '.join(sorted(unknown))}.")
+            patterns = [pattern for pattern in patterns if pattern.name in only]
+
+        user = User.objects.filter(username=username).first()
+        if user is None:
+            user = User.objects.create_superuser(username=username, email='', password=None)
+        client = Client(HTTP_HOST=host)
+        client.force_login(user)
+
+        results = []
+        for pattern in patterns:
+            result = self.benchmark(client, pattern, iterations, warmup)
+            results.append(result)
+            if output:
+                self.stdout.write(self.summary(result))
+
+        report = {
+            'label': label,
+            'started_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'rows': {
+                model.__name__: model.objects.count()
+                for model in (Ingredient, MenuItem, RecipeRequirement, Purchase)
+            },
+            'iterations': iterations,
+            'results': results,
+        }
+        if output:
+            with open(output, 'w') as report_file:
+                json.dump(report, report_file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} result(s) to {output}."))
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+    def url_for(self, pattern):
+        converters = pattern.pattern.converters
+        if not converters:
+            return reverse(pattern.name)
+        if pattern.name in SAMPLE_KWARGS:
+            return reverse(pattern.name, kwargs=SAMPLE_KWARGS[pattern.name])
+        model = _model_of(pattern.callback)
+        if model is None or set(converters) != {'pk'}:
+            return None
+        pk = model.objects.order_by('pk').values_list('pk', flat=True).first()
+        return None if pk is None else reverse(pattern.name, kwargs={'pk': pk})
+
+    def request(self, client, url):
+        response = client.get(url)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        response.close()
+        return response.status_code
+
+    def benchmark(self, client, pattern, iterations, warmup):
+        url = self.url_for(pattern)
+        if url is None:
+            return {'name': pattern.name, 'url': None, 'skipped': "No object to request."}
+
+        for _ in range(warmup):
+            self.request(client, url)
+
+        latencies = []
+        statuses = set()
+        for _ in range(iterations):
+            started = time.perf_counter()
+            statuses.add(self.request(client, url))
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        # Queries and memory come from one extra request, so their overhead stays out of the timings
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                self.request(client, url)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        latencies = np.array(latencies)
+        return {
+            'name': pattern.name,
+            'url': url,
+            'status': sorted(statuses),
+            'latency_ms': {
+                **{f"p{percentile}": round(float(np.percentile(latencies, percentile)), 3) for percentile in PERCENTILES},
+                'mean': round(float(latencies.mean()), 3),
+                'max': round(float(latencies.max()), 3),
+            },
+            'queries': len(queries),
+            'query_time_ms': round(sum(float(query['time']) for query in queries.captured_queries) * 1000, 3),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def summary(self, result):
+        if 'skipped' in result:
+            return f"{result['name']:<32} skipped: {result['skipped']}"
+        latency = result['latency_ms']
+        return (
+            f"{result['name']:<32} p50 {latency['p50']:>9.2f} ms  p99 {latency['p99']:>9.2f} ms  "
+            f"{result['queries']:>4} queries  {result['peak_memory_kb']:>9.1f} KiB"
+        )
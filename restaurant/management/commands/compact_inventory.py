@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant import inventory
+
+
+class Command(BaseCommand):
+    help = (
+        "Folds the stock ledger's pending movements into the ingredient snapshots. Stock and value "
+        "don't change; reads just have less to add up. Leave it running with --watch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Movements folded per transaction.")
+        parser.add_argument('--watch', action='store_true', help="Keep compacting every INVENTORY_COMPACT_INTERVAL seconds.")
+
+    def handle(self, *args, batch_size=5000, watch=False, **options):
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        while True:
+            folded = inventory.compact(batch_size=batch_size)
+            if not watch:
+                self.stdout.write(self.style.SUCCESS(f"Folded {folded} movement(s)."))
+                return
+            if folded:
+                self.stdout.write(f"Folded {folded} movement(s).")
+            time.sleep(settings.INVENTORY_COMPACT_INTERVAL)
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant import forecasting
+
+
+class Command(BaseCommand):
+    help = "Forecasts ingredient usage from the sales history and stores the reorder plan."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon', type=int, default=14, help="Days to forecast.")
+        parser.add_argument('--history', type=int, default=90, help="Days of sales history to use.")
+        parser.add_argument('--method', choices=forecasting.METHODS, default='ema',
+                            help="Exponential smoothing or simple moving average.")
+        parser.add_argument('--alpha', type=float, default=0.3, help="Smoothing factor for --method ema.")
+        parser.add_argument('--window', type=int, default=7, help="Days averaged by --method sma.")
+        parser.add_argument('--safety-stock', type=float, default=0.2,
+                            help="Extra share of the forecast to keep in stock.")
+
+    def handle(self, *args, horizon, history, method, alpha, window, safety_stock, **options):
+        if horizon < 1 or history < 1 or window < 1:
+            raise CommandError("--horizon, --history and --window must be at least 1.")
+        if not 0 < alpha <= 1:
+            raise CommandError("--alpha must be between 0 and 1.")
+
+        forecasts = forecasting.plan_reorders(
+            horizon_days=horizon,
+            history_days=history,
+            method=method,
+            alpha=alpha,
+            window=window,
+            safety_stock=safety_stock,
+        )
+        forecasting.save_plan(forecasts)
+        reorders = sum(1 for forecast in forecasts if forecast.reorder_quantity > 0)
+        self.stdout.write(self.style.SUCCESS(
+            f"Forecast {len(forecasts)} ingredient(s) over {horizon} day(s); {reorders} to reorder."
+        ))
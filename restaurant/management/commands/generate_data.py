@@ -0,0 +1,130 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from restaurant import inventory, rollups, search, sql, valuation, versions
+from restaurant.models import (ArchivedPurchase, Ingredient, IngredientTrigram,
+                               InventoryMovement, MenuItem, Purchase,
+                               PurchaseRollup, RecipeRequirement,
+                               ReorderForecast)
+
+INGREDIENT_WORDS = [
+    'Tomato', 'Cheese', 'Basil', 'Flour', 'Garlic', 'Onion', 'Pepper', 'Olive', 'Mushroom', 'Spinach',
+    'Chicken', 'Beef', 'Salmon', 'Rice', 'Butter', 'Cream', 'Lemon', 'Sugar', 'Egg', 'Potato',
+]
+DISH_WORDS = [
+    'Pizza', 'Pasta', 'Salad', 'Burger', 'Soup', 'Risotto', 'Tart', 'Wrap', 'Curry', 'Bowl',
+]
+
+
+def batches(objects, size):
+    # bulk_create turns whatever it gets into a list, so feed it one batch at a time
+    objects = iter(objects)
+    while batch := list(islice(objects, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills the database with a reproducible synthetic dataset for benchmarking. The same seed "
+        "and counts give the same rows; purchase times are offsets from now."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--ingredients', type=int, default=1000)
+        parser.add_argument('--menu-items', type=int, default=200)
+        parser.add_argument('--recipe-rows', type=int, default=8, help="Recipe rows per menu item.")
+        parser.add_argument('--purchases', type=int, default=100000)
+        parser.add_argument('--days', type=int, default=365, help="Spread purchases over this many days.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--clear', action='store_true', help="Delete the existing restaurant data first.")
+
+    def handle(self, *args, seed, ingredients, menu_items, recipe_rows, purchases, days, batch_size, clear,
+               **options):
+        if min(ingredients, menu_items, days, batch_size) < 1 or min(recipe_rows, purchases) < 0:
+            raise CommandError("Counts must be positive.")
+        if recipe_rows > ingredients:
+            raise CommandError("--recipe-rows cannot exceed --ingredients.")
+        if not clear and Ingredient.objects.exists():
+            raise CommandError("The database already has data; pass --clear to replace it.")
+
+        rng = random.Random(seed)
+        now = timezone.now().replace(microsecond=0)
+        with transaction.atomic():
+            if clear:
+                self.clear()
+
+            # Ingredients and menu items are kept for drawing recipes and purchases from; the rest is
+            # written and dropped batch by batch
+            new_ingredients = []
+            for batch in batches(
+                (
+                    Ingredient(
+                        name=f"{rng.choice(INGREDIENT_WORDS)} {number:05d}",
+                        price_per_unit=Decimal(rng.randint(10, 2000)) / 100,
+                        quantity=Decimal(rng.randint(100000, 10000000)) / 100,
+                    )
+                    for number in range(ingredients)
+                ),
+                batch_size,
+            ):
+                batch = Ingredient.objects.bulk_create(batch)
+                # bulk_create sends no signals, so the ledger entries the signals would add are written here
+                inventory.record_folded(
+                    ((ingredient, ingredient.quantity, InventoryMovement.RECEIPT) for ingredient in batch),
+                    note='Generated',
+                )
+                new_ingredients += batch
+            new_menu_items = []
+            for batch in batches(
+                (
+                    MenuItem(name=f"{rng.choice(DISH_WORDS)} {number:04d}", price=Decimal(rng.randint(500, 4000)) / 100)
+                    for number in range(menu_items)
+                ),
+                batch_size,
+            ):
+                new_menu_items += MenuItem.objects.bulk_create(batch)
+            for batch in batches(
+                (
+                    RecipeRequirement(menu_item=menu_item, ingredient=ingredient, quantity=Decimal(rng.randint(1, 500)) / 100)
+                    for menu_item in new_menu_items
+                    for ingredient in rng.sample(new_ingredients, recipe_rows)
+                ),
+                batch_size,
+            ):
+                RecipeRequirement.objects.bulk_create(batch)
+            seconds = days * 24 * 3600
+            for batch in batches(
+                (
+                    Purchase(
+                        menu_item=menu_item, price=menu_item.price, timestamp=now - timedelta(seconds=rng.randrange(seconds))
+                    )
+                    for menu_item in (rng.choice(new_menu_items) for _ in range(purchases))
+                ),
+                batch_size,
+            ):
+                Purchase.objects.bulk_create(batch)
+
+            # Rebuild everything else the signals would have kept up to date
+            search.rebuild_index()
+            valuation.rebuild()
+            rollups.rebuild()
+            versions.bump('ingredient', 'stock', 'menuitem', 'recipe', 'purchase')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {ingredients} ingredients, {menu_items} menu items, "
+            f"{menu_items * recipe_rows} recipe rows and {purchases} purchases (seed {seed})."
+        ))
+
+    def clear(self):
+        # Plain DELETEs: deleting row by row through the ORM would send a signal per object, and
+        # everything those signals maintain is rebuilt afterwards anyway
+        for model in (ReorderForecast, IngredientTrigram, InventoryMovement, PurchaseRollup, ArchivedPurchase, Purchase,
+                      RecipeRequirement, MenuItem, Ingredient):
+            sql.delete_rows(model)
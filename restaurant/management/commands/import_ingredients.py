@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant import imports
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates or updates ingredients, matched by name, from a CSV or JSON Lines file with the "
+        "columns of the ingredient CSV export (Name, Quantity, Price per Unit)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=imports.FORMATS, help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows written per transaction.")
+
+    def handle(self, *args, path, format=None, batch_size=1000, **options):
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        try:
+            file_format = format or imports.detect_format(path)
+            with open(path, 'rb') as source:
+                result = imports.import_ingredients(imports.read_rows(source, file_format), batch_size=batch_size)
+        except (OSError, imports.ImportFormatError) as error:
+            raise CommandError(str(error))
+
+        for error in result['errors']:
+            messages = '; '.join(f"{field}: {' '.join(messages)}" for field, messages in error['errors'].items())
+            self.stderr.write(f"Line {error['line']}: {messages}")
+        summary = f"Created {result['created']}, updated {result['updated']}, skipped {result['failed']} row(s)."
+        self.stdout.write(self.style.WARNING(summary) if result['failed'] else self.style.SUCCESS(summary))
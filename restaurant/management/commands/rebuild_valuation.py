@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from restaurant import valuation
+
+
+class Command(BaseCommand):
+    help = "Recomputes the running inventory valuation from the Ingredient table."
+
+    def handle(self, *args, **options):
+        total = valuation.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Inventory valued at {total}."))
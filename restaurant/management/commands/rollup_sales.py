@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurant import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the hourly sales rollup from live and archived purchases, or verifies it with --verify."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help="Only compare the rollup against the purchases.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, verify=False, batch_size=1000, **options):
+        if verify:
+            mismatches = rollups.verify()
+            for menu_item_id, hour, expected, actual in mismatches:
+                self.stderr.write(f"Menu item {menu_item_id} at {hour:%Y-%m-%d %H:00}: expected {expected}, found {actual}")
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} rollup bucket(s) do not match the purchases.")
+            self.stdout.write(self.style.SUCCESS("Sales rollup matches the purchases."))
+            return
+
+        created = rollups.rebuild(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt sales rollup with {created} bucket(s)."))
@@ -0,0 +1,28 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the primary SQLite database into the SQLite file that stands in for the read replica "
+        "(READ_REPLICA_ALIAS). Run it again whenever the stand-in should catch up."
+    )
+
+    def handle(self, *args, **options):
+        alias = settings.READ_REPLICA_ALIAS
+        if not alias:
+            raise CommandError("No read replica is configured; set REPLICA_DB_NAME to a second SQLite file.")
+        primary, replica = connections[DEFAULT_DB_ALIAS], connections[alias]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError("Only SQLite stand-ins can be synced; a real replica is kept up to date by the database.")
+        if Path(primary.settings_dict['NAME']).resolve() == Path(replica.settings_dict['NAME']).resolve():
+            raise CommandError("The replica and the primary are the same file.")
+
+        primary.ensure_connection()
+        replica.ensure_connection()
+        # SQLite's online backup copies a consistent snapshot while the primary stays in use
+        primary.connection.backup(replica.connection)
+        self.stdout.write(self.style.SUCCESS(f"Copied {primary.settings_dict['NAME']} to {replica.settings_dict['NAME']}."))
@@ -0,0 +1,197 @@
+"""
+Process metrics in the Prometheus text format.
+
+Every worker process counts in memory and, at most once per settings.METRICS_FLUSH_INTERVAL
+seconds, writes its totals to its own JSON file in settings.METRICS_DIR (written to a temporary
+file and renamed, so readers never see half a file). The scrape endpoint adds up the files of all
+processes, so whichever worker answers it reports the totals of all of them. A process that
+counted nothing (a management command, say) writes no file. Files of workers that have exited stay
+in the directory and keep counting towards the totals, as counters should; nothing removes them, so
+empty the directory when the server is restarted or deployed (see README), which Prometheus reads
+as a counter reset.
+
+Rates such as purchases per second are left to the scraper, e.g. ``rate(delights_purchases_total[1m])``.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+# Upper bounds in seconds of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+
+METRICS = {
+    'delights_http_requests_total': (COUNTER, "Requests by URL name and response status."),
+    'delights_http_request_duration_seconds': (HISTOGRAM, "Request latency by URL name."),
+    'delights_db_queries_total': (COUNTER, "SQL queries run by requests, by URL name."),
+    'delights_db_duration_seconds_total': (COUNTER, "Time requests spent in SQL, by URL name."),
+    'delights_cache_requests_total': (COUNTER, "Cache lookups by cache and result (hit or miss)."),
+    'delights_purchases_total': (COUNTER, "Purchases recorded."),
+}
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        # A fresh name per process, so a reused pid can't overwrite the totals of an exited worker
+        self._file_name = f"{self._pid}-{uuid.uuid4().hex[:8]}.json"
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._flushed_at = 0.0
+
+    def _check_fork(self):
+        # A worker forked from a parent that already counted starts from zero
+        if os.getpid() != self._pid:
+            self._reset()
+
+    def clear(self):
+        """Forgets what this process counted; its file, if any, is left as it is."""
+        with self._lock:
+            self._reset()
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            self._check_fork()
+            key = (name, _key(labels))
+            self._counters[key] = self._counters.get(key, 0) + amount
+        self.flush()
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            self._check_fork()
+            key = (name, _key(labels))
+            histogram = self._histograms.setdefault(key, [0] * (len(LATENCY_BUCKETS) + 2))
+            for position, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram[position] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+        self.flush()
+
+    def _snapshot(self):
+        return {
+            'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+            'histograms': [[name, labels, values] for (name, labels), values in self._histograms.items()],
+        }
+
+    def flush(self, force=False):
+        """Writes this process's totals to its file, unless that was done less than an interval ago."""
+        now = time.monotonic()
+        if not force and now - self._flushed_at < settings.METRICS_FLUSH_INTERVAL:
+            return
+        # Held while writing, so an older snapshot can't replace a newer one
+        with self._lock:
+            self._check_fork()
+            if not self._counters and not self._histograms:
+                return
+            self._flushed_at = now
+            directory = Path(settings.METRICS_DIR)
+            directory.mkdir(parents=True, exist_ok=True)
+            handle, partial = tempfile.mkstemp(dir=directory, suffix='.part')
+            try:
+                with os.fdopen(handle, 'w') as output:
+                    json.dump(self._snapshot(), output)
+                os.replace(partial, directory / self._file_name)
+            except BaseException:
+                Path(partial).unlink(missing_ok=True)
+                raise
+
+    def collect(self):
+        """Returns ``(counters, histograms)`` summed over all processes."""
+        with self._lock:
+            self._check_fork()
+            snapshots = [self._snapshot()]  # This process's own file may be up to an interval behind
+            own_file = self._file_name
+        for path in Path(settings.METRICS_DIR).glob('*.json'):
+            if path.name == own_file:
+                continue
+            try:
+                snapshots.append(json.loads(path.read_text()))
+            except (FileNotFoundError, ValueError):
+                continue
+
+        counters, histograms = {}, {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, values in snapshot['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                total = histograms.setdefault(key, [0] * len(values))
+                for position, value in enumerate(values):
+                    total[position] += value
+        return counters, histograms
+
+
+registry = Registry()
+atexit.register(registry.flush, force=True)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def cache_hit_ratios(counters):
+    """Returns ``{cache: hits / lookups}`` from the summed cache counters."""
+    results = {}
+    for (name, labels), value in counters.items():
+        if name == 'delights_cache_requests_total':
+            labels = dict(labels)
+            hits, lookups = results.get(labels['cache'], (0, 0))
+            results[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0), lookups + value)
+    return {cache: hits / lookups for cache, (hits, lookups) in results.items() if lookups}
+
+
+def render():
+    """Returns all metrics, summed over every process, in the Prometheus text exposition format."""
+    counters, histograms = registry.collect()
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        if kind == COUNTER:
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        else:
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(LATENCY_BUCKETS, values):
+                    lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {values[-1]}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(values[-2])}")
+                lines.append(f"{name}_count{_labels(labels)} {values[-1]}")
+
+    name = 'delights_cache_hit_ratio'
+    lines += [f"# HELP {name} Share of cache lookups that were hits, by cache.", f"# TYPE {name} gauge"]
+    for cache, ratio in sorted(cache_hit_ratios(counters).items()):
+        lines.append(f"{name}{_labels([('cache', cache)])} {_number(ratio)}")
+    return '\n'.join(lines) + '\n'
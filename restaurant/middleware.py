@@ -0,0 +1,139 @@
+"""
+Per-request SQL instrumentation and request metrics.
+
+SQLInstrumentationMiddleware installs a connection.execute_wrapper() for the duration of each
+request, so it works with DEBUG off and without connection.queries. Per query it only reads the
+clock and counts the statement text. The totals are sent back as a Server-Timing header and logged
+as one JSON line on the 'restaurant.sql' logger: INFO for every request, WARNING when a statement
+repeats often enough to look like an N+1 loop or the SQL time is over budget.
+
+Queries run by worker threads (e.g. the concurrent dashboard builds) use their own connections and
+are not counted. For streaming responses, only the work done before the response was returned is
+counted.
+
+MetricsMiddleware records every request's latency, status and SQL totals in the metrics registry
+(see metrics.py), labelled with the name of the URL pattern that served it.
+"""
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger('restaurant.sql')
+
+# Longest statement text put in a log line
+MAX_SQL_LENGTH = 500
+
+
+class QueryStats:
+    """Execute wrapper that tallies the queries it sees."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_duration = 0.0
+        self.slowest_sql = None
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            if elapsed > self.slowest_duration:
+                self.slowest_duration = elapsed
+                self.slowest_sql = sql
+            # Parameters are left out, so the same query run in a loop shows up as one statement
+            self.statements[sql] += 1
+
+    def most_repeated(self):
+        """Returns ``(sql, times)`` for the most repeated statement, or ``(None, 0)``."""
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+    def duplicates(self):
+        return self.count - len(self.statements)
+
+
+def _truncate(sql):
+    return sql if sql is None or len(sql) <= MAX_SQL_LENGTH else sql[:MAX_SQL_LENGTH] + '...'
+
+
+class SQLInstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.duplicate_threshold = getattr(settings, 'SQL_DUPLICATE_THRESHOLD', 5)
+        self.slow_sql_ms = getattr(settings, 'SQL_SLOW_REQUEST_MS', 500)
+        self.server_timing = getattr(settings, 'SQL_SERVER_TIMING', True)
+
+    def __call__(self, request):
+        stats = QueryStats()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        request.sql_stats = stats
+        total_ms = (time.perf_counter() - started) * 1000
+        sql_ms = stats.duration * 1000
+
+        if self.server_timing:
+            timings = [f'db;dur={sql_ms:.2f};desc="{stats.count} queries"', f'app;dur={total_ms:.2f}']
+            if stats.duplicates():
+                timings.append(f'db-dup;desc="{stats.duplicates()} repeated"')
+            response.headers['Server-Timing'] = ', '.join(
+                filter(None, [response.headers.get('Server-Timing')] + timings)
+            )
+
+        repeated_sql, repeats = stats.most_repeated()
+        level = logging.WARNING if repeats >= self.duplicate_threshold or sql_ms >= self.slow_sql_ms else logging.INFO
+        if not logger.isEnabledFor(level):
+            return response
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(total_ms, 2),
+            'queries': stats.count,
+            'sql_ms': round(sql_ms, 2),
+            'slowest_ms': round(stats.slowest_duration * 1000, 2),
+            'slowest_sql': _truncate(stats.slowest_sql),
+            'duplicates': stats.duplicates(),
+        }
+        if repeats >= self.duplicate_threshold:
+            record['repeated_sql'] = _truncate(repeated_sql)
+            record['repeated_times'] = repeats
+        logger.log(level, json.dumps(record), extra={'sql_stats': record})
+        return response
+
+
+class MetricsMiddleware:
+    """Goes first in MIDDLEWARE, so the latency covers all the other middleware too."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else 'unmatched'
+        metrics.registry.observe('delights_http_request_duration_seconds', duration, view=view)
+        metrics.registry.inc('delights_http_requests_total', view=view, status=str(response.status_code))
+        stats = getattr(request, 'sql_stats', None)
+        if stats is not None:
+            metrics.registry.inc('delights_db_queries_total', stats.count, view=view)
+            metrics.registry.inc('delights_db_duration_seconds_total', stats.duration, view=view)
+        return response
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-17 02:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0002_menuitem_ingredients_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='purchase',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
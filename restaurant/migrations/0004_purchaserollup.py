@@ -0,0 +1,46 @@
+# Generated by Django 5.1.4 on 2026-10-17 02:24
+
+from datetime import timezone
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncHour
+
+
+def backfill_rollup(apps, schema_editor):
+    Purchase = apps.get_model('restaurant', 'Purchase')
+    PurchaseRollup = apps.get_model('restaurant', 'PurchaseRollup')
+    rows = (
+        Purchase.objects.annotate(hour=TruncHour('timestamp', tzinfo=timezone.utc))
+        .values('menu_item_id', 'hour')
+        .annotate(units=Count('id'), revenue=Sum('menu_item__price'))
+        .order_by()
+    )
+    PurchaseRollup.objects.bulk_create(
+        [PurchaseRollup(**row) for row in rows.iterator()], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0003_purchase_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchaseRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('menu_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='restaurant.menuitem')),
+            ],
+            options={
+                'unique_together': {('menu_item', 'hour')},
+            },
+        ),
+        migrations.RunPython(backfill_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-17 02:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0004_purchaserollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['timestamp', 'id'], name='purchase_timestamp_id_idx'),
+        ),
+    ]
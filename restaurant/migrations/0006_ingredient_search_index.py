@@ -0,0 +1,66 @@
+# Generated by Django 5.1.4 on 2026-10-17 02:32
+
+import django.db.models.deletion
+from django.db import DatabaseError, migrations, models, transaction
+
+FTS_TABLE = 'restaurant_ingredient_fts'
+
+
+def build_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    Ingredient = apps.get_model('restaurant', 'Ingredient')
+    IngredientTrigram = apps.get_model('restaurant', 'IngredientTrigram')
+
+    if connection.vendor == 'sqlite':
+        try:
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.execute(f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(name, tokenize='trigram')")
+                cursor.execute(f"INSERT INTO {FTS_TABLE}(rowid, name) SELECT id, name FROM restaurant_ingredient")
+            return
+        except DatabaseError:
+            pass  # SQLite without FTS5 or the trigram tokenizer (< 3.34): use the trigram table
+
+    batch = []
+    for pk, name in Ingredient.objects.values_list('id', 'name').iterator():
+        name = name.lower()
+        batch.extend(
+            IngredientTrigram(ingredient_id=pk, gram=gram)
+            for gram in {name[i:i + 3] for i in range(len(name) - 2)}
+        )
+        if len(batch) >= 1000:
+            IngredientTrigram.objects.bulk_create(batch)
+            batch = []
+    IngredientTrigram.objects.bulk_create(batch)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0005_purchase_timestamp_id_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingredient',
+            name='name',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.CreateModel(
+            name='IngredientTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=3)),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='restaurant.ingredient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['gram', 'ingredient'], name='ingredient_trigram_idx')],
+            },
+        ),
+        migrations.RunPython(build_search_index, drop_search_index),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-17 02:39
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def compute_valuation(apps, schema_editor):
+    Ingredient = apps.get_model('restaurant', 'Ingredient')
+    InventoryValuation = apps.get_model('restaurant', 'InventoryValuation')
+    total = Ingredient.objects.aggregate(total=Sum(F('price_per_unit') * F('quantity'), default=0))['total']
+    InventoryValuation.objects.create(pk=1, total=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0006_ingredient_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryValuation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.DecimalField(decimal_places=4, default=0, max_digits=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(compute_valuation, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-17 02:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0007_inventoryvaluation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReorderForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('daily_usage', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('forecast', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('stock', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('reorder_quantity', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('horizon_days', models.PositiveIntegerField()),
+                ('computed_at', models.DateTimeField()),
+                ('ingredient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='restaurant.ingredient')),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.4 on 2026-10-17 03:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0008_reorderforecast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPurchase',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('timestamp', models.DateTimeField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('menu_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='restaurant.menuitem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['timestamp', 'id'], name='archived_purchase_ts_id_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.4 on 2026-10-17 03:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def record_opening_stock(apps, schema_editor):
+    # Every ingredient's current quantity becomes a folded opening movement, so the ledger adds up
+    Ingredient = apps.get_model('restaurant', 'Ingredient')
+    InventoryMovement = apps.get_model('restaurant', 'InventoryMovement')
+    rows = Ingredient.objects.values_list('id', 'quantity', 'price_per_unit')
+    batch = []
+    for ingredient_id, quantity, price_per_unit in rows.iterator(chunk_size=2000):
+        batch.append(InventoryMovement(
+            ingredient_id=ingredient_id, kind='adjustment', quantity=quantity, value=quantity * price_per_unit,
+            note='Opening stock', folded=True,
+        ))
+        if len(batch) == 2000:
+            InventoryMovement.objects.bulk_create(batch)
+            batch = []
+    InventoryMovement.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0009_archivedpurchase'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sale', 'Sale'), ('receipt', 'Receipt'), ('adjustment', 'Adjustment')], max_length=10)),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('value', models.DecimalField(decimal_places=4, max_digits=20)),
+                ('note', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('folded', models.BooleanField(default=False)),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='restaurant.ingredient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['folded', 'ingredient'], name='movement_pending_idx')],
+            },
+        ),
+        migrations.RunPython(record_opening_stock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-17 09:12
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def price_existing_purchases(apps, schema_editor):
+    # The sale-time price was never stored, so existing purchases take the current menu price,
+    # which is what the rollup was rebuilt from until now
+    MenuItem = apps.get_model('restaurant', 'MenuItem')
+    Purchase = apps.get_model('restaurant', 'Purchase')
+    Purchase.objects.update(price=Subquery(MenuItem.objects.filter(pk=OuterRef('menu_item_id')).values('price')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0010_inventorymovement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchase',
+            name='price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunPython(price_existing_purchases, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='purchase',
+            name='price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10),
+        ),
+    ]
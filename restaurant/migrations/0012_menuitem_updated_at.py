@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-17 09:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0011_purchase_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='menuitem',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-17 04:16
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0012_menuitem_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='ingredient_name_lower_idx'),
+        ),
+    ]
@@ -1,19 +1,47 @@
 from django.db import models
+from django.db.models.functions import Lower
+from django.utils import timezone
 
 
 # Create your models here.
 class Ingredient(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
     price_per_unit = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    # Keys the recipe book cards that list the ingredient (see recipe_book.py); stock movements leave it alone
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the snapshot that was loaded, so saving a copy without editing it keeps the stock
+        instance._loaded_quantity = instance.__dict__.get('quantity')
+        return instance
+
+    class Meta:
+        # Case-folded names, for searches too short for the trigram index (see search.py)
+        indexes = [models.Index(Lower('name'), name='ingredient_name_lower_idx')]
 
     def __str__(self):
         return self.name
 
+class IngredientTrigram(models.Model):
+    # Search index used when the database has no FTS5 trigram support (see search.py)
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
+    gram = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [models.Index(fields=['gram', 'ingredient'], name='ingredient_trigram_idx')]
+
+    def __str__(self):
+        return f"{self.gram} -> {self.ingredient_id}"
+
 class MenuItem(models.Model):
     name = models.CharField(max_length=100)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     ingredients = models.ManyToManyField(Ingredient, through='RecipeRequirement')
+    # Also moved when the recipe changes; keys the menu item's recipe book card (see recipe_book.py)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -26,12 +54,103 @@ class RecipeRequirement(models.Model):
     class Meta:
         unique_together = ['menu_item', 'ingredient']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember which matrix entry was loaded so edits can move it (see capacity.py)
+        instance._loaded = (instance.__dict__.get('menu_item_id'), instance.__dict__.get('ingredient_id'))
+        return instance
+
     def __str__(self):
         return f"{self.quantity} {self.ingredient.name} for {self.menu_item.name}"
 
 class Purchase(models.Model):
     menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
+    # The menu item's price when it was sold, which is what revenue counts; filled in on save if left empty
+    price = models.DecimalField(max_digits=10, decimal_places=2, blank=True)
+
+    class Meta:
+        # Supports keyset pagination over (timestamp, id) on the purchase log
+        indexes = [models.Index(fields=['timestamp', 'id'], name='purchase_timestamp_id_idx')]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so edits can be moved between rollup buckets
+        instance._loaded = tuple(instance.__dict__.get(field) for field in ('menu_item_id', 'timestamp', 'price'))
+        return instance
+
+    def __str__(self):
+        return f"Purchase of {self.menu_item.name} at {self.timestamp}"
+
+class ArchivedPurchase(models.Model):
+    # Purchases moved out of Purchase by archive_purchases (see archive.py), with their original id and
+    # the price they were sold at.
+    id = models.BigIntegerField(primary_key=True)
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    timestamp = models.DateTimeField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        indexes = [models.Index(fields=['timestamp', 'id'], name='archived_purchase_ts_id_idx')]
+
+    def __str__(self):
+        return f"Archived purchase of {self.menu_item_id} at {self.timestamp}"
+
+class PurchaseRollup(models.Model):
+    # Units sold and revenue per menu item and hour, kept up to date as purchases are recorded
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    hour = models.DateTimeField()
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['menu_item', 'hour']
+
+    def __str__(self):
+        return f"{self.units} x {self.menu_item_id} at {self.hour}"
+
+class InventoryValuation(models.Model):
+    # Single row holding the running total of price_per_unit * quantity over all ingredients
+    total = models.DecimalField(max_digits=20, decimal_places=4, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Inventory value {self.total}"
+
+class ReorderForecast(models.Model):
+    # Demand forecast per ingredient, precomputed by the forecast_demand command (see forecasting.py)
+    ingredient = models.OneToOneField(Ingredient, on_delete=models.CASCADE)
+    daily_usage = models.DecimalField(max_digits=14, decimal_places=4)
+    forecast = models.DecimalField(max_digits=14, decimal_places=2)
+    stock = models.DecimalField(max_digits=10, decimal_places=2)
+    reorder_quantity = models.DecimalField(max_digits=14, decimal_places=2)
+    horizon_days = models.PositiveIntegerField()
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Reorder {self.reorder_quantity} of {self.ingredient_id}"
+
+class InventoryMovement(models.Model):
+    # Append-only stock ledger. Ingredient.quantity is the snapshot the folded rows add up to; the rest
+    # are the recent changes on top of it (see inventory.py).
+    SALE = 'sale'
+    RECEIPT = 'receipt'
+    ADJUSTMENT = 'adjustment'
+    KIND_CHOICES = [(SALE, 'Sale'), (RECEIPT, 'Receipt'), (ADJUSTMENT, 'Adjustment')]
+
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # Signed changes: units of stock, and inventory value at the price_per_unit of the time
+    quantity = models.DecimalField(max_digits=12, decimal_places=2)
+    value = models.DecimalField(max_digits=20, decimal_places=4)
+    note = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    folded = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['folded', 'ingredient'], name='movement_pending_idx')]
 
     def __str__(self):
-        return f"Purchase of {self.menu_item.name} at {self.timestamp}"
\ No newline at end of file
+        return f"{self.kind} {self.quantity} of {self.ingredient_id}"
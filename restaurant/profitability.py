@@ -0,0 +1,63 @@
+"""
+Menu profitability: recipe cost, margin and margin % per menu item.
+
+Recipe costs are summed in the database with one grouped query over the recipe rows and their
+ingredient prices, instead of walking reciperequirement_set item by item. The report is cached
+under the 'menuitem', 'recipe' and 'ingredient' data versions, so changing a menu price, a recipe
+or an ingredient price moves it to a new key.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+
+from . import metrics, routers, versions
+from .models import MenuItem
+
+DEPENDS_ON = ('menuitem', 'recipe', 'ingredient')
+
+_COST_FIELD = DecimalField(max_digits=20, decimal_places=4)
+_CENTS = Decimal('0.01')
+
+
+def _margin_percent(price, margin):
+    if not price:
+        return None
+    return (margin * 100 / price).quantize(_CENTS)
+
+
+def menu_profitability():
+    """Returns one row per menu item, ordered by name, computed with a single query."""
+    menu_items = MenuItem.objects.annotate(
+        recipe_cost=Sum(
+            F('reciperequirement__quantity') * F('reciperequirement__ingredient__price_per_unit'),
+            output_field=_COST_FIELD,
+            default=0,
+        ),
+    ).annotate(
+        margin=ExpressionWrapper(F('price') - F('recipe_cost'), output_field=_COST_FIELD),
+    ).order_by('name', 'id').values_list('id', 'name', 'price', 'recipe_cost', 'margin')
+
+    return [
+        {
+            'id': pk,
+            'name': name,
+            'price': price,
+            'recipe_cost': recipe_cost,
+            'margin': margin,
+            'margin_percent': _margin_percent(price, margin),
+        }
+        for pk, name, price, recipe_cost, margin in menu_items
+    ]
+
+
+def cached_menu_profitability():
+    key = f"restaurant:profitability:{routers.current_alias()}:{versions.token(*DEPENDS_ON)}"
+    report_cache = caches[settings.CHART_CACHE_ALIAS]
+    report = report_cache.get(key)
+    metrics.registry.inc('delights_cache_requests_total', cache='profitability', result='miss' if report is None else 'hit')
+    if report is None:
+        report = menu_profitability()
+        report_cache.set(key, report, timeout=settings.CHART_CACHE_TIMEOUT)
+    return report
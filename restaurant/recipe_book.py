@@ -0,0 +1,83 @@
+"""
+The recipe book: one card per menu item with its ingredients.
+
+Each card's HTML is cached under the menu item's updated_at, which saving the menu item moves and
+so does every change to its recipe (see touch), and the latest updated_at of its ingredients (for
+the names it shows). Changing one recipe or one ingredient therefore re-renders only the cards
+that show it. The menu item ids and both stamps are read in one query and cached under the
+'menuitem', 'recipe' and 'ingredient' versions, so a fully warm page is made of cache lookups
+without a query, however many menu items there are.
+
+The cards have a cache of their own (RECIPE_BOOK_CACHE_ALIAS), sized for a card per menu item, so
+a long menu doesn't push the charts out of theirs or its own cards out before they are read.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Max, Prefetch
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from . import versions
+from .models import MenuItem, RecipeRequirement
+
+CARD_TEMPLATE = 'restaurant/recipe_card.html'
+
+
+def touch(*menu_item_ids):
+    """Moves the updated_at of menu items whose recipe changed, which retires their cards."""
+    menu_item_ids = {menu_item_id for menu_item_id in menu_item_ids if menu_item_id}
+    if menu_item_ids:
+        MenuItem.objects.filter(pk__in=menu_item_ids).update(updated_at=timezone.now())
+
+
+def _cache():
+    return caches[settings.RECIPE_BOOK_CACHE_ALIAS]
+
+
+def index():
+    """
+    Returns ``[(menu_item_id, updated_at, ingredients_updated_at)]`` for every menu item, in id
+    order; the last is None for a menu item without a recipe.
+    """
+    key = f"restaurant:recipe-book:index:{versions.token('menuitem', 'recipe', 'ingredient')}"
+    entries = _cache().get(key)
+    if entries is None:
+        entries = list(
+            MenuItem.objects.order_by('id')
+            .annotate(ingredients_updated_at=Max('reciperequirement__ingredient__updated_at'))
+            .values_list('id', 'updated_at', 'ingredients_updated_at')
+        )
+        _cache().set(key, entries, timeout=settings.CHART_CACHE_TIMEOUT)
+    return entries
+
+
+def _stamp(moment):
+    return '-' if moment is None else f"{moment.timestamp():.6f}"
+
+
+def _render_cards(menu_item_ids):
+    # Two queries for any number of cards: the menu items, then their requirements with the ingredients
+    menu_items = MenuItem.objects.filter(pk__in=menu_item_ids).prefetch_related(
+        Prefetch(
+            'reciperequirement_set',
+            queryset=RecipeRequirement.objects.select_related('ingredient').order_by('ingredient__name', 'id'),
+        )
+    )
+    return {menu_item.pk: render_to_string(CARD_TEMPLATE, {'menu_item': menu_item}) for menu_item in menu_items}
+
+
+def cards():
+    """Returns the HTML of every menu item's card, rendering only the ones not in the cache."""
+    entries = index()
+    keys = {
+        pk: f"restaurant:recipe-card:{pk}:{_stamp(updated_at)}:{_stamp(ingredients_updated_at)}"
+        for pk, updated_at, ingredients_updated_at in entries
+    }
+    found = _cache().get_many(keys.values())
+    missing = [pk for pk, key in keys.items() if key not in found]
+    if missing:
+        rendered = {keys[pk]: html for pk, html in _render_cards(missing).items()}
+        _cache().set_many(rendered, timeout=settings.CHART_CACHE_TIMEOUT)
+        found.update(rendered)
+    # A menu item deleted since the index was cached has no card
+    return [found[keys[pk]] for pk, *_ in entries if keys[pk] in found]
@@ -0,0 +1,135 @@
+"""
+Background-generated PDF reports.
+
+Reports are rendered by a worker thread into settings.REPORTS_ROOT and named after the database
+and data version they were built from. Downloads of an unchanged inventory are served straight from disk,
+and a request that arrives while a render is running gets the in-flight render instead of
+starting another one (a lock file does the same across worker processes).
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from reportlab.pdfgen import canvas
+
+from . import inventory, routers, versions
+from .models import Ingredient
+
+# A lock file older than this is left over from a crashed render
+STALE_LOCK_SECONDS = 600
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reports')
+_pending = {}
+_pending_lock = threading.RLock()  # Done callbacks may run while it is held
+
+
+def _reports_root():
+    return Path(settings.REPORTS_ROOT)
+
+
+def ingredient_pdf_path(using=None):
+    using = using or routers.current_alias()
+    return _reports_root() / f"ingredient_list-{using}-{versions.token('ingredient', 'stock')}.pdf"
+
+
+def write_ingredient_pdf(output, using=None):
+    p = canvas.Canvas(output)
+
+    # Set title
+    p.setFont("Helvetica-Bold", 16)
+    p.drawString(100, 800, "Ingredient List")
+
+    # Add table headers
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(50, 760, "Name")
+    p.drawString(200, 760, "Quantity")
+    p.drawString(350, 760, "Price Per Unit")
+    p.drawString(450, 760, "Total Value")
+
+    # Add data rows; the font only has to be set again after a page break
+    p.setFont("Helvetica", 12)
+    y = 740
+    rows = inventory.with_stock(Ingredient.objects.using(using)).order_by('name', 'id').values_list(
+        'name', 'stock', 'price_per_unit'
+    )
+    for name, quantity, price_per_unit in rows.iterator(chunk_size=2000):
+        p.drawString(50, y, name)
+        p.drawString(200, y, str(quantity))
+        p.drawString(350, y, f"${price_per_unit:.2f}")
+        p.drawString(450, y, f"${price_per_unit * quantity:.2f}")
+        y -= 20  # Move to the next line
+
+        if y < 50:  # Create a new page if space runs out
+            p.showPage()
+            p.setFont("Helvetica", 12)
+            y = 800
+
+    # Finalize the PDF
+    p.showPage()
+    p.save()
+
+
+def _acquire(lock_path):
+    try:
+        return os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            if time.time() - lock_path.stat().st_mtime < STALE_LOCK_SECONDS:
+                return None
+            lock_path.unlink()
+        except FileNotFoundError:
+            pass
+        return _acquire(lock_path)
+
+
+def _render(path, using):
+    lock_path = path.with_suffix('.lock')
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lock = _acquire(lock_path)
+        if lock is None or path.exists():
+            # Another process is rendering this version, or already has
+            if lock is not None:
+                os.close(lock)
+                lock_path.unlink(missing_ok=True)
+            return path
+        try:
+            partial = path.with_suffix('.part')
+            write_ingredient_pdf(str(partial), using=using)
+            os.replace(partial, path)
+            for old in path.parent.glob(f'ingredient_list-{using}-*.pdf'):
+                if old != path:
+                    old.unlink(missing_ok=True)
+        finally:
+            os.close(lock)
+            lock_path.unlink(missing_ok=True)
+        return path
+    finally:
+        connections[using].close()
+
+
+def _forget(path):
+    with _pending_lock:
+        _pending.pop(path, None)
+
+
+def request_ingredient_pdf():
+    """
+    Returns ``(path, None)`` when the PDF for the current inventory is on disk, otherwise
+    ``(None, future)`` for the render that will produce it.
+    """
+    using = routers.current_alias()
+    path = ingredient_pdf_path(using)
+    if path.exists():
+        return path, None
+    with _pending_lock:
+        future = _pending.get(path)
+        if future is None:
+            # The worker thread doesn't see this request's routing, so pass on the database to read
+            future = _pending[path] = _executor.submit(_render, path, using)
+            future.add_done_callback(lambda _: _forget(path))
+    return None, future
@@ -0,0 +1,156 @@
+"""
+Hourly sales rollups.
+
+PurchaseRollup holds units sold and revenue per menu item and hour. Revenue is counted at the price
+each purchase was sold for (Purchase.price), so changing a menu price doesn't move history. It is
+updated as purchases are recorded (see signals.py and services.record_purchase_batch), so analytics can read totals
+without scanning the Purchase table. ``rollup_sales`` rebuilds or verifies it from Purchase and
+ArchivedPurchase (see archive.py).
+"""
+import heapq
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+from itertools import groupby
+from operator import itemgetter
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncHour
+
+from . import routers, versions
+from .models import ArchivedPurchase, MenuItem, Purchase, PurchaseRollup
+
+
+def hour_bucket(timestamp):
+    return timestamp.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def purchase_key(purchase):
+    """Returns what a purchase counts in the rollup: ``(menu_item_id, timestamp, price)``."""
+    return purchase.menu_item_id, purchase.timestamp, purchase.price
+
+
+def _group(keys):
+    totals = defaultdict(lambda: [0, 0])
+    for menu_item_id, timestamp, price in keys:
+        total = totals[(menu_item_id, hour_bucket(timestamp))]
+        total[0] += 1
+        total[1] += price
+    return totals
+
+
+def _apply(totals, sign=1):
+    for (menu_item_id, hour), (units, revenue) in totals.items():
+        bucket = PurchaseRollup.objects.filter(menu_item_id=menu_item_id, hour=hour)
+        changes = {'units': F('units') + sign * units, 'revenue': F('revenue') + sign * revenue}
+        if bucket.update(**changes) or sign < 0:
+            continue
+        try:
+            with transaction.atomic():
+                PurchaseRollup.objects.create(menu_item_id=menu_item_id, hour=hour, units=units, revenue=revenue)
+        except IntegrityError:
+            # Another request created the bucket in the meantime
+            bucket.update(**changes)
+
+
+def record_purchases(purchases):
+    """Adds newly saved purchases to their hourly buckets (one UPDATE per bucket touched)."""
+    _apply(_group(purchase_key(purchase) for purchase in purchases))
+
+
+def remove_purchases(purchases, keys=None):
+    """
+    Takes deleted purchases (or their previously loaded ``(menu_item_id, timestamp, price)`` keys)
+    back out.
+    """
+    if keys is None:
+        keys = [purchase_key(purchase) for purchase in purchases]
+    _apply(_group(keys), sign=-1)
+
+
+def _aggregate(queryset):
+    return (
+        queryset.annotate(hour=TruncHour('timestamp', tzinfo=dt_timezone.utc))
+        .values('menu_item_id', 'hour')
+        .annotate(units=Count('id'), revenue=Sum('price'))
+        .order_by('hour', 'menu_item_id')
+    )
+
+
+def _aggregate_purchases(chunk_size=1000):
+    """Yields ``(hour, menu_item_id, units, revenue)`` over live and archived purchases, by hour."""
+    streams = [
+        (
+            (row['hour'], row['menu_item_id'], row['units'], row['revenue'])
+            for row in _aggregate(queryset).iterator(chunk_size=chunk_size)
+        )
+        for queryset in (Purchase.objects, ArchivedPurchase.objects)
+    ]
+    # Both streams are sorted, so a bucket found in both tables comes out as consecutive rows
+    for (hour, menu_item_id), rows in groupby(heapq.merge(*streams), key=itemgetter(0, 1)):
+        rows = list(rows)
+        yield hour, menu_item_id, sum(row[2] for row in rows), sum(row[3] for row in rows)
+
+
+@transaction.atomic
+def rebuild(batch_size=1000):
+    """Recomputes every bucket from the Purchase and ArchivedPurchase tables."""
+    PurchaseRollup.objects.all().delete()
+    buckets = (
+        PurchaseRollup(menu_item_id=menu_item_id, hour=hour, units=units, revenue=revenue)
+        for hour, menu_item_id, units, revenue in _aggregate_purchases(chunk_size=batch_size)
+    )
+    created = 0
+    batch = []
+    for bucket in buckets:
+        batch.append(bucket)
+        if len(batch) == batch_size:
+            created += len(PurchaseRollup.objects.bulk_create(batch))
+            batch = []
+    created += len(PurchaseRollup.objects.bulk_create(batch))
+    versions.bump('purchase')
+    return created
+
+
+def verify():
+    """Returns ``(menu_item_id, hour, expected, actual)`` for every bucket that does not match the purchases."""
+    expected = {
+        (menu_item_id, hour): (units, revenue)
+        for hour, menu_item_id, units, revenue in _aggregate_purchases()
+    }
+    actual = {
+        (menu_item_id, hour): (units, revenue)
+        for menu_item_id, hour, units, revenue in PurchaseRollup.objects.filter(units__gt=0).values_list(
+            'menu_item_id', 'hour', 'units', 'revenue'
+        ).iterator()
+    }
+    return [
+        (menu_item_id, hour, expected.get((menu_item_id, hour)), actual.get((menu_item_id, hour)))
+        for menu_item_id, hour in sorted(expected.keys() | actual.keys())
+        if expected.get((menu_item_id, hour)) != actual.get((menu_item_id, hour))
+    ]
+
+
+def totals():
+    """Returns ``(units, revenue)`` over all purchases."""
+    result = PurchaseRollup.objects.aggregate(units=Sum('units', default=0), revenue=Sum('revenue', default=0))
+    return result['units'], result['revenue']
+
+
+def cached_totals():
+    """Returns ``(units, revenue)``, cached until the next purchase is recorded or removed."""
+    key = f"restaurant:purchase-totals:{routers.current_alias()}:{versions.token('purchase')}"
+    return cache.get_or_set(key, totals, timeout=None)
+
+
+def purchase_count():
+    return cached_totals()[0]
+
+
+def revenue_by_menu_item():
+    """Returns every menu item annotated with ``units`` and ``revenue`` (in one query)."""
+    return MenuItem.objects.annotate(
+        units=Sum('purchaserollup__units', default=0),
+        revenue=Sum('purchaserollup__revenue', default=0),
+    ).order_by('id')
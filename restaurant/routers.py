@@ -0,0 +1,107 @@
+"""
+Read replica routing.
+
+Analytics and export views are marked with ``reads_from_replica`` (or run their reads in a
+``replica_reads()`` block). While they run, reads go to the settings.READ_REPLICA_ALIAS database,
+so long report queries don't compete with sales for the primary. Everything else, and every write,
+uses 'default'. With READ_REPLICA_ALIAS unset, all of it is a no-op.
+
+A replica lags behind the primary, so a user who has just changed something would not see it in
+the next report. Any write to a restaurant model therefore pins the rest of the request, and
+through a cookie the same browser's requests for the next REPLICA_PIN_SECONDS, to the primary.
+
+Cached results are keyed by data version (see versions.py) and by the database they were read from
+(current_alias), so a chart built from a replica that has not caught up yet may be cached as
+current for replica readers, but a pinned user never gets it.
+"""
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'restaurant_primary'
+
+
+class _RequestState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = ContextVar('restaurant_replica_state', default=None)
+_replica_reads = ContextVar('restaurant_replica_reads', default=False)
+
+
+def read_alias():
+    """Returns the database analytics should read from right now."""
+    state = _state.get()
+    if not settings.READ_REPLICA_ALIAS or (state is not None and state.pinned):
+        return DEFAULT_DB_ALIAS
+    return settings.READ_REPLICA_ALIAS
+
+
+def current_alias():
+    """Returns the database reads go to at this point: read_alias() inside replica_reads(), else the primary."""
+    return read_alias() if _replica_reads.get() else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def replica_reads():
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def reads_from_replica(view):
+    """Sends the reads of ``view`` (sync or async) to the replica, unless the user is pinned."""
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            with replica_reads():
+                return await view(*args, **kwargs)
+    else:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with replica_reads():
+                return view(*args, **kwargs)
+    return wrapper
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get():
+            return read_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label == 'restaurant':
+            state.pinned = state.wrote = True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the primary
+        if db == settings.READ_REPLICA_ALIAS:
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = _RequestState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,166 @@
+"""
+Ingredient name search.
+
+On SQLite the names are indexed in an FTS5 table with the trigram tokenizer, which answers
+substring queries from the index and ranks a capped number of them with bm25. Other databases (or
+SQLite builds without FTS5) use IngredientTrigram, a plain table of the trigrams of every name.
+Either index is kept up to date from the Ingredient signals; bulk writers call index_ingredients()
+themselves.
+
+Names that start with the query are listed first, from a range scan of the index on the lower-cased
+names (which every database can use, unlike a case-insensitive LIKE) that stops at the limit. The
+substring index only fills what is left. Queries shorter than MIN_SUBSTRING_LENGTH have no trigram
+and only match the start of a name.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Count, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Concat, Length, Lower
+
+from .models import Ingredient, IngredientTrigram
+
+FTS_TABLE = 'restaurant_ingredient_fts'
+
+# Search results are ranked and capped; the list view paginates within them. Totals over a search
+# use matching_ingredients(), which has no cap.
+SEARCH_LIMIT = 1000
+
+# Shorter queries match the start of a name only
+MIN_SUBSTRING_LENGTH = 3
+
+# Substring matches ranked per query, at most; see _search_fts
+FTS_CANDIDATES = 1000
+
+_fts_available = {}
+
+
+def trigrams(text):
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def uses_fts(using=DEFAULT_DB_ALIAS):
+    if using not in _fts_available:
+        connection = connections[using]
+        _fts_available[using] = (
+            connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_available[using]
+
+
+def index_ingredients(ingredients):
+    """(Re)indexes the names of ``ingredients``."""
+    ingredients = [(ingredient.pk, ingredient.name) for ingredient in ingredients]
+    if not ingredients:
+        return
+    if uses_fts():
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pk,) for pk, _ in ingredients])
+            cursor.executemany(f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES (%s, %s)", ingredients)
+        return
+    IngredientTrigram.objects.filter(ingredient_id__in=[pk for pk, _ in ingredients]).delete()
+    IngredientTrigram.objects.bulk_create(
+        IngredientTrigram(ingredient_id=pk, gram=gram) for pk, name in ingredients for gram in trigrams(name)
+    )
+
+
+def unindex_ingredients(ingredient_ids):
+    if uses_fts():
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pk,) for pk in ingredient_ids])
+        return
+    IngredientTrigram.objects.filter(ingredient_id__in=ingredient_ids).delete()
+
+
+def rebuild_index(batch_size=1000):
+    """Drops and rebuilds the whole index, for data written without signals."""
+    if uses_fts():
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    else:
+        IngredientTrigram.objects.all().delete()
+    batch = []
+    for ingredient in Ingredient.objects.only('id', 'name').iterator(chunk_size=batch_size):
+        batch.append(ingredient)
+        if len(batch) == batch_size:
+            index_ingredients(batch)
+            batch = []
+    index_ingredients(batch)
+
+
+def _prefix_matches(query):
+    # Lower-cased by the database on both sides, so they fold alike; the bound sorts after any continuation
+    prefix = Lower(Value(query))
+    return Ingredient.objects.alias(folded_name=Lower('name')).filter(
+        folded_name__gte=prefix, folded_name__lt=Concat(prefix, Value(chr(0x10FFFF))),
+    )
+
+
+def _search_prefix(query, limit):
+    # Walked in folded name index order, so the LIMIT stops the scan
+    return list(_prefix_matches(query).order_by(Lower('name'), 'id').values_list('id', flat=True)[:limit])
+
+
+def _phrase(query):
+    return '"' + query.replace('"', '""') + '"'
+
+
+def _search_fts(query, limit, exclude):
+    # By bm25 rank. Only the first FTS_CANDIDATES matches are ranked, so a common query costs the
+    # same as a rare one; the outer LIMIT keeps SQLite from flattening the subquery and ranking all
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM (SELECT rowid, rank, name FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT %s) "
+            f"ORDER BY rank, name LIMIT %s",
+            [_phrase(query), FTS_CANDIDATES + len(exclude), limit + len(exclude)],
+        )
+        return [pk for pk, in cursor.fetchall() if pk not in exclude][:limit]
+
+
+def _trigram_matches(query):
+    # Ingredients holding every trigram of the query are candidates; icontains weeds out the rest
+    grams = trigrams(query)
+    candidates = (
+        IngredientTrigram.objects.filter(gram__in=grams)
+        .values('ingredient_id')
+        .annotate(hits=Count('id'))
+        .filter(hits=len(grams))
+        .values('ingredient_id')
+    )
+    return Ingredient.objects.filter(pk__in=candidates, name__icontains=query)
+
+
+def _search_trigrams(query, limit, exclude):
+    # Shortest names first
+    matches = _trigram_matches(query).annotate(name_length=Length('name'))
+    ids = matches.order_by('name_length', 'name').values_list('id', flat=True)[:limit + len(exclude)]
+    return [pk for pk in ids if pk not in exclude][:limit]
+
+
+def search_ingredient_ids(query, limit=None):
+    """Returns the ids of ingredients whose name contains ``query``, best matches first."""
+    limit = SEARCH_LIMIT if limit is None else limit
+    query = query.strip()
+    if not query:
+        return []
+    # Names starting with the query come first, straight from the index on the folded names; the
+    # substring index is only asked for the rest, if the prefix matches leave room
+    ids = _search_prefix(query, limit)
+    if len(ids) == limit or len(query) < MIN_SUBSTRING_LENGTH:
+        return ids
+    substring_search = _search_fts if uses_fts() else _search_trigrams
+    return ids + substring_search(query, limit - len(ids), exclude=set(ids))
+
+
+def matching_ingredients(query):
+    """Returns an Ingredient queryset of every match of ``query``, unranked and uncapped, for totals."""
+    query = query.strip()
+    if not query:
+        return Ingredient.objects.none()
+    if len(query) < MIN_SUBSTRING_LENGTH:
+        return _prefix_matches(query)
+    if uses_fts():
+        return Ingredient.objects.filter(
+            pk__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [_phrase(query)])
+        )
+    return _trigram_matches(query)
@@ -0,0 +1,281 @@
+from collections import defaultdict
+from typing import NamedTuple
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import events, inventory, metrics, recipe_book, rollups, sql, versions
+from .models import Ingredient, MenuItem, Purchase, RecipeRequirement
+
+# Upper bounds for a single POS sync request; every unit sold is a Purchase row built in memory
+MAX_BATCH_LINES = 1000
+MAX_LINE_QUANTITY = 1000
+MAX_BATCH_UNITS = 10000
+
+
+class Shortage(NamedTuple):
+    name: str
+    required: object
+    available: object
+
+    def __str__(self):
+        return f"{self.name} (Required: {self.required}, Available: {self.available})"
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(", ".join(str(shortage) for shortage in shortages))
+
+
+class _StockRollback(Exception):
+    pass
+
+
+def stock_shortages(needs):
+    """Returns a Shortage for every ingredient in ``needs`` that cannot be covered."""
+    available = {
+        pk: (name, stock)
+        for pk, name, stock in inventory.with_stock(Ingredient.objects.filter(pk__in=needs)).values_list('id', 'name', 'stock')
+    }
+    shortages = []
+    for ingredient_id, required in needs.items():
+        name, quantity = available.get(ingredient_id, (f"Ingredient #{ingredient_id}", 0))
+        if quantity < required:
+            shortages.append(Shortage(name, required, quantity))
+    return shortages
+
+
+def deduct_stock(needs, prices, note=''):
+    """
+    Takes ``{ingredient_id: quantity}`` out of stock as sale movements in the ledger.
+
+    The movements are inserted with one query and the resulting stock is read back with another
+    (see inventory.py); if any ingredient went below zero the insert is rolled back and
+    InsufficientStock is raised. The number of queries does not depend on len(needs).
+    ``prices`` maps the same ids to price_per_unit, which values the movements.
+    """
+    if not needs:
+        return
+
+    try:
+        with transaction.atomic():
+            if inventory.take(needs, prices, note=note):
+                raise _StockRollback
+    except _StockRollback:
+        raise InsufficientStock(stock_shortages(needs)) from None
+    versions.bump('stock')
+
+
+def recipe_needs(menu_item):
+    """Returns ``{ingredient_id: quantity}`` and ``{ingredient_id: price_per_unit}`` for one serving."""
+    needs, prices = {}, {}
+    requirements = RecipeRequirement.objects.filter(menu_item=menu_item).values_list(
+        'ingredient_id', 'quantity', 'ingredient__price_per_unit'
+    )
+    for ingredient_id, quantity, price_per_unit in requirements:
+        needs[ingredient_id] = quantity
+        prices[ingredient_id] = price_per_unit
+    return needs, prices
+
+
+def record_purchase(menu_item):
+    """
+    Checks and deducts all ingredients for ``menu_item`` and saves the purchase in one transaction.
+    The purchase and the stock movements are inserts; the one row updated in place is the menu
+    item's hourly PurchaseRollup bucket (see rollups.py), which sales of the same item in the same
+    hour all increment.
+    """
+    # Read before the transaction, which holds the write lock on SQLite
+    needs, prices = recipe_needs(menu_item)
+    with transaction.atomic():
+        purchase = Purchase.objects.create(menu_item=menu_item, price=menu_item.price)
+        deduct_stock(needs, prices, note=f"Purchase {purchase.pk}")
+        return purchase
+
+
+class BatchTooLarge(ValueError):
+    pass
+
+
+class BatchLine(NamedTuple):
+    index: int
+    menu_item_id: int
+    quantity: int
+    timestamp: object
+
+
+def _parse_batch_line(index, line, menu_items):
+    if not isinstance(line, dict):
+        raise ValueError("Line must be an object.")
+
+    menu_item_id = line.get('menu_item')
+    if isinstance(menu_item_id, bool) or not isinstance(menu_item_id, int) or menu_item_id not in menu_items:
+        raise ValueError(f"Unknown menu item: {menu_item_id!r}.")
+
+    quantity = line.get('quantity', 1)
+    if isinstance(quantity, bool) or not isinstance(quantity, int) or not 0 < quantity <= MAX_LINE_QUANTITY:
+        raise ValueError(f"Quantity must be an integer between 1 and {MAX_LINE_QUANTITY}.")
+
+    timestamp = line.get('timestamp')
+    if timestamp is None:
+        timestamp = timezone.now()
+    else:
+        timestamp = parse_datetime(timestamp) if isinstance(timestamp, str) else None
+        if timestamp is None:
+            raise ValueError("Timestamp must be an ISO 8601 datetime.")
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp)
+
+    return BatchLine(index, menu_item_id, quantity, timestamp)
+
+
+def _allocate_stock(lines, recipes, stock):
+    """
+    Walks the lines in order against an in-memory copy of ``stock`` and returns the accepted
+    lines, the rejected ones with their shortages, and the summed needs of all accepted lines.
+    """
+    remaining = dict(stock)
+    accepted, rejected = [], []
+    needs = defaultdict(int)
+    for line in lines:
+        line_needs = {
+            ingredient_id: required * line.quantity
+            for ingredient_id, (_, required, _) in recipes[line.menu_item_id].items()
+        }
+        shortages = [
+            Shortage(recipes[line.menu_item_id][ingredient_id][0], required, remaining.get(ingredient_id, 0))
+            for ingredient_id, required in line_needs.items()
+            if remaining.get(ingredient_id, 0) < required
+        ]
+        if shortages:
+            rejected.append((line, shortages))
+            continue
+        for ingredient_id, required in line_needs.items():
+            remaining[ingredient_id] -= required
+            needs[ingredient_id] += required
+        accepted.append(line)
+    return accepted, rejected, dict(needs)
+
+
+def record_purchase_batch(raw_lines, attempts=3):
+    """
+    Records a batch of ``{'menu_item', 'quantity', 'timestamp'}`` sales lines.
+
+    Ingredient needs are summed over the whole batch and deducted with one insert of movements,
+    and the purchases are inserted with bulk_create, so the number of queries depends on the
+    number of distinct ingredients involved, not on the number of sales. Lines are accepted in
+    order until stock runs out; every line gets its own result. Raises BatchTooLarge, before
+    writing anything, if the valid lines add up to more than MAX_BATCH_UNITS units.
+    """
+    results = [None] * len(raw_lines)
+    menu_item_ids = {
+        line.get('menu_item') for line in raw_lines if isinstance(line, dict) and isinstance(line.get('menu_item'), int)
+    }
+    menu_items = MenuItem.objects.in_bulk(menu_item_ids)
+
+    lines = []
+    for index, raw_line in enumerate(raw_lines):
+        try:
+            lines.append(_parse_batch_line(index, raw_line, menu_items))
+        except ValueError as exc:
+            results[index] = {'line': index, 'status': 'rejected', 'error': str(exc)}
+    if sum(line.quantity for line in lines) > MAX_BATCH_UNITS:
+        raise BatchTooLarge(f"A batch may sell at most {MAX_BATCH_UNITS} units in total.")
+
+    recipes = defaultdict(dict)
+    requirements = RecipeRequirement.objects.filter(
+        menu_item_id__in={line.menu_item_id for line in lines}
+    ).values_list('menu_item_id', 'ingredient_id', 'ingredient__name', 'quantity', 'ingredient__price_per_unit')
+    for menu_item_id, ingredient_id, name, quantity, price_per_unit in requirements:
+        recipes[menu_item_id][ingredient_id] = (name, quantity, price_per_unit)
+    prices = {
+        ingredient_id: price_per_unit
+        for recipe in recipes.values()
+        for ingredient_id, (_, _, price_per_unit) in recipe.items()
+    }
+    ingredient_ids = {ingredient_id for recipe in recipes.values() for ingredient_id in recipe}
+
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic():
+                inventory.lock(ingredient_ids)
+                accepted, rejected, needs = _allocate_stock(lines, recipes, inventory.current_stock(ingredient_ids))
+                deduct_stock(needs, prices, note="POS batch")
+                purchases = Purchase.objects.bulk_create(
+                    Purchase(
+                        menu_item=menu_items[line.menu_item_id],
+                        price=menu_items[line.menu_item_id].price,
+                        timestamp=line.timestamp,
+                    )
+                    for line in accepted
+                    for _ in range(line.quantity)
+                )
+                if purchases:
+                    # bulk_create does not send post_save, so fold the batch into the rollup here
+                    rollups.record_purchases(purchases)
+                    transaction.on_commit(
+                        lambda count=len(purchases): metrics.registry.inc('delights_purchases_total', count)
+                    )
+                    versions.bump('purchase')
+                    events.feed.notify_on_commit()
+            break
+        except InsufficientStock:
+            # Stock moved between our read and the insert; try again.
+            if attempt == attempts - 1:
+                accepted, rejected = [], [(line, []) for line in lines]
+
+    for line in accepted:
+        results[line.index] = {'line': line.index, 'status': 'accepted', 'quantity': line.quantity}
+    for line, shortages in rejected:
+        if shortages:
+            error = "Insufficient stock: " + ", ".join(str(shortage) for shortage in shortages)
+        else:
+            error = "Stock changed concurrently, please retry."
+        results[line.index] = {'line': line.index, 'status': 'rejected', 'error': error}
+    return results
+
+
+def replace_recipe(menu_item, lines):
+    """
+    Makes ``{ingredient_id: quantity}`` the whole recipe of ``menu_item`` in one transaction.
+
+    The new lines are diffed against the stored ones and applied as one bulk insert, one bulk
+    update and one delete. Returns ``(created, updated, deleted)`` counts.
+    """
+    with transaction.atomic():
+        existing = {
+            ingredient_id: (pk, quantity)
+            for pk, ingredient_id, quantity in RecipeRequirement.objects.select_for_update()
+            .filter(menu_item=menu_item)
+            .values_list('id', 'ingredient_id', 'quantity')
+        }
+        to_create = [
+            RecipeRequirement(menu_item=menu_item, ingredient_id=ingredient_id, quantity=quantity)
+            for ingredient_id, quantity in lines.items()
+            if ingredient_id not in existing
+        ]
+        to_update = [
+            RecipeRequirement(pk=existing[ingredient_id][0], quantity=quantity)
+            for ingredient_id, quantity in lines.items()
+            if ingredient_id in existing and existing[ingredient_id][1] != quantity
+        ]
+        removed = [pk for ingredient_id, (pk, _) in existing.items() if ingredient_id not in lines]
+
+        RecipeRequirement.objects.bulk_create(to_create)
+        RecipeRequirement.objects.bulk_update(to_update, ['quantity'])
+        if removed:
+            # A plain DELETE; the per-row delete signals would bump the version once per row
+            sql.delete_rows(RecipeRequirement, removed)
+        if to_create or to_update or removed:
+            # Nothing above sends signals; the new version also makes the capacity matrix reload
+            versions.bump('recipe')
+            recipe_book.touch(menu_item.pk)
+    return len(to_create), len(to_update), len(removed)
+
+
+def clone_recipe(source, target):
+    """Replaces the recipe of ``target`` with a copy of the recipe of ``source``."""
+    lines = dict(RecipeRequirement.objects.filter(menu_item=source).values_list('ingredient_id', 'quantity'))
+    return replace_recipe(target, lines)
@@ -0,0 +1,105 @@
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import (capacity, events, inventory, metrics, recipe_book, rollups,
+               search, valuation, versions)
+from .models import (Ingredient, InventoryMovement, MenuItem, Purchase,
+                     RecipeRequirement)
+
+
+def _stored(instance):
+    if instance.pk is None:
+        return None
+    # Fold the pending movements first, so the stored quantity is the current stock
+    inventory.compact([instance.pk])
+    return Ingredient.objects.filter(pk=instance.pk).values_list('price_per_unit', 'quantity').first()
+
+
+@receiver(pre_save, sender=Ingredient)
+def ingredient_changing(sender, instance, **kwargs):
+    stored = _stored(instance)
+    # A quantity left as it was loaded is not an edit; keep the stock, which sales may have moved since
+    if stored and instance.quantity == getattr(instance, '_loaded_quantity', None):
+        instance.quantity = stored[1]
+    # Remember the stored value (the instance may be stale) so the valuation moves by the difference
+    instance._stored_quantity = stored[1] if stored else 0
+    instance._stored_value = valuation.line_value(*stored) if stored else 0
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_deleting(sender, instance, **kwargs):
+    stored = _stored(instance)
+    instance._stored_value = valuation.line_value(*stored) if stored else 0
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, **kwargs):
+    search.index_ingredients([instance])
+    value = valuation.line_value(instance.price_per_unit, instance.quantity)
+    valuation.adjust(value - instance._stored_value)
+    # The quantity went straight into the snapshot; the ledger gets the difference
+    delta = valuation.quantize(instance.quantity) - instance._stored_quantity
+    kind = InventoryMovement.RECEIPT if created else InventoryMovement.ADJUSTMENT
+    inventory.record_folded([(instance, delta, kind)], note='Entered' if created else 'Corrected')
+    instance._loaded_quantity = instance.quantity
+    versions.bump('ingredient', 'stock')
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    search.unindex_ingredients([instance.pk])
+    valuation.adjust(-instance._stored_value)
+    versions.bump('ingredient')
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def menu_item_changed(sender, instance, **kwargs):
+    versions.bump('menuitem')
+
+
+@receiver(post_save, sender=RecipeRequirement)
+def recipe_requirement_saved(sender, instance, created, **kwargs):
+    # Checked right before the bump: the matrix must be current up to the version it replaces
+    was_current = capacity.is_current()
+    capacity.recipe_changed(instance, was_current, versions.bump('recipe'), created=created)
+    previous_menu_item_id = None if created else (getattr(instance, '_loaded', None) or (None,))[0]
+    recipe_book.touch(instance.menu_item_id, previous_menu_item_id)
+    instance._loaded = (instance.menu_item_id, instance.ingredient_id)
+
+
+@receiver(post_delete, sender=RecipeRequirement)
+def recipe_requirement_deleted(sender, instance, **kwargs):
+    was_current = capacity.is_current()
+    capacity.recipe_changed(instance, was_current, versions.bump('recipe'), removed=True)
+    recipe_book.touch(instance.menu_item_id)
+
+
+@receiver(pre_save, sender=Purchase)
+def purchase_pricing(sender, instance, raw=False, **kwargs):
+    if instance.price is None and not raw:
+        instance.price = instance.menu_item.price
+
+
+@receiver(post_save, sender=Purchase)
+def purchase_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if not created and getattr(instance, '_loaded', None):
+        rollups.remove_purchases([instance], keys=[instance._loaded])
+    rollups.record_purchases([instance])
+    if created:
+        transaction.on_commit(lambda: metrics.registry.inc('delights_purchases_total'))
+    instance._loaded = rollups.purchase_key(instance)
+    versions.bump('purchase')
+    events.feed.notify_on_commit()
+
+
+@receiver(post_delete, sender=Purchase)
+def purchase_deleted(sender, instance, **kwargs):
+    key = getattr(instance, '_loaded', None) or rollups.purchase_key(instance)
+    rollups.remove_purchases([instance], keys=[key])
+    versions.bump('purchase')
+    events.feed.notify_on_commit()
@@ -0,0 +1,32 @@
+"""
+Plain SQL for the bulk paths that must not go through the ORM's per-row delete machinery.
+
+QuerySet.delete() loads every row to send pre_delete/post_delete and to follow cascades. The
+archive, the recipe editor and generate_data do their own upkeep for a whole batch instead, so they
+delete with plain DELETE statements through delete_rows().
+"""
+from django.db import connections, router
+
+# Primary keys per DELETE, well under SQLite's 999 parameters
+CHUNK_SIZE = 500
+
+
+def delete_rows(model, pks=None):
+    """
+    Deletes the rows of ``model`` whose primary key is in ``pks`` (every row if None) without
+    signals or cascades; delete dependent rows first. Returns the number of rows deleted.
+    """
+    connection = connections[router.db_for_write(model)]
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        if pks is None:
+            cursor.execute(f"DELETE FROM {table}")
+            return cursor.rowcount
+        pk_column = connection.ops.quote_name(model._meta.pk.column)
+        pks = list(pks)
+        deleted = 0
+        for start in range(0, len(pks), CHUNK_SIZE):
+            chunk = pks[start:start + CHUNK_SIZE]
+            cursor.execute(f"DELETE FROM {table} WHERE {pk_column} IN ({', '.join(['%s'] * len(chunk))})", chunk)
+            deleted += cursor.rowcount
+        return deleted
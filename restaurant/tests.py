@@ -1,8 +1,40 @@
+import asyncio
+import csv
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import Client, TestCase
+from django.core.cache import CacheHandler
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.models import Sum
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from .models import Ingredient, MenuItem, Purchase, RecipeRequirement
+from . import archive, capacity, chart_images
+from . import charts as chart_data
+from . import (events, forecasting, imports, inventory, metrics, profitability,
+               recipe_book, reports, rollups, routers, search, valuation,
+               versions)
+from .middleware import QueryStats
+from .models import (ArchivedPurchase, Ingredient, InventoryMovement, MenuItem,
+                     Purchase, PurchaseRollup, RecipeRequirement,
+                     ReorderForecast)
+from .services import InsufficientStock, record_purchase, replace_recipe
 
 
 class IngredientTests(TestCase):
@@ -27,6 +59,185 @@ class IngredientTests(TestCase):
         self.assertContains(response, 'Cheese')
 
 
+class IngredientImportTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.login(username='testuser', password='password')
+        self.tomato = Ingredient.objects.create(name='Tomato', price_per_unit=0.5, quantity=10)
+
+    def csv_file(self, rows):
+        lines = ['Name,Quantity,Price per Unit'] + [f"{name},{quantity},{price}" for name, quantity, price in rows]
+        return ('\n'.join(lines) + '\n').encode()
+
+    def test_upload_upserts_by_name_and_reports_errors(self):
+        upload = SimpleUploadedFile('delivery.csv', self.csv_file([
+            ('Tomato', 25, '0.60'), ('Basil', 3, '2.25'), ('Flour', 'lots', '1.00'),
+        ]))
+        response = self.client.post(reverse('ingredient-import'), {'file': upload})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result']['created'], 1)
+        self.assertEqual(response.context['result']['updated'], 1)
+        self.assertEqual(response.context['result']['errors'], [{'line': 4, 'errors': {'quantity': ['Enter a number.']}}])
+        self.tomato.refresh_from_db()
+        self.assertEqual((self.tomato.quantity, self.tomato.price_per_unit), (25, Decimal('0.60')))
+        self.assertFalse(Ingredient.objects.filter(name='Flour').exists())
+        # The bulk writes keep the search index and the running valuation up to date
+        self.assertEqual(search.search_ingredient_ids('basil'), [Ingredient.objects.get(name='Basil').pk])
+        self.assertEqual(valuation.inventory_value(), Decimal('21.75'))
+
+    def test_jsonl_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as source:
+            source.write('{"Name": "Tomato", "Quantity": "4", "Price per Unit": "0.5"}\n')
+            source.write('not json\n')
+        self.addCleanup(os.remove, source.name)
+        stderr = StringIO()
+        call_command('import_ingredients', source.name, stdout=StringIO(), stderr=stderr)
+        self.tomato.refresh_from_db()
+        self.assertEqual(self.tomato.quantity, 4)
+        self.assertIn('Line 2', stderr.getvalue())
+
+    def test_repeated_names_are_row_errors(self):
+        rows = [('Tomato', 5, '0.50'), ('Basil', 3, '2.25'), ('Tomato', 7, '0.50'), ('Basil', 4, '2.25')]
+        # The repeats land in a later batch than the rows they repeat
+        result = imports.import_ingredients(imports.read_rows(BytesIO(self.csv_file(rows)), 'csv'), batch_size=2)
+
+        self.assertEqual((result['created'], result['updated'], result['failed']), (1, 1, 2))
+        self.assertEqual(result['errors'], [
+            {'line': 4, 'errors': {'name': ["'Tomato' is already on line 2."]}},
+            {'line': 5, 'errors': {'name': ["'Basil' is already on line 3."]}},
+        ])
+        self.tomato.refresh_from_db()
+        self.assertEqual(self.tomato.quantity, 5)
+        self.assertEqual(Ingredient.objects.get(name='Basil').quantity, 3)
+
+    def test_queries_grow_with_batches_not_rows(self):
+        def import_queries(count, batch_size):
+            rows = [(f"Ingredient {count}-{number}", 1, '1.00') for number in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                imports.import_ingredients(imports.read_rows(BytesIO(self.csv_file(rows)), 'csv'), batch_size=batch_size)
+            return len(queries)
+
+        # Four batches each; 100 rows still fit one ledger insert under SQLite's 999 parameters
+        one_batch = import_queries(50, batch_size=50)
+        self.assertEqual(import_queries(200, batch_size=50), 4 * one_batch)
+        self.assertEqual(import_queries(400, batch_size=100), 4 * one_batch)
+
+    def test_rejects_unknown_columns(self):
+        upload = SimpleUploadedFile('delivery.csv', b'Ingredient,Amount\nTomato,1\n')
+        response = self.client.post(reverse('ingredient-import'), {'file': upload})
+        self.assertFormError(response.context['form'], 'file', 'Missing column(s): Name, Price per Unit, Quantity.')
+
+    def test_rejects_files_that_are_not_utf8(self):
+        latin1 = 'Name,Quantity,Price per Unit\nJalape\u00f1o,2,1.00\n'.encode('latin-1')
+        response = self.client.post(reverse('ingredient-import'), {'file': SimpleUploadedFile('delivery.csv', latin1)})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('not UTF-8', response.context['form'].errors['file'][0])
+
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as source:
+            source.write(latin1)
+        self.addCleanup(os.remove, source.name)
+        with self.assertRaisesMessage(CommandError, 'not UTF-8'):
+            call_command('import_ingredients', source.name, stdout=StringIO(), stderr=StringIO())
+
+    def test_rejects_malformed_csv(self):
+        # A field over the csv module's size limit, as an unclosed quote would produce
+        upload = SimpleUploadedFile('delivery.csv', b'Name,Quantity,Price per Unit\n"Tomato,1,1.00\n' + b'x' * 200000)
+        response = self.client.post(reverse('ingredient-import'), {'file': upload})
+        self.assertIn('not valid CSV', response.context['form'].errors['file'][0])
+
+
+class IngredientSearchTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.login(username='testuser', password='password')
+
+    def create_ingredients(self):
+        for name in ['Cherry Tomato', 'Tomato', 'Sun-dried tomatoes', 'Basil', 'Potato']:
+            Ingredient.objects.create(name=name, price_per_unit=1, quantity=10)
+
+    def assert_search(self, query, expected):
+        ids = search.search_ingredient_ids(query)
+        self.assertEqual([Ingredient.objects.get(pk=pk).name for pk in ids], expected)
+
+    def check_search_backend(self):
+        self.create_ingredients()
+        self.assert_search('tomat', ['Tomato', 'Cherry Tomato', 'Sun-dried tomatoes'])
+        self.assertEqual(
+            {Ingredient.objects.get(pk=pk).name for pk in search.search_ingredient_ids('ATO')},
+            {'Cherry Tomato', 'Tomato', 'Sun-dried tomatoes', 'Potato'},
+        )
+        self.assert_search('ba', ['Basil'])
+        self.assert_search('xyz', [])
+
+        basil = Ingredient.objects.get(name='Basil')
+        basil.name = 'Thai basil'
+        basil.save()
+        self.assert_search('thai', ['Thai basil'])
+        Ingredient.objects.get(name='Potato').delete()
+        self.assertNotIn('Potato', [Ingredient.objects.get(pk=pk).name for pk in search.search_ingredient_ids('ato')])
+
+    def test_fts_search(self):
+        self.assertTrue(search.uses_fts())
+        self.check_search_backend()
+
+    def test_trigram_search(self):
+        with mock.patch('restaurant.search.uses_fts', return_value=False):
+            self.check_search_backend()
+
+    def test_substring_matches_are_ranked_from_a_capped_set(self):
+        self.create_ingredients()
+        with mock.patch('restaurant.search.FTS_CANDIDATES', 2):
+            ids = search.search_ingredient_ids('tomat')
+        # The prefix match is not part of the cap
+        self.assertEqual(len(ids), 3)
+        with mock.patch('restaurant.search.FTS_CANDIDATES', 1):
+            self.assertEqual(len(search.search_ingredient_ids('ato')), 1)
+
+    def test_short_queries_match_the_start_of_a_name(self):
+        self.create_ingredients()
+        self.assert_search('TO', ['Tomato'])
+        self.assert_search('p', ['Potato'])
+        response = self.client.get(reverse('ingredient-list'), {'q': 'to'})
+        self.assertContains(response, 'Searches of 3 or more characters match anywhere in a name')
+
+    def test_list_view_paginates_search_results(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Pepper {i:03}', price_per_unit=1, quantity=10) for i in range(60)
+        )
+        search.index_ingredients(Ingredient.objects.all())
+        response = self.client.get(reverse('ingredient-list'), {'q': 'pepper'})
+        self.assertEqual(len(response.context['ingredients']), 50)
+        self.assertTrue(response.context['is_paginated'])
+        response = self.client.get(reverse('ingredient-list'), {'q': 'pepper', 'page': 2})
+        self.assertEqual(len(response.context['ingredients']), 10)
+
+    def test_total_cost_covers_matches_past_the_limit(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Pepper {i:03}', price_per_unit=2, quantity=10) for i in range(60)
+        )
+        Ingredient.objects.create(name='Salt', price_per_unit=1, quantity=5)
+        search.index_ingredients(Ingredient.objects.all())
+        with mock.patch('restaurant.search.SEARCH_LIMIT', 25):
+            response = self.client.get(reverse('ingredient-list'), {'q': 'pepper'})
+            self.assertEqual(response.context['paginator'].count, 25)
+            self.assertEqual(response.context['inventory_value'], 1200)
+            self.assertContains(response, 'Showing the best 25 matches')
+        self.assertEqual(valuation.value_of(search.matching_ingredients('pe')), 1200)
+        with mock.patch('restaurant.search.uses_fts', return_value=False):
+            search.index_ingredients(Ingredient.objects.all())
+            self.assertEqual(valuation.value_of(search.matching_ingredients('pepper')), 1200)
+
+        # The total is cached until ingredients or stock change
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(valuation.search_value(' pepper '), 1200)
+        self.assertEqual(len(queries), 0)
+        Ingredient.objects.filter(name='Pepper 000').update(quantity=20)
+        versions.bump('stock')
+        self.assertEqual(valuation.search_value('pepper'), 1220)
+
 class MenuItemTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -60,6 +271,143 @@ class RecipeRequirementTests(TestCase):
         self.assertTrue(RecipeRequirement.objects.filter(menu_item=self.menu_item, ingredient=self.ingredient).exists())
 
 
+class RecipeBulkEditTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.login(username='testuser', password='password')
+        self.tomato = Ingredient.objects.create(name='Tomato', price_per_unit=0.5, quantity=1000)
+        self.cheese = Ingredient.objects.create(name='Cheese', price_per_unit=1.5, quantity=1000)
+        self.basil = Ingredient.objects.create(name='Basil', price_per_unit=2, quantity=1000)
+        self.pizza = MenuItem.objects.create(name='Pizza', price=10)
+        self.salad = MenuItem.objects.create(name='Salad', price=7)
+        RecipeRequirement.objects.create(menu_item=self.pizza, ingredient=self.tomato, quantity=2)
+        RecipeRequirement.objects.create(menu_item=self.pizza, ingredient=self.cheese, quantity=1)
+
+    def recipe(self, menu_item):
+        return dict(RecipeRequirement.objects.filter(menu_item=menu_item).values_list('ingredient__name', 'quantity'))
+
+    def post_lines(self, lines, initial=2):
+        data = {'form-TOTAL_FORMS': len(lines), 'form-INITIAL_FORMS': initial, 'form-MIN_NUM_FORMS': 0,
+                'form-MAX_NUM_FORMS': 1000}
+        for index, line in enumerate(lines):
+            for field, value in line.items():
+                data[f'form-{index}-{field}'] = value
+        return self.client.post(reverse('recipe-bulk-edit', args=[self.pizza.id]), data)
+
+    def test_edit_page_lists_the_recipe(self):
+        response = self.client.get(reverse('recipe-bulk-edit', args=[self.pizza.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['form'].forms), 5)  # Two rows and three blank ones
+
+    def test_saves_the_diff(self):
+        recipe_version = versions.get_version('recipe')
+        response = self.post_lines([
+            {'ingredient': self.tomato.id, 'quantity': '3'},
+            {'ingredient': self.cheese.id, 'quantity': '1', 'DELETE': 'on'},
+            {'ingredient': self.basil.id, 'quantity': '0.25'},
+            {'ingredient': '', 'quantity': ''},
+        ])
+        self.assertRedirects(response, reverse('recipe-requirement-detail', args=[self.pizza.id]))
+        self.assertEqual(self.recipe(self.pizza), {'Tomato': 3, 'Basil': Decimal('0.25')})
+        self.assertNotEqual(versions.get_version('recipe'), recipe_version)
+
+    def test_rejects_an_ingredient_listed_twice(self):
+        response = self.post_lines([
+            {'ingredient': self.tomato.id, 'quantity': '3'},
+            {'ingredient': self.cheese.id, 'quantity': '1'},
+            {'ingredient': self.tomato.id, 'quantity': '4'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['form'].non_form_errors(), ["Each ingredient can only be listed once."])
+        self.assertEqual(self.recipe(self.pizza), {'Tomato': 2, 'Cheese': 1})
+
+    def test_queries_do_not_grow_with_the_recipe(self):
+        ingredients = [Ingredient.objects.create(name=f"Spice {number}", price_per_unit=1, quantity=1) for number in range(30)]
+        with CaptureQueriesContext(connection) as small:
+            replace_recipe(self.salad, {ingredient.id: 1 for ingredient in ingredients[:2]})
+        with CaptureQueriesContext(connection) as large:
+            replace_recipe(self.salad, {ingredient.id: 2 for ingredient in ingredients[1:]})
+        self.assertEqual(len(small), len(large) - 2)  # The second call also updates and deletes
+
+    def test_clone_replaces_the_target_recipe(self):
+        RecipeRequirement.objects.create(menu_item=self.salad, ingredient=self.basil, quantity=5)
+        response = self.client.post(reverse('recipe-clone', args=[self.pizza.id]), {'target': self.salad.id})
+        self.assertRedirects(response, reverse('recipe-bulk-edit', args=[self.salad.id]))
+        self.assertEqual(self.recipe(self.salad), {'Tomato': 2, 'Cheese': 1})
+
+
+class RecipeBookTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='staff', password='password', is_staff=True)
+        self.client.login(username='staff', password='password')
+        self.menu_items = []
+        for number in range(5):
+            menu_item = MenuItem.objects.create(name=f"Dish {number}", price=10)
+            for ingredient_number in range(3):
+                ingredient = Ingredient.objects.create(
+                    name=f"Ingredient {number}-{ingredient_number}", price_per_unit=1, quantity=100
+                )
+                RecipeRequirement.objects.create(menu_item=menu_item, ingredient=ingredient, quantity=1)
+            self.menu_items.append(menu_item)
+
+    def restaurant_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('menu-with-ingredients'))
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries.captured_queries if 'restaurant_' in query['sql']]
+
+    def test_cold_page_has_no_n_plus_one(self):
+        response, queries = self.restaurant_queries()
+        self.assertContains(response, 'Ingredient 4-2')
+        self.assertEqual(len(queries), 3)  # Menu item index, menu items, requirements with their ingredients
+
+    def test_warm_page_runs_no_queries(self):
+        self.restaurant_queries()
+        response, queries = self.restaurant_queries()
+        self.assertEqual(queries, [])
+        self.assertContains(response, 'Dish 4')
+
+    def test_recipe_change_renders_only_its_card(self):
+        self.restaurant_queries()
+        requirement = RecipeRequirement.objects.filter(menu_item=self.menu_items[2]).first()
+        requirement.quantity = 7
+        requirement.save()
+
+        with mock.patch('restaurant.recipe_book.render_to_string', wraps=recipe_book.render_to_string) as render:
+            response, _ = self.restaurant_queries()
+        self.assertEqual(render.call_count, 1)
+        self.assertContains(response, '7.00')
+
+    def test_ingredient_change_renders_only_the_cards_that_show_it(self):
+        self.restaurant_queries()
+        ingredient = Ingredient.objects.get(name='Ingredient 1-0')
+        ingredient.name = 'Heirloom Tomato'
+        ingredient.save()
+        Ingredient.objects.create(name='Unused', price_per_unit=1, quantity=1)
+
+        with mock.patch('restaurant.recipe_book.render_to_string', wraps=recipe_book.render_to_string) as render:
+            response, _ = self.restaurant_queries()
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(render.call_args.args[1]['menu_item'], self.menu_items[1])
+        self.assertContains(response, 'Heirloom Tomato')
+
+    def test_long_menu_stays_warm(self):
+        # More cards than the default cache holds entries; none may be evicted, nor anything else
+        MenuItem.objects.bulk_create(MenuItem(name=f"Extra {number}", price=5) for number in range(600))
+        versions.bump('menuitem')  # bulk_create sends no signals
+        purchase_version = versions.get_version('purchase')
+        self.restaurant_queries()
+
+        with mock.patch('restaurant.recipe_book.render_to_string', wraps=recipe_book.render_to_string) as render:
+            response, queries = self.restaurant_queries()
+        self.assertEqual(queries, [])
+        self.assertEqual(render.call_count, 0)
+        self.assertContains(response, 'Extra 599')
+        self.assertEqual(versions.get_version('purchase'), purchase_version)
+
+
 class PurchaseTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -74,8 +422,7 @@ class PurchaseTests(TestCase):
             'menu_item': self.menu_item.id,
         })
         self.assertEqual(response.status_code, 302)  # Redirect after purchase
-        self.ingredient.refresh_from_db()
-        self.assertEqual(self.ingredient.quantity, 995)  # Deducted 5 from stock
+        self.assertEqual(inventory.current_stock([self.ingredient.pk]), {self.ingredient.pk: 995})  # Deducted 5
 
     def test_purchase_insufficient_stock(self):
         self.ingredient.quantity = 3  # Not enough stock
@@ -88,6 +435,336 @@ class PurchaseTests(TestCase):
         self.assertEqual(response.status_code, 200)  # After redirect, it should load the page
         self.assertContains(response, 'Insufficient stock')  # Check for the error message
 
+    def test_purchase_insufficient_stock_deducts_nothing(self):
+        cheese = Ingredient.objects.create(name='Cheese', price_per_unit=1.5, quantity=1)
+        RecipeRequirement.objects.create(menu_item=self.menu_item, ingredient=cheese, quantity=2)
+
+        with self.assertRaises(InsufficientStock) as ctx:
+            record_purchase(self.menu_item)
+
+        self.assertEqual([shortage.name for shortage in ctx.exception.shortages], ['Cheese'])
+        stock = inventory.current_stock([self.ingredient.pk, cheese.pk])
+        self.assertEqual(stock[self.ingredient.pk], 1000)  # Tomato was not deducted either
+        self.assertEqual(stock[cheese.pk], 1)
+        self.assertFalse(Purchase.objects.exists())
+        self.assertFalse(InventoryMovement.objects.filter(kind=InventoryMovement.SALE).exists())
+
+    def test_purchase_query_count_independent_of_recipe_size(self):
+        salad = MenuItem.objects.create(name='Salad', price=7.0)
+        for i in range(10):
+            ingredient = Ingredient.objects.create(name=f'Leaf {i}', price_per_unit=0.1, quantity=100)
+            RecipeRequirement.objects.create(menu_item=salad, ingredient=ingredient, quantity=1)
+
+        with CaptureQueriesContext(connection) as small_recipe:
+            record_purchase(self.menu_item)
+        with CaptureQueriesContext(connection) as large_recipe:
+            record_purchase(salad)
+
+        self.assertEqual(len(small_recipe), len(large_recipe))
+        leaf = Ingredient.objects.get(name='Leaf 3')
+        self.assertEqual(inventory.current_stock([leaf.pk]), {leaf.pk: 99})
+
+class InventoryLedgerTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.login(username='testuser', password='password')
+        self.tomato = Ingredient.objects.create(name='Tomato', price_per_unit=0.5, quantity=100)
+        self.pizza = MenuItem.objects.create(name='Pizza', price=10.0)
+        RecipeRequirement.objects.create(menu_item=self.pizza, ingredient=self.tomato, quantity=5)
+
+    def test_sale_only_inserts(self):
+        with CaptureQueriesContext(connection) as queries:
+            purchase = record_purchase(self.pizza)
+        updated = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertFalse([sql for sql in updated if 'restaurant_ingredient' in sql or 'inventoryvaluation' in sql])
+
+        sale = InventoryMovement.objects.get(kind=InventoryMovement.SALE)
+        self.assertEqual((sale.quantity, sale.value, sale.folded), (Decimal('-5'), Decimal('-2.5'), False))
+        self.assertEqual(sale.note, f"Purchase {purchase.pk}")
+        self.assertEqual(Ingredient.objects.get(pk=self.tomato.pk).quantity, 100)  # The snapshot
+        self.assertEqual(inventory.current_stock([self.tomato.pk]), {self.tomato.pk: 95})
+        self.assertEqual(valuation.inventory_value(), Decimal('47.5'))
+
+    def test_compaction_folds_pending_movements(self):
+        for _ in range(3):
+            record_purchase(self.pizza)
+        call_command('compact_inventory', '--batch-size', '2', stdout=StringIO())
+
+        self.assertEqual(Ingredient.objects.get(pk=self.tomato.pk).quantity, 85)
+        self.assertFalse(inventory.pending().exists())
+        self.assertEqual(inventory.current_stock([self.tomato.pk]), {self.tomato.pk: 85})
+        self.assertEqual(valuation.inventory_value(), Decimal('42.5'))
+        self.assertEqual(valuation.rebuild(), Decimal('42.5'))
+        self.assertEqual(inventory.compact(), 0)
+
+    def test_saving_a_stale_copy_keeps_the_stock(self):
+        stale = Ingredient.objects.get(pk=self.tomato.pk)
+        record_purchase(self.pizza)
+        stale.price_per_unit = 1
+        stale.save()
+
+        self.assertEqual(inventory.current_stock([self.tomato.pk]), {self.tomato.pk: 95})
+        self.assertEqual(valuation.inventory_value(), Decimal('95'))
+        self.assertFalse(InventoryMovement.objects.filter(kind=InventoryMovement.ADJUSTMENT).exists())
+
+    def test_edit_form_sets_the_current_stock(self):
+        record_purchase(self.pizza)
+        url = reverse('ingredient-update', args=[self.tomato.pk])
+        self.assertEqual(self.client.get(url).context['form'].initial['quantity'], 95)
+
+        self.client.post(url, {'name': 'Tomato', 'price_per_unit': '0.50', 'quantity': '90'})
+
+        self.assertEqual(inventory.current_stock([self.tomato.pk]), {self.tomato.pk: 90})
+        adjustment = InventoryMovement.objects.get(kind=InventoryMovement.ADJUSTMENT)
+        self.assertEqual((adjustment.quantity, adjustment.folded), (Decimal('-5'), True))
+        self.assertEqual(valuation.inventory_value(), Decimal('45'))
+        # Opening receipt, the sale and the correction add up to the stock
+        self.assertEqual(InventoryMovement.objects.aggregate(total=Sum('quantity'))['total'], 90)
+
+    def test_stock_check_counts_sales_not_folded_yet(self):
+        # Another till's sale, committed but not compacted: the snapshot alone would still show 100
+        InventoryMovement.objects.create(ingredient=self.tomato, kind=InventoryMovement.SALE, quantity=-97, value=0)
+
+        with self.assertRaises(InsufficientStock) as ctx:
+            record_purchase(self.pizza)
+
+        self.assertEqual(ctx.exception.shortages[0].available, 3)
+        self.assertFalse(Purchase.objects.exists())
+        self.assertEqual(InventoryMovement.objects.filter(kind=InventoryMovement.SALE).count(), 1)
+
+
+class PurchaseBatchTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.login(username='testuser', password='password')
+        self.tomato = Ingredient.objects.create(name='Tomato', price_per_unit=0.5, quantity=20)
+        self.cheese = Ingredient.objects.create(name='Cheese', price_per_unit=1.5, quantity=100)
+        self.pizza = MenuItem.objects.create(name='Pizza', price=10.0)
+        self.salad = MenuItem.objects.create(name='Salad', price=6.0)
+        RecipeRequirement.objects.create(menu_item=self.pizza, ingredient=self.tomato, quantity=5)
+        RecipeRequirement.objects.create(menu_item=self.pizza, ingredient=self.cheese, quantity=2)
+        RecipeRequirement.objects.create(menu_item=self.salad, ingredient=self.tomato, quantity=3)
+
+    def post_batch(self, lines):
+        return self.client.post(
+            reverse('purchase-batch'), data=json.dumps({'lines': lines}), content_type='application/json'
+        )
+
+    def test_batch_accepts_and_rejects_per_line(self):
+        response = self.post_batch([
+            {'menu_item': self.pizza.id, 'quantity': 3, 'timestamp': '2026-01-05T12:30:00Z'},
+            {'menu_item': self.salad.id, 'quantity': 2},  # Needs 6 tomatoes, only 5 left
+            {'menu_item': 9999},
+            {'menu_item': self.salad.id, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual([result['status'] for result in payload['results']],
+                         ['accepted', 'rejected', 'rejected', 'accepted'])
+        self.assertIn('Tomato', payload['results'][1]['error'])
+        self.assertEqual(payload['accepted'], 2)
+
+        stock = inventory.current_stock([self.tomato.pk, self.cheese.pk])
+        self.assertEqual(stock[self.tomato.pk], 2)  # 20 - 3 * 5 - 3
+        self.assertEqual(stock[self.cheese.pk], 94)
+        self.assertEqual(Purchase.objects.filter(menu_item=self.pizza).count(), 3)
+        self.assertEqual(
+            Purchase.objects.filter(menu_item=self.pizza).first().timestamp.isoformat(), '2026-01-05T12:30:00+00:00'
+        )
+
+    def test_batch_query_count_independent_of_sales(self):
+        Ingredient.objects.filter(pk=self.tomato.pk).update(quantity=1000)
+        self.post_batch([{'menu_item': self.salad.id}, {'menu_item': self.pizza.id}])  # Creates the rollup buckets
+        with CaptureQueriesContext(connection) as small_batch:
+            self.post_batch([{'menu_item': self.salad.id}, {'menu_item': self.pizza.id}])
+        with CaptureQueriesContext(connection) as large_batch:
+            self.post_batch([{'menu_item': self.salad.id}, {'menu_item': self.pizza.id}] * 2)
+        self.assertEqual(len(small_batch), len(large_batch))
+
+    def test_fully_rejected_batch_changes_no_version(self):
+        before = versions.get_versions('purchase', 'stock')
+        with mock.patch('restaurant.services.events.feed.notify_on_commit') as notify:
+            response = self.post_batch([{'menu_item': self.salad.id, 'quantity': 7}, {'menu_item': 9999}])
+        self.assertEqual(response.json()['accepted'], 0)
+        self.assertEqual(versions.get_versions('purchase', 'stock'), before)
+        notify.assert_not_called()
+
+    def test_batch_rejects_too_many_units(self):
+        Ingredient.objects.filter(pk=self.tomato.pk).update(quantity=100000)
+        response = self.post_batch([{'menu_item': self.salad.id, 'quantity': 1000}] * 11)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('10000 units', response.json()['error'])
+        self.assertFalse(Purchase.objects.exists())
+
+    def test_batch_rejects_malformed_body(self):
+        response = self.client.post(reverse('purchase-batch'), data='not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+class PurchaseRollupTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='password', is_staff=True)
+        self.client.login(username='testuser', password='password')
+        self.burger = MenuItem.objects.create(name='Burger', price=8.0)
+        self.fries = MenuItem.objects.create(name='Fries', price=3.0)
+
+    def test_rollup_follows_purchases(self):
+        noon = datetime(2026, 3, 1, 12, 15, tzinfo=dt_timezone.utc)
+        Purchase.objects.create(menu_item=self.burger, timestamp=noon)
+        Purchase.objects.create(menu_item=self.burger, timestamp=noon + timedelta(minutes=30))
+        moved = Purchase.objects.create(menu_item=self.fries, timestamp=noon)
+
+        moved = Purchase.objects.get(pk=moved.pk)
+        moved.timestamp = noon + timedelta(hours=1)
+        moved.save()
+        Purchase.objects.filter(menu_item=self.burger).first().delete()
+
+        self.assertEqual(
+            list(PurchaseRollup.objects.filter(units__gt=0).order_by('hour').values_list('menu_item__name', 'units')),
+            [('Burger', 1), ('Fries', 1)],
+        )
+        self.assertEqual(rollups.verify(), [])
+        self.assertEqual(rollups.totals(), (2, 11))
+
+    def test_revenue_chart_reads_rollup(self):
+        for _ in range(3):
+            Purchase.objects.create(menu_item=self.burger)
+        with CaptureQueriesContext(connection) as few_purchases:
+            response = self.client.get(reverse('revenue-chart'))
+        self.assertEqual([Decimal(value) for value in response.json()['data']], [24, 0])
+
+        for _ in range(20):
+            Purchase.objects.create(menu_item=self.fries)
+        with CaptureQueriesContext(connection) as many_purchases:
+            self.client.get(reverse('revenue-chart'))
+        self.assertEqual(len(few_purchases), len(many_purchases))
+
+    def test_purchase_list_totals_are_cached(self):
+        Purchase.objects.create(menu_item=self.burger)
+        self.client.get(reverse('purchase-list'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('purchase-list'))
+        self.assertEqual(response.context['total_revenue'], 8)
+        self.assertFalse([query for query in queries if 'restaurant_purchaserollup' in query['sql']])
+
+    def test_rollup_sales_command(self):
+        Purchase.objects.create(menu_item=self.burger)
+        PurchaseRollup.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command('rollup_sales', verify=True, stderr=StringIO())
+
+        call_command('rollup_sales', stdout=StringIO())
+        call_command('rollup_sales', verify=True, stdout=StringIO())
+        self.assertEqual(rollups.totals(), (1, 8))
+
+    def test_price_change_keeps_sold_revenue(self):
+        Purchase.objects.create(menu_item=self.burger)
+        self.burger.price = 10
+        self.burger.save()
+        Purchase.objects.create(menu_item=self.burger)
+
+        self.assertEqual(rollups.verify(), [])
+        self.assertEqual(rollups.totals(), (2, 18))
+        rollups.rebuild()
+        self.assertEqual(rollups.totals(), (2, 18))
+
+class PurchaseArchiveTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='password', is_staff=True)
+        self.client.login(username='testuser', password='password')
+        self.burger = MenuItem.objects.create(name='Burger', price=8.0)
+        self.old = timezone.now() - timedelta(days=400)
+        self.old_purchases = [Purchase.objects.create(menu_item=self.burger, timestamp=self.old) for _ in range(3)]
+        self.recent = Purchase.objects.create(menu_item=self.burger)
+
+    def test_archiving_keeps_totals(self):
+        call_command('archive_purchases', days=365, batch_size=2, stdout=StringIO())
+        self.assertEqual(list(Purchase.objects.values_list('id', flat=True)), [self.recent.id])
+        self.assertEqual(ArchivedPurchase.objects.count(), 3)
+        self.assertEqual(rollups.totals(), (4, 32))
+        self.assertEqual(rollups.verify(), [])
+
+        # Live and archived purchases keep the price they were sold at
+        self.burger.price = 10
+        self.burger.save()
+        rollups.rebuild()
+        self.assertEqual(rollups.totals(), (4, 32))
+
+    def test_price_change_before_archiving_keeps_totals(self):
+        self.burger.price = 10
+        self.burger.save()
+        archive.archive_purchases(archive.archive_cutoff(365))
+
+        self.assertEqual(list(ArchivedPurchase.objects.values_list('price', flat=True)), [8, 8, 8])
+        self.assertEqual(rollups.verify(), [])
+        rollups.rebuild()
+        self.assertEqual(rollups.totals(), (4, 32))
+
+    def test_rebuild_merges_buckets_split_between_tables(self):
+        archive.archive_purchases(archive.archive_cutoff(365))
+        Purchase.objects.create(menu_item=self.burger, timestamp=self.old)  # Synced late
+        rollups.rebuild()
+        self.assertEqual(PurchaseRollup.objects.get(hour=rollups.hour_bucket(self.old)).units, 4)
+        self.assertEqual(rollups.verify(), [])
+
+    def test_export_includes_archived_purchases_on_request(self):
+        archive.archive_purchases(archive.archive_cutoff(365))
+
+        def exported_ids(url):
+            rows = list(csv.reader(b''.join(self.client.get(url).streaming_content).decode().splitlines()))
+            return [int(row[0]) for row in rows[1:]]
+
+        self.assertEqual(exported_ids(reverse('purchase-csv')), [self.recent.id])
+        self.assertEqual(
+            exported_ids(reverse('purchase-csv') + '?archived=1'),
+            [purchase.id for purchase in self.old_purchases] + [self.recent.id],
+        )
+
+class PurchaseListPaginationTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='password', is_staff=True)
+        self.client.login(username='testuser', password='password')
+        burger = MenuItem.objects.create(name='Burger', price=8.0)
+        start = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        # Pairs of purchases share a timestamp, so the id has to break ties
+        Purchase.objects.bulk_create(
+            Purchase(menu_item=burger, price=burger.price, timestamp=start + timedelta(minutes=i // 2)) for i in range(120)
+        )
+        rollups.rebuild()
+        rollups.purchase_count()  # Warm the cached counter
+        self.expected = list(Purchase.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+
+    def test_keyset_pages_cover_every_purchase_once(self):
+        seen = []
+        params = {}
+        page_queries = []
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('purchase-list'), params)
+            page_queries.append(len(queries))
+            seen.extend(purchase.id for purchase in response.context['purchases'])
+            if not response.context['older_cursor']:
+                break
+            params = {'before': response.context['older_cursor']}
+
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(set(page_queries)), 1)  # Deep pages cost the same as the first
+        self.assertEqual(response.context['total_purchases'], 120)
+
+    def test_newer_cursor_returns_previous_page(self):
+        first = self.client.get(reverse('purchase-list'))
+        second = self.client.get(reverse('purchase-list'), {'before': first.context['older_cursor']})
+        back = self.client.get(reverse('purchase-list'), {'after': second.context['newer_cursor']})
+        self.assertEqual(
+            [purchase.id for purchase in back.context['purchases']],
+            [purchase.id for purchase in first.context['purchases']],
+        )
+        self.assertIsNone(first.context['newer_cursor'])
+
 class InventoryAndRevenueTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -109,8 +786,627 @@ class InventoryAndRevenueTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.context['total_revenue'], total_revenue)
 
-class IngredientPDFViewTest(TestCase):
+    def test_valuation_tracks_ingredient_writes_and_purchases(self):
+        bread = Ingredient.objects.create(name='Bread', price_per_unit=0.5, quantity=10)
+        RecipeRequirement.objects.create(menu_item=self.menu_item, ingredient=self.ingredient, quantity=2)
+        RecipeRequirement.objects.create(menu_item=self.menu_item, ingredient=bread, quantity=1)
+        self.ingredient.price_per_unit = 2
+        self.ingredient.save()
+        record_purchase(self.menu_item)
+        Ingredient.objects.get(pk=bread.pk).delete()
+
+        expected = valuation.value_of(Ingredient.objects.all())
+        self.assertEqual(expected, Decimal('1996'))
+        self.assertEqual(valuation.inventory_value(), expected)
+        self.assertEqual(valuation.rebuild(), expected)
+
+    def test_unfiltered_inventory_value_does_not_scan_ingredients(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('ingredient-list'))
+        self.assertEqual(response.context['inventory_value'], Decimal('1500'))
+        # Only the pending ledger movements are summed, not price_per_unit * quantity over every ingredient
+        self.assertFalse([query for query in queries if '"price_per_unit" *' in query['sql']])
+
+    def test_search_values_only_the_matches(self):
+        Ingredient.objects.create(name='Bread', price_per_unit=0.5, quantity=10)
+        response = self.client.get(reverse('ingredient-list'), {'q': 'Bre'})
+        self.assertEqual(response.context['inventory_value'], Decimal('5'))
+
+class MenuProfitabilityTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.login(username='testuser', password='password')
+        self.cheese = Ingredient.objects.create(name='Cheese', price_per_unit=1.5, quantity=100)
+        self.bun = Ingredient.objects.create(name='Bun', price_per_unit=0.5, quantity=100)
+        self.burger = MenuItem.objects.create(name='Burger', price=8.0)
+        self.water = MenuItem.objects.create(name='Water', price=0)
+        RecipeRequirement.objects.create(menu_item=self.burger, ingredient=self.cheese, quantity=2)
+        RecipeRequirement.objects.create(menu_item=self.burger, ingredient=self.bun, quantity=1)
+
+    def test_costs_and_margins_in_one_query(self):
+        with self.assertNumQueries(1):
+            report = profitability.menu_profitability()
+        burger, water = report
+        self.assertEqual(burger['recipe_cost'], Decimal('3.5'))
+        self.assertEqual(burger['margin'], Decimal('4.5'))
+        self.assertEqual(burger['margin_percent'], Decimal('56.25'))
+        self.assertEqual(water['recipe_cost'], 0)
+        self.assertIsNone(water['margin_percent'])
+
+    def test_json_endpoint_is_cached_until_a_price_changes(self):
+        self.client.get(reverse('menu-profitability-json'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('menu-profitability-json'))
+        self.assertFalse([query for query in queries if 'restaurant_' in query['sql']])
+
+        self.cheese.price_per_unit = 2
+        self.cheese.save()
+        response = self.client.get(reverse('menu-profitability-json'))
+        burger = response.json()['menu_items'][0]
+        self.assertEqual(Decimal(burger['recipe_cost']), Decimal('4.5'))
+        self.assertEqual(Decimal(burger['margin_percent']), Decimal('43.75'))
+
+    def test_page_lists_menu_items(self):
+        response = self.client.get(reverse('menu-profitability'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Burger')
+        self.assertContains(response, '56.25%')
+
+class ServingsAvailableTests(TransactionTestCase):
+    def setUp(self):
+        capacity._matrix = None
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.login(username='testuser', password='password')
+        self.cheese = Ingredient.objects.create(name='Cheese', price_per_unit=1.5, quantity=10)
+        self.flour = Ingredient.objects.create(name='Flour', price_per_unit=0.5, quantity=1)
+        self.pizza = MenuItem.objects.create(name='Pizza', price=10.0)
+        self.salad = MenuItem.objects.create(name='Salad', price=6.0)
+        self.cheese_need = RecipeRequirement.objects.create(menu_item=self.pizza, ingredient=self.cheese, quantity=3)
+        RecipeRequirement.objects.create(menu_item=self.pizza, ingredient=self.flour, quantity=0.1)
+
+    def servings(self):
+        return {item['name']: item['servings'] for item in capacity.servings_available()}
+
+    def test_minimum_over_the_recipe(self):
+        # 10 // 3 cheese and 1 // 0.1 flour (exact, not 9 from float rounding); no recipe for salad
+        self.assertEqual(self.servings(), {'Pizza': 3, 'Salad': None})
+        self.flour.quantity = 0.2
+        self.flour.save()
+        self.assertEqual(self.servings(), {'Pizza': 2, 'Salad': None})
+
+    def test_recipe_edits_update_the_matrix_in_place(self):
+        matrix = capacity.recipe_matrix()
+        self.cheese_need.quantity = 5
+        self.cheese_need.save()
+        RecipeRequirement.objects.create(menu_item=self.salad, ingredient=self.cheese, quantity=4)
+        RecipeRequirement.objects.get(menu_item=self.pizza, ingredient=self.flour).delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            servings = self.servings()
+        self.assertEqual(servings, {'Pizza': 2, 'Salad': 2})
+        self.assertIs(capacity.recipe_matrix(), matrix)
+        self.assertFalse([query for query in queries if 'restaurant_reciperequirement' in query['sql']])
+
+        capacity._matrix = None  # Same answer from a matrix loaded from scratch
+        self.assertEqual(self.servings(), servings)
+
+    def test_changes_from_elsewhere_reload_the_matrix(self):
+        matrix = capacity.recipe_matrix()
+        RecipeRequirement.objects.filter(menu_item=self.pizza, ingredient=self.flour).update(quantity=0.5)
+        versions.bump('recipe')
+        self.assertEqual(self.servings(), {'Pizza': 2, 'Salad': None})
+        self.assertIsNot(capacity.recipe_matrix(), matrix)
+
+    def test_change_from_elsewhere_before_ours_applies_reloads_the_matrix(self):
+        matrix = capacity.recipe_matrix()
+        bump = versions.bump
+
+        def bump_then_other_worker(*names):
+            version = bump(*names)
+            # Another process changes a recipe and bumps once this transaction has committed
+            transaction.on_commit(lambda: (
+                RecipeRequirement.objects.filter(menu_item=self.pizza, ingredient=self.flour).update(quantity=1),
+                bump('recipe'),
+            ))
+            return version
+
+        with mock.patch('restaurant.signals.versions.bump', side_effect=bump_then_other_worker):
+            with transaction.atomic():
+                self.cheese_need.quantity = 5
+                self.cheese_need.save()
+        self.assertTrue(matrix.stale)
+        self.assertEqual(self.servings(), {'Pizza': 1, 'Salad': None})
+
+    def test_endpoint_and_chart(self):
+        response = self.client.get(reverse('servings-available'))
+        self.assertEqual(response.json()['menu_items'][0], {'id': self.pizza.pk, 'name': 'Pizza', 'servings': 3})
+        chart = self.client.get(reverse('capacity-chart')).json()
+        self.assertEqual(chart['labels'], ['Pizza'])
+        self.assertEqual(chart['data'], [3])
+
+class ReorderForecastTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.login(username='testuser', password='password')
+        self.cheese = Ingredient.objects.create(name='Cheese', price_per_unit=1.5, quantity=10)
+        self.salt = Ingredient.objects.create(name='Salt', price_per_unit=0.1, quantity=50)
+        self.burger = MenuItem.objects.create(name='Burger', price=8.0)
+        RecipeRequirement.objects.create(menu_item=self.burger, ingredient=self.cheese, quantity=2)
+        self.today = timezone.localdate()
+        noon = timezone.make_aware(datetime.combine(self.today, datetime.min.time())) + timedelta(hours=12)
+        for days_ago, units in ((2, 1), (1, 3)):
+            for _ in range(units):
+                Purchase.objects.create(menu_item=self.burger, timestamp=noon - timedelta(days=days_ago))
+
+    def test_daily_consumption_from_rollups(self):
+        history = forecasting.daily_consumption([self.cheese.pk, self.salt.pk], self.today - timedelta(days=3), 3)
+        self.assertEqual(history.tolist(), [[0, 0], [2, 0], [6, 0]])
+
+    def test_exponential_smoothing_matches_the_recursion(self):
+        history = np.array([[4.0, 0.0], [2.0, 1.0], [6.0, 3.0], [5.0, 0.0]])
+        expected = history[0]
+        for row in history[1:]:
+            expected = 0.3 * row + 0.7 * expected
+        np.testing.assert_allclose(forecasting.exponential_smoothing(history, 0.3), expected)
+
+    def test_command_stores_the_plan(self):
+        call_command(
+            'forecast_demand', '--method', 'sma', '--window', '2', '--history', '3', '--horizon', '7',
+            stdout=StringIO(),
+        )
+        cheese = ReorderForecast.objects.get(ingredient=self.cheese)
+        # 4 a day over 7 days, plus 20% safety stock, minus the 10 on hand
+        self.assertEqual(cheese.forecast, Decimal('28'))
+        self.assertEqual(cheese.reorder_quantity, Decimal('23.6'))
+        self.assertEqual(ReorderForecast.objects.get(ingredient=self.salt).reorder_quantity, 0)
+
+        response = self.client.get(reverse('reorder-list'))
+        self.assertEqual([forecast.ingredient.name for forecast in response.context['forecasts']], ['Cheese', 'Salt'])
+
+    def test_invalid_options(self):
+        with self.assertRaises(CommandError):
+            call_command('forecast_demand', '--alpha', '0', stdout=StringIO())
+
+class ChartCacheTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='password', is_staff=True)
+        self.client.login(username='testuser', password='password')
+        self.cheese = Ingredient.objects.create(name='Cheese', price_per_unit=1.5, quantity=100)
+        self.burger = MenuItem.objects.create(name='Burger', price=8.0)
+        RecipeRequirement.objects.create(menu_item=self.burger, ingredient=self.cheese, quantity=2)
+
+    def test_repeated_chart_requests_are_cache_hits(self):
+        self.client.get(reverse('quantity-chart'))
+        before = chart_data.cache_stats()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('quantity-chart'))
+        after = chart_data.cache_stats()
+
+        self.assertEqual(response.json()['labels'], ['Cheese'])
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertEqual(after['misses'], before['misses'])
+        self.assertFalse([query for query in queries if 'restaurant_' in query['sql']])
+
+    def test_writes_only_invalidate_dependent_charts(self):
+        for url in ('quantity-chart', 'revenue-chart', 'inventory-chart'):
+            self.client.get(reverse(url))
+
+        tomato = Ingredient.objects.create(name='Tomato', price_per_unit=0.5, quantity=50)
+        RecipeRequirement.objects.create(menu_item=self.burger, ingredient=tomato, quantity=1)
+
+        before = chart_data.cache_stats()
+        self.assertEqual(self.client.get(reverse('quantity-chart')).json()['labels'], ['Cheese', 'Tomato'])
+        self.client.get(reverse('revenue-chart'))
+        self.assertEqual(self.client.get(reverse('inventory-chart')).json()['labels'], ['Cheese', 'Tomato'])
+        after = chart_data.cache_stats()
+        self.assertEqual(after['misses'] - before['misses'], 2)  # Revenue chart was still cached
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_stock_deduction_invalidates_inventory_chart(self):
+        self.client.get(reverse('inventory-chart'))
+        record_purchase(self.burger)
+        self.assertEqual(self.client.get(reverse('inventory-chart')).json()['data'], ['98.00'])
+
+    def test_cache_stats_endpoint(self):
+        self.client.get(reverse('inventory-chart'))
+        response = self.client.get(reverse('chart-cache-stats'))
+        self.assertEqual(set(response.json()), {'hits', 'misses', 'hit_ratio'})
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='password', is_staff=True)
+        self.client.login(username='testuser', password='password')
+        self.cheese = Ingredient.objects.create(name='Cheese', price_per_unit=1.5, quantity=100)
+
+    def test_unchanged_list_is_not_modified(self):
+        response = self.client.get(reverse('ingredient-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('ingredient-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([query for query in queries if 'restaurant_' in query['sql']])
+
+    def test_write_changes_the_etag(self):
+        etag = self.client.get(reverse('ingredient-list'))['ETag']
+        self.cheese.quantity = 50
+        self.cheese.save()
+        response = self.client.get(reverse('ingredient-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_unrelated_write_keeps_the_etag(self):
+        etag = self.client.get(reverse('inventory-chart'))['ETag']
+        MenuItem.objects.create(name='Burger', price=8.0)
+        response = self.client.get(reverse('inventory-chart'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_is_per_user(self):
+        etag = self.client.get(reverse('menu-item-list'))['ETag']
+        User.objects.create_user(username='other', password='password')
+        self.client.login(username='other', password='password')
+        response = self.client.get(reverse('menu-item-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(reverse('menu-with-ingredients'))['Last-Modified']
+        response = self.client.get(reverse('menu-with-ingredients'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_versions_are_shared_between_processes(self):
+        # Another worker has its own cache objects; it reads the same version files
+        other_worker = CacheHandler(settings.CACHES)[settings.DATA_VERSION_CACHE]
+        self.cheese.quantity = 50
+        self.cheese.save()
+        self.assertEqual(other_worker.get(versions.VERSION_PREFIX + 'ingredient'), versions.get_version('ingredient'))
+
+# Missing charts are built in worker threads, which need to see committed data
+class DashboardTests(TransactionTestCase):
+    def setUp(self):
+        capacity._matrix = None
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.login(username='testuser', password='password')
+        self.cheese = Ingredient.objects.create(name='Cheese', price_per_unit=1.5, quantity=100)
+        self.burger = MenuItem.objects.create(name='Burger', price=8.0)
+        RecipeRequirement.objects.create(menu_item=self.burger, ingredient=self.cheese, quantity=2)
+
+    def test_dashboard_returns_every_chart(self):
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        charts = response.json()
+        self.assertEqual(set(charts), set(chart_data.CHARTS))
+        self.assertEqual(charts['quantity'], self.client.get(reverse('quantity-chart')).json())
+        self.assertEqual(charts['capacity']['data'], [50])
+
+    def test_unchanged_dashboard_is_not_modified(self):
+        etag = self.client.get(reverse('dashboard'))['ETag']
+        self.assertEqual(self.client.get(reverse('dashboard'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_warm_dashboard_skips_the_database(self):
+        self.client.get(reverse('dashboard'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('dashboard'))
+        self.assertFalse([query for query in queries if 'restaurant_' in query['sql']])
+
+    def test_missing_charts_are_built_concurrently(self):
+        # Every builder waits for all the others, which only works if they run at the same time;
+        # built one after another, the first would time out and break the barrier
+        barrier = threading.Barrier(len(chart_data.CHARTS), timeout=10)
+
+        def waiting_chart():
+            barrier.wait()
+            return {'labels': [], 'data': []}
+
+        waiting_charts = {name: (waiting_chart, ('ingredient',)) for name in chart_data.CHARTS}
+        versions.bump('ingredient')
+        with mock.patch.dict(chart_data.CHARTS, waiting_charts):
+            charts = self.client.get(reverse('dashboard')).json()
+        self.assertFalse(barrier.broken)
+        self.assertEqual(len(charts), len(waiting_charts))
+
+class ChartImageTests(TestCase):
+    def setUp(self):
+        reports_root = tempfile.TemporaryDirectory()
+        self.addCleanup(reports_root.cleanup)
+        settings_override = override_settings(REPORTS_ROOT=reports_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.login(username='testuser', password='password')
+        self.cheese = Ingredient.objects.create(name='Cheese', price_per_unit=1.5, quantity=100)
+
+    def get_image(self, name, image_format):
+        response = self.client.get(reverse('chart-image', args=[name, image_format]))
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content)
+        response.close()
+        return response, content
+
+    def test_png_and_svg(self):
+        response, content = self.get_image('inventory', 'png')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(content.startswith(b'\x89PNG'))
+        response, content = self.get_image('quantity', 'svg')
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertIn(b'<svg', content)
+
+    def test_warm_request_sends_the_file(self):
+        self.get_image('inventory', 'png')
+        with mock.patch.object(chart_images, 'draw_chart') as draw_chart:
+            with CaptureQueriesContext(connection) as queries:
+                self.get_image('inventory', 'png')
+        draw_chart.assert_not_called()
+        self.assertFalse([query for query in queries if 'restaurant_' in query['sql']])
+
+    def test_data_change_renders_a_new_file(self):
+        self.get_image('inventory', 'png')
+        old_path = chart_images.chart_image_path('inventory', 'png')
+        self.cheese.quantity = 50
+        self.cheese.save()
+        self.get_image('inventory', 'png')
+        self.assertFalse(old_path.exists())
+        self.assertTrue(chart_images.chart_image_path('inventory', 'png').exists())
+
+    def test_unknown_chart_or_format(self):
+        self.assertEqual(self.client.get(reverse('chart-image', args=['nope', 'png'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('chart-image', args=['inventory', 'gif'])).status_code, 404)
+
+class SQLInstrumentationTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.client.login(username='testuser', password='password')
+        self.ingredients = [
+            Ingredient.objects.create(name=f"Ingredient {number}", price_per_unit=1, quantity=10) for number in range(6)
+        ]
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('ingredient-list'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+')
+
+    def test_logs_one_json_line_per_request(self):
+        with self.assertLogs('restaurant.sql', 'INFO') as logs:
+            self.client.get(reverse('ingredient-list'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], reverse('ingredient-list'))
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['queries'], 0)
+        self.assertIn('SELECT', record['slowest_sql'])
+
+    def test_counts_repeated_statements(self):
+        stats = QueryStats()
+        with connection.execute_wrapper(stats):
+            for ingredient in self.ingredients:
+                Ingredient.objects.get(pk=ingredient.pk)
+        sql, times = stats.most_repeated()
+        self.assertEqual(times, 6)
+        self.assertIn('restaurant_ingredient', sql)
+        self.assertEqual(stats.duplicates(), 5)
+
+    @override_settings(SQL_DUPLICATE_THRESHOLD=1)
+    def test_repeated_statements_are_logged_as_warnings(self):
+        with self.assertLogs('restaurant.sql', 'WARNING') as logs:
+            self.client.get(reverse('ingredient-list'))
+        record = logs.records[0].sql_stats
+        self.assertGreaterEqual(record['repeated_times'], 1)
+        self.assertIn('repeated_sql', record)
+
+@override_settings(READ_REPLICA_ALIAS='replica')
+class ReadReplicaTests(TransactionTestCase):
+    # In tests the replica mirrors the default database, so the query log shows which alias was used
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='password', is_staff=True)
+        self.client.login(username='testuser', password='password')
+        self.ingredient = Ingredient.objects.create(name='Tomato', price_per_unit=0.5, quantity=1000)
+        self.menu_item = MenuItem.objects.create(name='Pizza', price=10)
+        RecipeRequirement.objects.create(menu_item=self.menu_item, ingredient=self.ingredient, quantity=5)
+
+    def replica_queries(self, url_name, **kwargs):
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = self.client.get(reverse(url_name, kwargs=kwargs))
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_analytics_read_from_replica(self):
+        self.assertGreater(self.replica_queries('revenue-chart'), 0)
+        self.assertGreater(self.replica_queries('quantity-chart'), 0)
+        self.assertGreater(self.replica_queries('purchase-list'), 0)
+
+    def test_dashboard_and_reports_read_from_replica(self):
+        # The dashboard builds its charts on worker threads with connections of their own, which the
+        # query log of this thread doesn't see; the routing decision, made in those threads, shows it
+        aliases = []
+        read_alias = routers.read_alias
+        with mock.patch('restaurant.routers.read_alias', side_effect=lambda: aliases.append(read_alias()) or aliases[-1]):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(aliases), {'replica'})
+        self.assertGreater(self.replica_queries('servings-available'), 0)
+        self.assertGreater(self.replica_queries('menu-profitability'), 0)
+
+    def test_chart_images_read_from_replica(self):
+        self.assertGreater(self.replica_queries('chart-image', name='revenue', image_format='svg'), 0)
+
+    def test_streamed_export_reads_from_replica(self):
+        self.assertGreater(self.replica_queries('ingredient-csv'), 0)
+
+    def test_other_views_use_the_primary(self):
+        self.assertEqual(self.replica_queries('ingredient-list'), 0)
+
+    def test_writes_pin_the_user_to_the_primary(self):
+        response = self.client.post(reverse('purchase-create'), {'menu_item': self.menu_item.id})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        self.assertEqual(self.replica_queries('revenue-chart'), 0)
+
+        self.client.cookies.pop(routers.PIN_COOKIE)
+        self.assertGreater(self.replica_queries('quantity-chart'), 0)
+
+    def test_pinned_user_skips_what_was_cached_from_the_replica(self):
+        self.assertGreater(self.replica_queries('revenue-chart'), 0)
+        self.assertGreater(self.replica_queries('menu-profitability'), 0)
+        self.client.cookies[routers.PIN_COOKIE] = '1'
+        for url_name in ('revenue-chart', 'menu-profitability'):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.replica_queries(url_name), 0)
+            # Built again from the primary rather than served from the replica's cache entry
+            self.assertTrue([query for query in queries if 'restaurant_' in query['sql']])
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(metrics_dir.cleanup)
+        settings_override = override_settings(METRICS_DIR=metrics_dir.name, METRICS_TOKEN='scrape-token')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = Client()
+        self.user = User.objects.create_user(username='staff', password='password', is_staff=True)
+        self.client.login(username='staff', password='password')
+        self.pizza = MenuItem.objects.create(name='Pizza', price=10)
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def sample(self, text, series):
+        for line in text.splitlines():
+            if line.startswith(series + ' '):
+                return float(line.split()[-1])
+        return 0
+
+    def test_request_latency_by_url_name(self):
+        self.client.get(reverse('ingredient-list'))
+        text = self.scrape()
+        self.assertIn('# TYPE delights_http_request_duration_seconds histogram', text)
+        self.assertGreaterEqual(self.sample(text, 'delights_http_request_duration_seconds_count{view="ingredient-list"}'), 1)
+        self.assertGreaterEqual(self.sample(text, 'delights_http_requests_total{status="200",view="ingredient-list"}'), 1)
+        self.assertGreater(self.sample(text, 'delights_db_queries_total{view="ingredient-list"}'), 0)
+
+    def test_sums_the_files_of_other_workers(self):
+        before = self.sample(self.scrape(), 'delights_purchases_total')
+        other_worker = metrics.Registry()
+        other_worker.inc('delights_purchases_total', 3)
+        other_worker.flush(force=True)
+        self.assertEqual(self.sample(self.scrape(), 'delights_purchases_total'), before + 3)
+
+    def test_idle_process_writes_no_file(self):
+        files = os.listdir(settings.METRICS_DIR)
+        metrics.Registry().flush(force=True)
+        self.assertEqual(os.listdir(settings.METRICS_DIR), files)
+
+    def test_counts_committed_purchases(self):
+        before = self.sample(self.scrape(), 'delights_purchases_total')
+        with self.captureOnCommitCallbacks(execute=True):
+            Purchase.objects.create(menu_item=self.pizza)
+        self.assertEqual(self.sample(self.scrape(), 'delights_purchases_total'), before + 1)
+
+    def test_cache_hit_ratio(self):
+        chart_data.get_chart('revenue')
+        chart_data.get_chart('revenue')
+        text = self.scrape()
+        self.assertGreaterEqual(self.sample(text, 'delights_cache_requests_total{cache="charts",result="hit"}'), 1)
+        self.assertIn('delights_cache_hit_ratio{cache="charts"}', text)
+
+    def test_requires_staff_or_token(self):
+        scraper = Client()
+        self.assertEqual(scraper.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(scraper.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(scraper.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token').status_code, 200)
+
+
+class GenerateDataTests(TestCase):
+    def generate(self, *extra):
+        call_command(
+            'generate_data', '--ingredients', '30', '--menu-items', '5', '--recipe-rows', '3', '--purchases', '200',
+            '--days', '10', *extra, stdout=StringIO(),
+        )
+
+    def test_generates_a_consistent_dataset(self):
+        self.generate()
+        self.assertEqual(Ingredient.objects.count(), 30)
+        self.assertEqual(RecipeRequirement.objects.count(), 15)
+        self.assertEqual(Purchase.objects.count(), 200)
+        # What the signals would have maintained is rebuilt after the bulk inserts
+        self.assertEqual(rollups.verify(), [])
+        self.assertEqual(rollups.totals()[0], 200)
+        self.assertEqual(valuation.inventory_value(), valuation.value_of(Ingredient.objects.all()))
+        name = Ingredient.objects.order_by('id').first().name
+        self.assertIn(Ingredient.objects.get(name=name).pk, search.search_ingredient_ids(name))
+
+    def test_same_seed_same_data(self):
+        self.generate('--seed', '7')
+        first = list(Ingredient.objects.order_by('name').values_list('name', 'price_per_unit', 'quantity'))
+        self.generate('--seed', '7', '--clear')
+        self.assertEqual(list(Ingredient.objects.order_by('name').values_list('name', 'price_per_unit', 'quantity')), first)
+
+    def test_refuses_to_mix_with_existing_data(self):
+        Ingredient.objects.create(name='Cheese', price_per_unit=1.5, quantity=10)
+        with self.assertRaises(CommandError):
+            self.generate()
+
+    def test_inserts_one_batch_at_a_time(self):
+        with mock.patch.object(Purchase.objects, 'bulk_create', wraps=Purchase.objects.bulk_create) as bulk_create:
+            self.generate('--batch-size', '60')
+        self.assertEqual([len(call.args[0]) for call in bulk_create.call_args_list], [60, 60, 60, 20])
+
+class BenchmarkCommandTests(TestCase):
+    def test_writes_a_json_report(self):
+        reports_root = tempfile.TemporaryDirectory()
+        self.addCleanup(reports_root.cleanup)
+        call_command(
+            'generate_data', '--ingredients', '20', '--menu-items', '3', '--recipe-rows', '2', '--purchases', '50',
+            stdout=StringIO(),
+        )
+        output = f"{reports_root.name}/benchmark.json"
+        with override_settings(REPORTS_ROOT=reports_root.name):
+            call_command(
+                'benchmark', '--iterations', '2', '--host', 'testserver', '--output', output,
+                '--only', 'ingredient-list', 'ingredient-update', 'chart-image', stdout=StringIO(),
+            )
+        with open(output) as report_file:
+            report = json.load(report_file)
+
+        self.assertEqual(report['rows']['Ingredient'], 20)
+        results = {result['name']: result for result in report['results']}
+        self.assertEqual(set(results), {'ingredient-list', 'ingredient-update', 'chart-image'})
+        for result in results.values():
+            self.assertEqual(result['status'], [200])
+            self.assertGreater(result['queries'], 0)
+            self.assertEqual(set(result['latency_ms']), {'p50', 'p90', 'p95', 'p99', 'mean', 'max'})
+        self.assertEqual(results['ingredient-update']['url'], reverse('ingredient-update', args=[Ingredient.objects.order_by('pk').first().pk]))
+
+    def test_unknown_url_name(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark', '--only', 'nope', stdout=StringIO())
+
+# The PDF is rendered by a worker thread, which needs to see committed data
+class IngredientPDFViewTest(TransactionTestCase):
     def setUp(self):
+        # Reports are written to a throwaway directory
+        reports_root = tempfile.TemporaryDirectory()
+        self.addCleanup(reports_root.cleanup)
+        settings_override = override_settings(REPORTS_ROOT=reports_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
         # Set up test client and log in user
         self.client = Client()
         self.user = User.objects.create_user(username='testuser', password='testpassword')
@@ -120,9 +1416,20 @@ class IngredientPDFViewTest(TestCase):
         self.ingredient1 = Ingredient.objects.create(name="Flour", quantity=10, price_per_unit=1.5)
         self.ingredient2 = Ingredient.objects.create(name="Sugar", quantity=5, price_per_unit=2.0)
 
+    def download_pdf(self):
+        # The first request starts the render and asks the client to poll
+        response = self.client.get(reverse('ingredient-pdf'))
+        if response.status_code == 202:
+            self.assertEqual(response.json()['status'], 'pending')
+            _, pending = reports.request_ingredient_pdf()
+            if pending:
+                pending.result(timeout=30)
+            response = self.client.get(reverse('ingredient-pdf'))
+        return response
+
     def test_pdf_view_response(self):
         # Access the PDF view
-        response = self.client.get(reverse('ingredient-pdf'))
+        response = self.download_pdf()
 
         # Test that the response is successful
         self.assertEqual(response.status_code, 200)
@@ -135,14 +1442,30 @@ class IngredientPDFViewTest(TestCase):
 
     def test_pdf_content(self):
         # Access the PDF view
-        response = self.client.get(reverse('ingredient-pdf'))
+        response = self.download_pdf()
 
         # Verify that the response contains valid PDF content
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'application/pdf')
 
         # Check that the content starts with the PDF file header
-        self.assertTrue(response.content.startswith(b"%PDF"), "The PDF content does not start with %PDF")
+        self.assertTrue(response.getvalue().startswith(b"%PDF"), "The PDF content does not start with %PDF")
+
+    def test_pdf_is_cached_until_inventory_changes(self):
+        self.download_pdf()
+        first_path, pending = reports.request_ingredient_pdf()
+        self.assertIsNone(pending)
+
+        # Unchanged inventory is served from disk without a new render
+        response = self.client.get(reverse('ingredient-pdf'))
+        self.assertEqual(response.status_code, 200)
+
+        self.ingredient1.quantity = 20
+        self.ingredient1.save()
+        response = self.client.get(reverse('ingredient-pdf'))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.download_pdf().status_code, 200)
+        self.assertFalse(first_path.exists())  # Older versions are cleaned up
 
 class IngredientCSVViewTest(TestCase):
     def setUp(self):
@@ -163,10 +1486,88 @@ class IngredientCSVViewTest(TestCase):
         self.assertIn('attachment; filename="ingredients.csv"', response['Content-Disposition'])
 
         # Check that the CSV content includes the ingredient data
-        csv_content = response.content.decode('utf-8')
+        csv_content = response.getvalue().decode('utf-8')
         self.assertIn("Flour", csv_content)
         self.assertIn("Sugar", csv_content)
 
+    def test_csv_columns_match_header(self):
+        response = self.client.get(reverse('ingredient-csv'))
+        rows = list(csv.reader(response.getvalue().decode('utf-8').splitlines()))
+        self.assertEqual(rows[0], ['Name', 'Quantity', 'Price per Unit'])
+        self.assertEqual(rows[1], ['Flour', '10.00', '1.50'])
+
+    def test_csv_is_streamed(self):
+        response = self.client.get(reverse('ingredient-csv'))
+        self.assertTrue(response.streaming)
+
+class ExportCSVViewTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password', is_staff=True)
+        self.client.login(username='testuser', password='password')
+        self.burger = MenuItem.objects.create(name='Burger', price=8.0)
+        cheese = Ingredient.objects.create(name='Cheese', price_per_unit=1.5, quantity=10)
+        RecipeRequirement.objects.create(menu_item=self.burger, ingredient=cheese, quantity=2)
+        for day in (1, 2, 3):
+            Purchase.objects.create(menu_item=self.burger, timestamp=datetime(2026, 2, day, 23, 30, tzinfo=dt_timezone.utc))
+
+    def test_purchase_csv_date_range(self):
+        response = self.client.get(reverse('purchase-csv'), {'start': '2026-02-02', 'end': '2026-02-02'})
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.reader(response.getvalue().decode('utf-8').splitlines()))
+        self.assertEqual(rows[0], ['ID', 'Timestamp', 'Menu Item', 'Price'])
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(rows[1][1].startswith('2026-02-02 23:30'))
+
+    def test_purchase_csv_rejects_bad_dates(self):
+        response = self.client.get(reverse('purchase-csv'), {'start': '2026-02-30'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_recipe_requirement_csv(self):
+        response = self.client.get(reverse('recipe-requirement-csv'))
+        rows = list(csv.reader(response.getvalue().decode('utf-8').splitlines()))
+        self.assertEqual(rows, [['Menu Item', 'Ingredient', 'Quantity'], ['Burger', 'Cheese', '2.00']])
+
+class PurchaseEventsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password', is_staff=True)
+        self.burger = MenuItem.objects.create(name='Burger', price=8.0)
+        Purchase.objects.create(menu_item=self.burger)
+
+    async def test_feed_fans_one_update_out_to_all_subscribers(self):
+        first, snapshot = await events.feed.subscribe()
+        second, _ = await events.feed.subscribe()
+        self.assertEqual(snapshot['total_purchases'], 1)
+
+        with mock.patch.object(rollups, 'totals', wraps=rollups.totals) as totals:
+            await sync_to_async(Purchase.objects.create)(menu_item=self.burger)
+            events.feed.notify()
+            first_event = await asyncio.wait_for(first.get(), 5)
+            second_event = await asyncio.wait_for(second.get(), 5)
+
+        self.assertEqual(first_event, second_event)
+        self.assertEqual(first_event['total_purchases'], 2)
+        self.assertEqual(first_event['delta_purchases'], 1)
+        self.assertEqual(Decimal(first_event['delta_revenue']), 8)
+        self.assertEqual(totals.call_count, 1)  # Computed once for both listeners
+        events.feed.unsubscribe(first)
+        events.feed.unsubscribe(second)
+
+    async def test_asgi_stream_starts_with_current_totals(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('purchase-events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content.__aiter__()
+        first_frame = await asyncio.wait_for(stream.__anext__(), 5)
+        await stream.aclose()
+        self.assertIn(b'"total_purchases": 1', first_frame)
+
+    def test_wsgi_falls_back_to_a_single_event(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('purchase-events'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b'retry: '))
+        self.assertIn(b'event: purchases', response.content)
+
 class TotalPurchasesDynamicTest(TestCase):
 
     def setUp(self):
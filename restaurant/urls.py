@@ -28,20 +28,36 @@ urlpatterns = [
     path('recipe-requirement/<int:pk>/', views.RecipeRequirementDetailView.as_view(), name='recipe-requirement-detail'),
     path('recipe-requirement/<int:pk>/edit/', views.RecipeRequirementUpdateView.as_view(), name='recipe-requirement-update'),
     path('recipe-requirement/<int:pk>/delete/', views.RecipeRequirementDeleteView.as_view(), name='recipe-requirement-delete'),
+    path('recipe-requirement/<int:pk>/bulk-edit/', views.RecipeBulkEditView.as_view(), name='recipe-bulk-edit'),
+    path('recipe-requirement/<int:pk>/clone/', views.recipe_clone, name='recipe-clone'),
     path('menu-with-ingredients/', views.menu_with_ingredients_view, name='menu-with-ingredients'),
     
     # Purchase URLs
     path('purchases/', staff_member_required(views.PurchaseListView.as_view()), name='purchase-list'),
     path('purchase/new/', views.PurchaseCreateView.as_view(), name='purchase-create'),
+    path('purchase/batch/', views.purchase_batch, name='purchase-batch'),
+    path('reorder/', views.ReorderListView.as_view(), name='reorder-list'),
 
     # Downloads and analytics
     path('ingredients/pdf/', views.IngredientPDFView.as_view(), name='ingredient-pdf'),
     path('ingredients/csv/', views.IngredientCSVView.as_view(), name='ingredient-csv'),
+    path('ingredients/import/', views.IngredientImportView.as_view(), name='ingredient-import'),
+    path('purchases/csv/', staff_member_required(views.PurchaseCSVView.as_view()), name='purchase-csv'),
+    path('recipe-requirements/csv/', views.RecipeRequirementCSVView.as_view(), name='recipe-requirement-csv'),
     path('charts', views.charts, name='charts'),
+    path('dashboard/', views.dashboard, name='dashboard'),
     path('quantity-chart/', views.quantity_chart, name='quantity-chart'),
     path('revenue-chart/', views.revenue_chart, name='revenue-chart'),
     path('inventory-chart/', views.inventory_chart, name='inventory-chart'),
+    path('capacity-chart/', views.capacity_chart, name='capacity-chart'),
+    path('chart-images/<slug:name>.<slug:image_format>', views.chart_image, name='chart-image'),
+    path('servings-available/', views.servings_available, name='servings-available'),
+    path('menu-profitability/', views.menu_profitability, name='menu-profitability'),
+    path('menu-profitability/json/', views.menu_profitability_json, name='menu-profitability-json'),
+    path('chart-cache-stats/', views.chart_cache_stats, name='chart-cache-stats'),
+    path('metrics/', views.metrics_view, name='metrics'),
 
     # Dynamic URLs
     path('dynamic/total-purchases/', views.total_purchases_dynamic, name='total-purchases-dynamic'),
+    path('dynamic/purchase-events/', views.purchase_events, name='purchase-events'),
 ]
\ No newline at end of file
@@ -0,0 +1,78 @@
+"""
+Inventory valuation (sum of price_per_unit * quantity).
+
+The total over all ingredients is kept as a running figure in the single InventoryValuation row:
+ingredient saves and deletes adjust it by their difference (see signals.py). Sales don't touch
+it; the value of the stock ledger's pending movements is added when it is read, and compaction
+moves it into the row (see inventory.py). Filtered subsets are valued with an aggregate in the
+database; the value of an ingredient search is cached until ingredients or stock change.
+"""
+import hashlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F, Sum
+
+from . import inventory, search, versions
+from .models import Ingredient, InventoryValuation
+
+VALUATION_PK = 1
+
+_CENTS = Decimal('0.01')
+
+
+def quantize(amount):
+    """Rounds a price or quantity the way the database stores it."""
+    return Decimal(str(amount)).quantize(_CENTS)
+
+
+def line_value(price_per_unit, quantity):
+    """Value of one ingredient row, with both fields rounded the way the database stores them."""
+    return quantize(price_per_unit) * quantize(quantity)
+
+
+def value_of(queryset):
+    """Values the current stock of an Ingredient queryset with a single aggregate query."""
+    return inventory.with_stock(queryset).aggregate(total=Sum(F('price_per_unit') * F('stock'), default=0))['total']
+
+
+def search_value(query):
+    """Values the current stock of every ingredient matching the search ``query``."""
+    query = query.strip()
+    digest = hashlib.sha256(query.encode()).hexdigest()
+    key = f"restaurant:search-value:{versions.token('ingredient', 'stock')}:{digest}"
+    value_cache = caches[settings.CHART_CACHE_ALIAS]
+    value = value_cache.get(key)
+    if value is None:
+        value = value_of(search.matching_ingredients(query))
+        value_cache.set(key, value, timeout=settings.CHART_CACHE_TIMEOUT)
+    return value
+
+
+def pending_value():
+    return inventory.pending().aggregate(total=Sum('value', default=0))['total']
+
+
+@transaction.atomic
+def rebuild():
+    """Recomputes the running total and returns the value of the whole inventory."""
+    total = value_of(Ingredient.objects.all())
+    # The row leaves out the pending movements, which are added when it is read
+    InventoryValuation.objects.update_or_create(pk=VALUATION_PK, defaults={'total': total - pending_value()})
+    return total
+
+
+def inventory_value():
+    """Returns the value of the whole inventory from the running total and the pending movements."""
+    total = InventoryValuation.objects.filter(pk=VALUATION_PK).values_list('total', flat=True).first()
+    return rebuild() if total is None else total + pending_value()
+
+
+def adjust(delta):
+    """Moves the running total by ``delta``; rebuilds it instead if the row is missing."""
+    if not delta:
+        return
+    if not InventoryValuation.objects.filter(pk=VALUATION_PK).update(total=F('total') + delta):
+        rebuild()
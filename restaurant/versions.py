@@ -0,0 +1,66 @@
+"""
+Data version counters.
+
+Every kind of data ('ingredient', 'stock', ...) has a version stored in the DATA_VERSION_CACHE
+cache, which all worker processes share (files, by default). Writers bump it and readers use it
+to key anything derived from that data (cached reports, payloads, ETags), so stale copies are
+simply never looked up again. A version that has been evicted from
+the cache comes back as the current time, which is newer than anything derived before.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+VERSION_PREFIX = 'restaurant:version:'
+
+
+def _cache():
+    return caches[settings.DATA_VERSION_CACHE]
+
+
+def get_versions(*names):
+    """Returns ``{name: version}`` with a single cache lookup."""
+    cache = _cache()
+    found = cache.get_many([VERSION_PREFIX + name for name in names])
+    versions = {}
+    for name in names:
+        version = found.get(VERSION_PREFIX + name)
+        if version is None:
+            cache.add(VERSION_PREFIX + name, time.time_ns(), timeout=None)
+            version = cache.get(VERSION_PREFIX + name)
+        versions[name] = version
+    return versions
+
+
+def get_version(name):
+    return get_versions(name)[name]
+
+
+def token(*names):
+    """Returns a short string that changes whenever any of the named versions changes."""
+    versions = get_versions(*names)
+    return '-'.join(format(versions[name], 'x') for name in names)
+
+
+def _set(names, version=None):
+    version = version or time.time_ns()
+    _cache().set_many({VERSION_PREFIX + name: version for name in names}, timeout=None)
+    return version
+
+
+def bump(*names):
+    """
+    Marks the named data as changed and returns the version written.
+
+    Inside a transaction the versions are bumped again once it commits, so nothing derived from
+    the not-yet-visible state can stay cached under the new version; the version returned is that
+    second one. Whoever finds a different version later knows someone else bumped since.
+    """
+    version = _set(names)
+    if transaction.get_connection().in_atomic_block:
+        # Known now, so the caller can compare against it; it only has to differ from the first
+        transaction.on_commit(lambda: _set(names, version + 1))
+        return version + 1
+    return version
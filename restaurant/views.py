@@ -1,5 +1,9 @@
-import csv
+import json
+from datetime import datetime, time, timedelta
+from datetime import timezone as dt_timezone
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import authenticate, login, logout
@@ -7,20 +11,40 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.messages.views import SuccessMessageMixin
+from django.core.handlers.asgi import ASGIRequest
 from django.db import IntegrityError
-from django.db.models import F, Sum
-from django.http import HttpResponse, JsonResponse
-from django.shortcuts import redirect, render
+from django.db.models import Q
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseBadRequest, HttpResponseForbidden,
+                         JsonResponse, StreamingHttpResponse)
+from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_date
+from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
 from django.views import View
+from django.views.decorators.http import require_POST
 from django.views.generic import CreateView, DeleteView, ListView, UpdateView
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import FormView
-from reportlab.pdfgen import canvas
 
-from .forms import (IngredientForm, MenuItemForm, PurchaseForm,
+from . import archive, capacity, chart_images
+from . import charts as chart_data
+from . import (events, imports, inventory, metrics, profitability, recipe_book,
+               reports, rollups, search, valuation)
+from .conditional import conditional_on
+from .exports import stream_csv
+from .forms import (CloneRecipeForm, IngredientForm, IngredientImportForm,
+                    MenuItemForm, PurchaseForm, RecipeLineFormSet,
                     RecipeRequirementForm)
-from .models import Ingredient, MenuItem, Purchase, RecipeRequirement
+from .models import (Ingredient, MenuItem, Purchase, RecipeRequirement,
+                     ReorderForecast)
+from .routers import reads_from_replica, replica_reads
+from .services import (MAX_BATCH_LINES, BatchTooLarge, InsufficientStock,
+                       clone_recipe, record_purchase, record_purchase_batch,
+                       replace_recipe)
 
 
 def home(request):
@@ -100,24 +124,36 @@ def registerPage(request):
 # Ingredient Views
 # ----------------------------
 
+@method_decorator(conditional_on('ingredient', 'stock'), name='get')
 class IngredientListView(LoginRequiredMixin, ListView):
     model = Ingredient
     template_name = 'restaurant/ingredient_list.html'
     context_object_name = 'ingredients'
+    paginate_by = 50
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        search_query = self.request.GET.get('q')
-        if search_query:
-            queryset = queryset.filter(name__icontains=search_query)
-        return queryset
+        self.search_ids = None
+        search_query = self.request.GET.get('q', '').strip()
+        if not search_query:
+            return inventory.with_stock().order_by('name', 'id')
+
+        # Ranked matches from the search index instead of a name__icontains table scan
+        self.search_ids = search.search_ingredient_ids(search_query)
+        ingredients = inventory.with_stock().in_bulk(self.search_ids)
+        return [ingredients[pk] for pk in self.search_ids if pk in ingredients]
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['search_query'] = self.request.GET.get('q', '')
-        context['inventory_value'] = sum(
-            [ingredient.price_per_unit * ingredient.quantity for ingredient in self.object_list]
-        )
+        context['min_substring_length'] = search.MIN_SUBSTRING_LENGTH
+        # The running total for the whole inventory, an aggregate in the database for a search
+        if self.search_ids is None:
+            context['inventory_value'] = valuation.inventory_value()
+        else:
+            # Over every match, not just the SEARCH_LIMIT listed; cached, as it sums every matching row
+            context['inventory_value'] = valuation.search_value(context['search_query'])
+            context['search_limit'] = search.SEARCH_LIMIT
+            context['search_truncated'] = len(self.search_ids) == search.SEARCH_LIMIT
         return context
 
 class IngredientCreateView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
@@ -134,6 +170,12 @@ class IngredientUpdateView(LoginRequiredMixin, SuccessMessageMixin, UpdateView):
     success_url = reverse_lazy('ingredient-list')
     success_message = "%(name)s was updated successfully!"  
 
+    def get_object(self, queryset=None):
+        # The form edits the current stock, not the snapshot in the quantity column
+        ingredient = super().get_object(inventory.with_stock())
+        ingredient.quantity = ingredient._loaded_quantity = ingredient.stock
+        return ingredient
+
 class IngredientDeleteView(LoginRequiredMixin, SuccessMessageMixin, DeleteView):
     model = Ingredient
     template_name = 'restaurant/delete.html'
@@ -141,75 +183,97 @@ class IngredientDeleteView(LoginRequiredMixin, SuccessMessageMixin, DeleteView):
     context_object_name = 'obj'
     success_message = "Item was deleted successfully!" 
 
+class IngredientImportView(LoginRequiredMixin, FormView):
+    template_name = 'restaurant/ingredient_import.html'
+    form_class = IngredientImportForm
+
+    def form_valid(self, form):
+        upload = form.cleaned_data['file']
+        try:
+            rows = imports.read_rows(upload, imports.detect_format(upload.name))
+            result = imports.import_ingredients(rows)
+        except imports.ImportFormatError as error:
+            form.add_error('file', str(error))
+            return self.form_invalid(form)
+        return self.render_to_response(self.get_context_data(form=form, result=result))
+
+@method_decorator(reads_from_replica, name='get')
 class IngredientPDFView(LoginRequiredMixin, View):
     def get(self, request, *args, **kwargs):
-        # Create a PDF response
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="ingredient_list.pdf"'
-
-        # Create the PDF object using ReportLab
-        p = canvas.Canvas(response)
-
-        # Query all ingredients
-        ingredients = Ingredient.objects.all()
-
-        # Set title
-        p.setFont("Helvetica-Bold", 16)
-        p.drawString(100, 800, "Ingredient List")
-
-        # Add table headers
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(50, 760, "Name")
-        p.drawString(200, 760, "Quantity")
-        p.drawString(350, 760, "Price Per Unit")
-        p.drawString(450, 760, "Total Value")
-
-        # Add data rows
-        y = 740
-        for ingredient in ingredients:
-            total_value = ingredient.price_per_unit * ingredient.quantity
-
-            p.setFont("Helvetica", 12)
-            p.drawString(50, y, ingredient.name)
-            p.drawString(200, y, str(ingredient.quantity))
-            p.drawString(350, y, f"${ingredient.price_per_unit:.2f}")
-            p.drawString(450, y, f"${total_value:.2f}")
-            y -= 20  # Move to the next line
-
-            if y < 50:  # Create a new page if space runs out
-                p.showPage()
-                y = 800
-
-        # Finalize the PDF
-        p.showPage()
-        p.save()
+        # Serve the PDF for the current inventory from disk, or let the client poll while it renders
+        path, pending = reports.request_ingredient_pdf()
+        if path:
+            try:
+                return FileResponse(
+                    open(path, 'rb'), as_attachment=True, filename='ingredient_list.pdf', content_type='application/pdf'
+                )
+            except FileNotFoundError:
+                pass  # Replaced by a newer version in the meantime
 
+        response = JsonResponse({'status': 'pending', 'detail': 'The PDF is being generated, please try again shortly.'}, status=202)
+        response['Retry-After'] = '2'
+        response['Refresh'] = '2'  # Browsers retry the download on their own
         return response
     
 
+@method_decorator(reads_from_replica, name='get')
 class IngredientCSVView(LoginRequiredMixin,View):
     def get(self, request, *args, **kwargs):
-        # Create a response object with the correct content type
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="ingredients.csv"'
+        ingredients = inventory.with_stock().order_by('id').values_list('name', 'stock', 'price_per_unit')
+        return stream_csv('ingredients.csv', ['Name', 'Quantity', 'Price per Unit'], ingredients)
+
+
+@method_decorator(reads_from_replica, name='get')
+class PurchaseCSVView(LoginRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        # Optional date range, e.g. ?start=2025-01-01&end=2025-01-31 (both days included)
+        try:
+            start = _parse_day(request.GET.get('start'))
+            end = _parse_day(request.GET.get('end'))
+        except ValueError:
+            return HttpResponseBadRequest("start and end must be dates in YYYY-MM-DD format.")
+        start = _start_of_day(start) if start else None
+        end = _start_of_day(end + timedelta(days=1)) if end else None
+
+        # ?archived=1 includes the purchases moved to the archive (see archive.py)
+        if request.GET.get('archived') == '1':
+            rows = archive.purchase_rows(start, end)
+        else:
+            purchases = Purchase.objects.order_by('timestamp', 'id')
+            if start:
+                purchases = purchases.filter(timestamp__gte=start)
+            if end:
+                purchases = purchases.filter(timestamp__lt=end)
+            rows = purchases.values_list('id', 'timestamp', 'menu_item__name', 'price')
+        return stream_csv('purchases.csv', ['ID', 'Timestamp', 'Menu Item', 'Price'], rows)
 
-        # Create a CSV writer
-        writer = csv.writer(response)
 
-        # Write the header row
-        writer.writerow(['Name', 'Quantity', 'Price per Unit'])
+@method_decorator(reads_from_replica, name='get')
+class RecipeRequirementCSVView(LoginRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        requirements = RecipeRequirement.objects.order_by('menu_item_id', 'ingredient_id').values_list(
+            'menu_item__name', 'ingredient__name', 'quantity'
+        )
+        return stream_csv('recipe_requirements.csv', ['Menu Item', 'Ingredient', 'Quantity'], requirements)
 
-        # Write the ingredient data rows
-        ingredients = Ingredient.objects.all()
-        for ingredient in ingredients:
-            writer.writerow([ingredient.name, ingredient.price_per_unit, ingredient.quantity])
 
-        return response
+def _parse_day(value):
+    if not value:
+        return None
+    day = parse_date(value)  # Raises ValueError for impossible dates such as 2025-02-30
+    if day is None:
+        raise ValueError(value)
+    return day
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
 
 
 # ----------------------------
 # MenuItem Views
 # ----------------------------
+@method_decorator(conditional_on('menuitem'), name='get')
 class MenuItemListView(LoginRequiredMixin, ListView):
     model = MenuItem
     template_name = 'restaurant/menu_item_list.html'
@@ -264,7 +328,7 @@ class RecipeRequirementDetailView(LoginRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['recipe_requirements'] = RecipeRequirement.objects.filter(menu_item=self.object)
+        context['recipe_requirements'] = RecipeRequirement.objects.filter(menu_item=self.object).select_related('ingredient')
         return context
 
 class RecipeRequirementUpdateView(LoginRequiredMixin, SuccessMessageMixin, UpdateView):
@@ -284,33 +348,125 @@ class RecipeRequirementDeleteView(LoginRequiredMixin, SuccessMessageMixin, Delet
     success_url = reverse_lazy('menu-item-list')
     success_message = "Item was deleted successfully!" 
 
+class RecipeBulkEditView(LoginRequiredMixin, FormView):
+    # All requirements of one menu item on one page, saved with a single diff (see services.replace_recipe)
+    template_name = 'restaurant/recipe_bulk_edit.html'
+    form_class = RecipeLineFormSet
+
+    @cached_property
+    def menu_item(self):
+        return get_object_or_404(MenuItem, pk=self.kwargs['pk'])
+
+    def get_initial(self):
+        return [
+            {'ingredient': ingredient_id, 'quantity': quantity}
+            for ingredient_id, quantity in RecipeRequirement.objects.filter(menu_item=self.menu_item)
+            .order_by('ingredient__name').values_list('ingredient_id', 'quantity')
+        ]
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['form_kwargs'] = {
+            'ingredient_choices': list(Ingredient.objects.order_by('name', 'id').values_list('id', 'name')),
+        }
+        return kwargs
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['menu_item'] = self.menu_item
+        context['clone_form'] = CloneRecipeForm()
+        return context
+
+    def form_valid(self, form):
+        created, updated, deleted = replace_recipe(self.menu_item, form.recipe_lines())
+        messages.success(
+            self.request, f"Recipe for {self.menu_item.name} saved: {created} added, {updated} changed, {deleted} removed."
+        )
+        return redirect('recipe-requirement-detail', pk=self.menu_item.pk)
+
+@login_required(login_url='login')
+@require_POST
+def recipe_clone(request, pk):
+    source = get_object_or_404(MenuItem, pk=pk)
+    form = CloneRecipeForm(request.POST)
+    if not form.is_valid():
+        messages.error(request, "Choose a menu item to copy the recipe to.", extra_tags='danger')
+        return redirect('recipe-bulk-edit', pk=source.pk)
+    target = form.cleaned_data['target']
+    clone_recipe(source, target)
+    messages.success(request, f"Copied the {source.name} recipe to {target.name}.")
+    return redirect('recipe-bulk-edit', pk=target.pk)
+
 @staff_member_required
+@conditional_on('menuitem', 'recipe', 'ingredient')
 def menu_with_ingredients_view(request):
-    menu_items = MenuItem.objects.prefetch_related(
-        'ingredients', 'reciperequirement_set'
-    )  # Prefetch ingredients and recipe requirements
-    return render(request, 'restaurant/menu_with_ingredients.html', {'menu_items': menu_items})
+    # Cached cards; only the ones whose menu item, recipe or ingredients changed are rendered again
+    return render(request, 'restaurant/menu_with_ingredients.html', {'cards': recipe_book.cards()})
 
 # ----------------------------
 # Purchase Views
 # ----------------------------
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _encode_cursor(purchase):
+    return f"{(purchase.timestamp - _EPOCH) // timedelta(microseconds=1)}.{purchase.pk}"
+
+
+def _decode_cursor(value):
+    try:
+        micros, pk = value.split('.')
+        return _EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (AttributeError, OverflowError, ValueError):
+        return None
+
+
+@method_decorator(conditional_on('purchase', 'menuitem', 'ingredient', 'stock'), name='get')
 class PurchaseListView(LoginRequiredMixin, ListView):
     model = Purchase
     template_name = 'restaurant/purchase_list.html'
     context_object_name = 'purchases'
+    page_size = 50
+
+    def get_queryset(self):
+        # Keyset pagination over (timestamp, id): every page is an index range scan, however deep
+        queryset = Purchase.objects.select_related('menu_item')
+        before = _decode_cursor(self.request.GET.get('before'))
+        after = _decode_cursor(self.request.GET.get('after'))
+
+        if after:
+            timestamp, pk = after
+            queryset = queryset.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk))
+            queryset = queryset.order_by('timestamp', 'id')
+        else:
+            if before:
+                timestamp, pk = before
+                queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+            queryset = queryset.order_by('-timestamp', '-id')
+
+        purchases = list(queryset[:self.page_size + 1])
+        has_more = len(purchases) > self.page_size
+        purchases = purchases[:self.page_size]
+        if after:
+            purchases.reverse()
+            self.has_newer, self.has_older = has_more, True
+        else:
+            self.has_newer, self.has_older = bool(before), has_more
+        return purchases
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        purchases = context['purchases']
+        context['newer_cursor'] = _encode_cursor(purchases[0]) if purchases and self.has_newer else None
+        context['older_cursor'] = _encode_cursor(purchases[-1]) if purchases and self.has_older else None
 
-        # Calculate total revenue
-        context['total_revenue'] = self.get_queryset().aggregate(
-            total=Sum('menu_item__price')
-        )['total'] or 0
+        # The totals are analytics, so they may come from the read replica
+        with replica_reads():
+            # From the hourly rollup rather than the whole Purchase table, cached until the next purchase
+            context['total_purchases'], context['total_revenue'] = rollups.cached_totals()
 
-        # Calculate total cost of inventory
-        context['inventory_cost'] = Ingredient.objects.aggregate(
-            total_cost=Sum(F('price_per_unit') * F('quantity'))
-        )['total_cost'] or 0
+            # Total cost of inventory from the running valuation
+            context['inventory_cost'] = valuation.inventory_value()
 
         return context
     
@@ -319,44 +475,88 @@ class PurchaseCreateView(LoginRequiredMixin, FormView):
     form_class = PurchaseForm
 
     def form_valid(self, form):
-        purchase = form.save(commit=False)
-        menu_item = purchase.menu_item
-
-        # Validate inventory for all ingredients
-        insufficient_stock = []
-        for requirement in menu_item.reciperequirement_set.all():
-            if requirement.ingredient.quantity < requirement.quantity:
-                insufficient_stock.append(
-                    f"{requirement.ingredient.name} (Required: {requirement.quantity}, Available: {requirement.ingredient.quantity})"
-                )
+        menu_item = form.cleaned_data['menu_item']
 
-        # If any ingredient is insufficient, show an error message
-        if insufficient_stock:
+        # Check and deduct all ingredients in one transaction
+        try:
+            record_purchase(menu_item)
+        except InsufficientStock as exc:
             messages.error(
                 self.request,
                 "Cannot complete the purchase. Insufficient stock for the following ingredient(s): "
-                + ", ".join(insufficient_stock), extra_tags='danger'
+                + ", ".join(str(shortage) for shortage in exc.shortages), extra_tags='danger'
             )
             return redirect('purchase-create')
 
-        # Deduct inventory
-        for requirement in menu_item.reciperequirement_set.all():
-            requirement.ingredient.quantity -= requirement.quantity
-            requirement.ingredient.save()
-
-        # Save the purchase
-        purchase.save()
         messages.success(self.request, f"Purchase of {menu_item.name} completed!")
         return redirect('purchase-list')
 
     def form_invalid(self, form):
         messages.error(self.request, "Invalid form submission. Please check the data and try again.", extra_tags='danger')
         return super().form_invalid(form)
+
+@login_required(login_url='login')
+@require_POST
+def purchase_batch(request):
+    # Batch sync for POS tills: {"lines": [{"menu_item": 1, "quantity": 2, "timestamp": "..."}]}
+    try:
+        payload = json.loads(request.body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return JsonResponse({'error': 'Request body must be valid JSON.'}, status=400)
+
+    lines = payload.get('lines') if isinstance(payload, dict) else None
+    if not isinstance(lines, list):
+        return JsonResponse({'error': 'Expected an object with a "lines" list.'}, status=400)
+    if len(lines) > MAX_BATCH_LINES:
+        return JsonResponse({'error': f'A batch may contain at most {MAX_BATCH_LINES} lines.'}, status=400)
+
+    try:
+        results = record_purchase_batch(lines)
+    except BatchTooLarge as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    accepted = sum(1 for result in results if result['status'] == 'accepted')
+    return JsonResponse({
+        'accepted': accepted,
+        'rejected': len(results) - accepted,
+        'results': results,
+    })
     
 def total_purchases_dynamic(request):
-    total_purchases = Purchase.objects.count()
+    total_purchases = rollups.purchase_count()
     return JsonResponse({'total_purchases': total_purchases})
 
+@login_required(login_url='login')
+async def purchase_events(request):
+    # Server-Sent Events with live purchase totals, fed by one shared change feed per process
+    if not isinstance(request, ASGIRequest):
+        # An endless stream would tie up a WSGI worker: send the current totals and let the
+        # browser's EventSource reconnect after the retry delay instead
+        units, revenue = await sync_to_async(rollups.cached_totals)()
+        snapshot = {'total_purchases': units, 'total_revenue': str(revenue), 'delta_purchases': 0, 'delta_revenue': '0'}
+        return HttpResponse(f"retry: 5000\n{events.format_event(snapshot)}", content_type='text/event-stream')
+
+    response = StreamingHttpResponse(events.feed.stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let a proxy buffer the stream
+    return response
+
+# ----------------------------
+# Reorder Planning
+# ----------------------------
+class ReorderListView(LoginRequiredMixin, ListView):
+    template_name = 'restaurant/reorder_list.html'
+    context_object_name = 'forecasts'
+    paginate_by = 50
+
+    def get_queryset(self):
+        # Precomputed by the forecast_demand command
+        return ReorderForecast.objects.select_related('ingredient').order_by('-reorder_quantity', 'ingredient__name')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['computed_at'] = ReorderForecast.objects.values_list('computed_at', flat=True).first()
+        return context
+
 # ----------------------------
 # Analytics View
 # ----------------------------
@@ -365,72 +565,75 @@ def charts(request):
     return render(request, 'restaurant/charts.html')
 
 @login_required(login_url='login')
-def quantity_chart(request):
-    labels = []
-    data = []
+@conditional_on(*chart_data.DASHBOARD_VERSIONS)
+@reads_from_replica
+async def dashboard(request):
+    # Every chart in one response; the ones not in the cache are built concurrently
+    return JsonResponse(await chart_data.get_dashboard())
 
-    queryset = (
-        RecipeRequirement.objects.values('ingredient__name')
-        .annotate(total_quantity=Sum('quantity'))
-        .order_by('-total_quantity')
-    )
-
-    for entry in queryset:
-        labels.append(entry['ingredient__name'])
-        data.append(entry['total_quantity'])
+@login_required(login_url='login')
+@conditional_on(*chart_data.CHARTS['quantity'][1])
+@reads_from_replica
+def quantity_chart(request):
+    return JsonResponse(data=chart_data.get_chart('quantity'))
 
+@login_required(login_url='login')
+@conditional_on(*chart_data.CHARTS['revenue'][1])
+@reads_from_replica
+def revenue_chart(request):
+    return JsonResponse(data=chart_data.get_chart('revenue'))
 
-    response_data = {
-        'labels': labels,
-        'data': data,
-        'chartTitle': 'Ingredient Usage Chart',
-        'legend': 'Total Quantity', 
-        'chartType': 'bar', 
-    }
+@login_required(login_url='login')
+@conditional_on(*chart_data.CHARTS['inventory'][1])
+def inventory_chart(request):
+    return JsonResponse(data=chart_data.get_chart('inventory'))
 
-    return JsonResponse(data=response_data)
+@login_required(login_url='login')
+@conditional_on(*chart_data.CHARTS['capacity'][1])
+def capacity_chart(request):
+    return JsonResponse(data=chart_data.get_chart('capacity'))
 
 @login_required(login_url='login')
-def revenue_chart(request):
-    labels = []
-    data = []
+@reads_from_replica
+def chart_image(request, name, image_format):
+    # PNG/SVG rendering of a chart for clients without JavaScript; served from disk once drawn
+    if name not in chart_data.CHARTS or image_format not in chart_images.FORMATS:
+        raise Http404("No such chart image.")
 
-    menu_items = MenuItem.objects.all()
-    names = [item.name for item in menu_items]
-    revenues = [
-        item.price * Purchase.objects.filter(menu_item=item).count()
-        for item in menu_items
-    ]   
+    @conditional_on(*chart_data.CHARTS[name][1])
+    def send(request):
+        image = chart_images.open_chart_image(name, image_format)
+        return FileResponse(image, content_type=chart_images.FORMATS[image_format])
 
-    labels = names
-    data = revenues
+    return send(request)
 
-    response_data = {
-        'labels': labels,
-        'data': data,
-        'chartTitle': 'Menu Item revenue Chart',
-        'legend': 'Total Quantity', 
-        'chartType': 'bar', 
-    }
+@login_required(login_url='login')
+@conditional_on(*capacity.DEPENDS_ON)
+@reads_from_replica
+def servings_available(request):
+    return JsonResponse({'menu_items': capacity.servings_available()})
 
-    return JsonResponse(data=response_data)
+@login_required(login_url='login')
+@conditional_on(*profitability.DEPENDS_ON)
+@reads_from_replica
+def menu_profitability(request):
+    return render(request, 'restaurant/menu_profitability.html', {
+        'menu_items': profitability.cached_menu_profitability(),
+    })
 
 @login_required(login_url='login')
-def inventory_chart(request):
-    labels = []
-    data = []
+@conditional_on(*profitability.DEPENDS_ON)
+@reads_from_replica
+def menu_profitability_json(request):
+    return JsonResponse({'menu_items': profitability.cached_menu_profitability()})
 
-    ingredients = Ingredient.objects.all()
-    
-    labels = [ingredient.name for ingredient in ingredients]
-    data = [ingredient.quantity for ingredient in ingredients]
-
-    response_data = {
-        'labels': labels,
-        'data': data,
-        'chartTitle': 'Inventory quantity Chart',
-        'legend': 'Total Quantity', 
-        'chartType': 'bar', 
-    }
-
-    return JsonResponse(data=response_data)
+@staff_member_required
+def chart_cache_stats(request):
+    return JsonResponse(chart_data.cache_stats())
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if not (token and constant_time_compare(authorization, f'Bearer {token}')) and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')